@@ -2,6 +2,17 @@
 
 __version__ = "0.1.0"
 
+from .api import (
+    ActiveStep,
+    ActiveStepTracker,
+    BuildResult,
+    SubBuild,
+    check_builds,
+    get_active_step,
+    get_sub_builds,
+    query_sub_builds,
+)
+from .batch import check_prs, read_pr_urls
 from .build_status import BuildStatus, get_build_status
 from .cli import check_pr, main
 from .colors import Colors, colorize, use_color
@@ -9,23 +20,37 @@ from .exceptions import (
     APIError,
     BuildbotAPIError,
     BuildbotCheckError,
+    EventStreamError,
     GiteaAPIError,
     GitHubAPIError,
     InvalidPRURLError,
 )
+from .github_api import PRStatusPoller
 
 __all__ = [
     "APIError",
+    "ActiveStep",
+    "ActiveStepTracker",
+    "BuildResult",
     "BuildStatus",
     "BuildbotAPIError",
     "BuildbotCheckError",
     "Colors",
+    "EventStreamError",
     "GitHubAPIError",
     "GiteaAPIError",
     "InvalidPRURLError",
+    "PRStatusPoller",
+    "SubBuild",
+    "check_builds",
     "check_pr",
+    "check_prs",
     "colorize",
+    "get_active_step",
     "get_build_status",
+    "get_sub_builds",
     "main",
+    "query_sub_builds",
+    "read_pr_urls",
     "use_color",
 ]
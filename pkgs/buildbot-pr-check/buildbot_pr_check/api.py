@@ -0,0 +1,436 @@
+"""Structured API for using buildbot-pr-check as a library.
+
+These functions return dataclasses instead of printing a report, so other
+tools (merge-when-green) can check builds in-process and share the HTTP
+connection pool with buildbot-pr-check. Calls made inside
+memoize_requests() share responses, and inside use_response_cache()
+finished builds are served from the on-disk cache.
+
+Everything such a tool needs is exported here, so it does not have to
+import the internal modules.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import urllib.error
+from dataclasses import dataclass, field
+
+from .build_status import BuildStatus
+from .buildbot_api import (
+    STEP_FIELDS,
+    BuildRequestStatus,
+    LogUrl,
+    api_url,
+    filter_builds_with_triggers,
+    get_build_id,
+    get_build_ids,
+    get_log_lines,
+    get_log_tail,
+    get_step_log_urls,
+    get_triggered_builds_progress,
+)
+from .cache import ResponseCache
+from .events import EventStream
+from .exceptions import (
+    BuildbotAPIError,
+    EventStreamError,
+    GitHubAPIError,
+    InvalidPRURLError,
+)
+from .github_api import PRStatusPoller
+from .http_client import fetch_json, memoize_requests, use_response_cache
+from .reporting import (
+    FAILED_STATUSES,
+    BuildStatusReport,
+    check_build_requests,
+    check_build_status,
+    flake_attribute,
+    get_display_name,
+    has_failures,
+    is_failed_status,
+)
+from .scheduler import Priority, RequestScheduler
+from .url_parser import get_pr_info
+
+__all__ = [
+    "ActiveStep",
+    "ActiveStepTracker",
+    "BuildResult",
+    "BuildStatus",
+    "BuildbotAPIError",
+    "EventStream",
+    "EventStreamError",
+    "GitHubAPIError",
+    "InvalidPRURLError",
+    "PRStatusPoller",
+    "Priority",
+    "RequestScheduler",
+    "ResponseCache",
+    "SubBuild",
+    "check_builds",
+    "get_active_step",
+    "get_build_id",
+    "get_pr_info",
+    "get_sub_builds",
+    "get_triggered_builds_progress",
+    "is_failed_status",
+    "memoize_requests",
+    "query_sub_builds",
+    "use_response_cache",
+]
+
+logger = logging.getLogger(__name__)
+
+# Log lines read from the end of a running build step's log
+ACTIVE_STEP_TAIL_LINES = 30
+# state_string is what Buildbot shows next to a running step
+ACTIVE_STEP_FIELDS = (*STEP_FIELDS, "state_string")
+
+
+@dataclass
+class ActiveStep:
+    """The step a running build is executing"""
+
+    name: str
+    state: str
+    # Last lines of the step's first log, only read for build steps
+    log_tail: list[str] = field(default_factory=list)
+    # Lines of log_tail written since an ActiveStepTracker last looked at
+    # the step; all of them the first time
+    new_lines: list[str] = field(default_factory=list)
+
+
+@dataclass
+class SubBuild:
+    """A build request triggered by a parent build"""
+
+    request_id: int
+    name: str
+    status: BuildStatus | None
+    complete: bool
+    build_id: int | None = None
+    # Logs of failed steps, for failed sub-builds
+    log_urls: list[LogUrl] = field(default_factory=list)
+    # Running step of an incomplete sub-build, if it was asked for
+    active_step: ActiveStep | None = None
+
+    @property
+    def queued(self) -> bool:
+        """Whether the request has not started a build yet"""
+        return not self.complete and self.build_id is None
+
+
+@dataclass
+class BuildResult:
+    """A parent build and the builds it triggered"""
+
+    url: str
+    parent_status: BuildStatus | None
+    sub_builds: list[SubBuild]
+    # Logs of the parent build's failed steps
+    parent_logs: list[LogUrl] = field(default_factory=list)
+    # The parent or a triggered build failed or was cancelled
+    failed: bool = False
+
+    @property
+    def complete(self) -> bool:
+        """Whether the parent and all triggered builds have finished"""
+        return self.parent_status is not None and all(
+            sub_build.complete for sub_build in self.sub_builds
+        )
+
+
+def _sub_build(request_id: int, status: BuildRequestStatus | None) -> SubBuild:
+    virtual_name = status.virtual_builder_name if status else None
+    return SubBuild(
+        request_id=request_id,
+        # Without a virtual builder, named like merge-when-green always did
+        name=flake_attribute(virtual_name) if virtual_name else f"request-{request_id}",
+        status=status.status if status else None,
+        complete=bool(status and status.complete),
+        build_id=status.build_id if status else None,
+    )
+
+
+def _build_result(url: str, report: BuildStatusReport) -> BuildResult:
+    sub_builds = [
+        SubBuild(
+            request_id=req_id,
+            name=get_display_name(report, req_id),
+            status=status,
+            complete=req_id not in report.incomplete,
+            build_id=report.build_id_map.get(req_id),
+            log_urls=report.log_urls.get(req_id, []),
+        )
+        for status, req_ids in report.statuses.items()
+        for req_id in req_ids
+    ]
+    return BuildResult(
+        url=url,
+        parent_status=report.parent_status,
+        sub_builds=sorted(sub_builds, key=lambda sub_build: sub_build.name),
+        parent_logs=report.parent_logs,
+        failed=has_failures(report),
+    )
+
+
+@dataclass
+class _FollowedStep:
+    """Running step of a build, and how far its log has been read"""
+
+    step_id: int
+    name: str
+    state: str
+    log: LogUrl | None = None
+    offset: int = 0
+    log_tail: list[str] = field(default_factory=list)
+
+    def active_step(self, new_lines: list[str]) -> ActiveStep:
+        return ActiveStep(
+            name=self.name,
+            state=self.state,
+            log_tail=list(self.log_tail),
+            new_lines=new_lines,
+        )
+
+
+def _is_build_step(name: str) -> bool:
+    return "build" in name.lower()
+
+
+class ActiveStepTracker:
+    """Follows the running steps of builds across calls.
+
+    It remembers the build ID of each build request and the running step
+    and log of each build. While a step's log keeps growing, a call only
+    reads the lines written since the last one, by offset. The steps are
+    read again once the log stops growing, or every time for steps without
+    a log, so a finished step is noticed at the cost of one more request.
+    """
+
+    def __init__(self, tail_lines: int = ACTIVE_STEP_TAIL_LINES) -> None:
+        self.tail_lines = tail_lines
+        self._lock = threading.Lock()
+        # (host, build request ID) -> build ID
+        self._build_ids: dict[tuple[str, int], int] = {}
+        # (host, build ID) -> running step
+        self._steps: dict[tuple[str, int], _FollowedStep] = {}
+
+    def known_build_ids(self, base_url: str, request_ids: list[int]) -> dict[int, int]:
+        """Build IDs of the requests that were seen with a build before."""
+        with self._lock:
+            return {
+                req_id: self._build_ids[(base_url, req_id)]
+                for req_id in request_ids
+                if (base_url, req_id) in self._build_ids
+            }
+
+    def store_build_ids(self, base_url: str, build_ids: dict[int, int]) -> None:
+        with self._lock:
+            for req_id, build_id in build_ids.items():
+                self._build_ids[(base_url, req_id)] = build_id
+
+    def forget_build_id(self, base_url: str, request_id: int) -> None:
+        """Look the build of a request up again, it may have been retried."""
+        with self._lock:
+            self._build_ids.pop((base_url, request_id), None)
+
+    def get_active_step(self, base_url: str, build_id: int) -> ActiveStep | None:
+        """Get the step a running build is executing, None if all have finished."""
+        with self._lock:
+            followed = self._steps.get((base_url, build_id))
+        if followed is not None and followed.log is not None:
+            new_lines = self._read_new_lines(base_url, followed)
+            if new_lines:
+                return followed.active_step(new_lines)
+
+        steps_url = api_url(base_url, f"builds/{build_id}/steps", ACTIVE_STEP_FIELDS)
+        try:
+            steps = fetch_json(steps_url).get("steps", [])
+        except (urllib.error.URLError, json.JSONDecodeError) as e:
+            logger.debug(f"Could not fetch the steps of build {build_id}: {e}")
+            return followed.active_step([]) if followed is not None else None
+
+        step = next((step for step in steps if not step.get("complete")), None)
+        if step is None:
+            with self._lock:
+                self._steps.pop((base_url, build_id), None)
+            return None
+
+        name = step.get("name", "")
+        state = step.get("state_string") or ""
+        step_id = step.get("stepid")
+        if (
+            followed is not None
+            and followed.step_id == step_id
+            and (followed.log is not None or not _is_build_step(name))
+        ):
+            # Still the same step, and its log (if any) was just read
+            followed.state = state
+            return followed.active_step([])
+
+        followed = _FollowedStep(step_id=step_id or 0, name=name, state=state)
+        if step_id and _is_build_step(name):
+            logs = get_step_log_urls(base_url, step_id, name)
+            if logs:
+                followed.log = logs[0]
+                try:
+                    followed.log_tail = get_log_tail(
+                        base_url, followed.log, self.tail_lines
+                    )
+                    followed.offset = followed.log.num_lines
+                except (urllib.error.URLError, json.JSONDecodeError) as e:
+                    logger.debug(f"Could not fetch the log tail of {logs[0].url}: {e}")
+                    followed.log = None
+        with self._lock:
+            self._steps[(base_url, build_id)] = followed
+        return followed.active_step(list(followed.log_tail))
+
+    def _read_new_lines(self, base_url: str, followed: _FollowedStep) -> list[str]:
+        assert followed.log is not None
+        try:
+            read, new_lines = get_log_lines(
+                base_url, followed.log, followed.offset, self.tail_lines
+            )
+        except (urllib.error.URLError, json.JSONDecodeError) as e:
+            logger.debug(f"Could not follow the log {followed.log.url}: {e}")
+            return []
+        followed.offset += read
+        followed.log_tail = (followed.log_tail + new_lines)[-self.tail_lines :]
+        return new_lines
+
+
+def get_active_step(
+    base_url: str, build_id: int, tail_lines: int = ACTIVE_STEP_TAIL_LINES
+) -> ActiveStep | None:
+    """Get the step a running build is executing, None if all have finished.
+
+    For build steps the last tail_lines lines of the step's log are read
+    too, since the state alone rarely says which derivation is building.
+    Use an ActiveStepTracker to follow builds over several calls.
+    """
+    return ActiveStepTracker(tail_lines).get_active_step(base_url, build_id)
+
+
+async def query_sub_builds(
+    scheduler: RequestScheduler,
+    base_url: str,
+    request_ids: list[int],
+    with_active_steps: bool = False,
+    tracker: ActiveStepTracker | None = None,
+) -> list[SubBuild]:
+    """Check build requests like get_sub_builds, through a shared scheduler.
+
+    Callers querying several builds at once should pass all of them the
+    same scheduler, so they share its per-host connection limit.
+    """
+    statuses = await check_build_requests(scheduler, base_url, request_ids)
+    sub_builds = [
+        _sub_build(req_id, statuses.get(req_id)) for req_id in sorted(statuses)
+    ]
+    running = [sub_build for sub_build in sub_builds if not sub_build.complete]
+    if with_active_steps and running:
+        tracker = tracker or ActiveStepTracker()
+        build_ids = tracker.known_build_ids(
+            base_url, [sub_build.request_id for sub_build in running]
+        )
+        unknown = [
+            sub_build.request_id
+            for sub_build in running
+            if sub_build.request_id not in build_ids
+        ]
+        if unknown:
+            try:
+                started_ids = await scheduler.run(
+                    base_url, Priority.STATUS, get_build_ids, base_url, unknown
+                )
+            except BuildbotAPIError as e:
+                logger.debug(f"Could not look up running builds: {e}")
+                started_ids = {}
+            tracker.store_build_ids(base_url, started_ids)
+            build_ids.update(started_ids)
+        started = []
+        for sub_build in running:
+            sub_build.build_id = build_ids.get(sub_build.request_id)
+            if sub_build.build_id is not None:
+                started.append(sub_build)
+        active_steps = await asyncio.gather(
+            *(
+                scheduler.run(
+                    base_url,
+                    Priority.LOGS,
+                    tracker.get_active_step,
+                    base_url,
+                    sub_build.build_id,
+                )
+                for sub_build in started
+            )
+        )
+        for sub_build, active_step in zip(started, active_steps, strict=True):
+            sub_build.active_step = active_step
+            if active_step is None:
+                # The build finished before its request did
+                tracker.forget_build_id(base_url, sub_build.request_id)
+    return sorted(sub_builds, key=lambda sub_build: sub_build.name)
+
+
+async def _get_sub_builds(
+    base_url: str,
+    request_ids: list[int],
+    with_active_steps: bool,
+    tracker: ActiveStepTracker | None,
+) -> list[SubBuild]:
+    async with RequestScheduler() as scheduler:
+        return await query_sub_builds(
+            scheduler, base_url, request_ids, with_active_steps, tracker
+        )
+
+
+def get_sub_builds(
+    base_url: str,
+    request_ids: list[int],
+    with_active_steps: bool = False,
+    tracker: ActiveStepTracker | None = None,
+) -> list[SubBuild]:
+    """Check build requests of a Buildbot master, sorted by name.
+
+    The requests are queried in bulk. With with_active_steps, the build ID
+    and running step of every incomplete request are looked up as well;
+    requests without a build are still queued. Passing the same tracker to
+    every call only reads what changed in the running builds since.
+    """
+    return asyncio.run(
+        _get_sub_builds(base_url, request_ids, with_active_steps, tracker)
+    )
+
+
+async def _check_builds(urls: list[str], excerpt_lines: int) -> list[BuildResult]:
+    async with RequestScheduler() as scheduler:
+        builds = await filter_builds_with_triggers(urls, scheduler)
+        reports = await asyncio.gather(
+            *(
+                check_build_status(
+                    build,
+                    scheduler,
+                    set(FAILED_STATUSES),
+                    excerpt_lines=excerpt_lines,
+                )
+                for build in builds
+            )
+        )
+    return [
+        _build_result(build.url, report)
+        for build, report in zip(builds, reports, strict=True)
+    ]
+
+
+def check_builds(urls: list[str], excerpt_lines: int = 0) -> list[BuildResult]:
+    """Check Buildbot builds and the builds they triggered.
+
+    Failed builds come with the log URLs of their failed steps, and with
+    excerpt_lines the last lines of each of those logs. URLs that are not
+    Buildbot builds, or whose steps cannot be fetched, are left out.
+    """
+    return asyncio.run(_check_builds(urls, excerpt_lines))
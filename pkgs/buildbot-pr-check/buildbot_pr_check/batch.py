@@ -0,0 +1,232 @@
+"""Batch mode for buildbot-pr-check.
+
+Checks many pull requests concurrently through one request scheduler,
+HTTP connection pool and response cache, and writes one NDJSON record per
+pull request followed by one record per triggered build.
+"""
+
+import asyncio
+import contextlib
+import json
+import sys
+import urllib.parse
+from pathlib import Path
+from typing import Any, TextIO
+
+from .build_status import BuildStatus
+from .buildbot_api import BuildWithTriggers, filter_builds_with_triggers
+from .cache import ResponseCache
+from .exceptions import BuildbotCheckError
+from .gitea_api import get_buildbot_urls_from_gitea
+from .github_api import get_buildbot_urls_from_github
+from .http_client import hedge_requests, memoize_requests, use_response_cache
+from .profiling import PHASE_DISCOVERY, profile_phase, profile_requests
+from .reporting import (
+    DEFAULT_INCLUDED_STATUSES,
+    BuildStatusReport,
+    check_build_status,
+    get_display_name,
+    has_failures,
+)
+from .scheduler import Priority, RequestScheduler
+from .url_parser import get_pr_info
+
+
+def read_pr_urls(source: str) -> list[str]:
+    """Read PR URLs, one per line, from a file or "-" for stdin.
+
+    Blank lines and lines starting with "#" are ignored.
+    """
+    if source == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        lines = Path(source).read_text().splitlines()
+    return [
+        line.strip()
+        for line in lines
+        if line.strip() and not line.strip().startswith("#")
+    ]
+
+
+def _status_name(status: BuildStatus | None) -> str | None:
+    return status.name if status is not None else None
+
+
+def _request_status_name(
+    report: BuildStatusReport, status: BuildStatus | None, req_id: int
+) -> str:
+    """Status of a build request, telling failed lookups from running builds"""
+    if status is not None:
+        return status.name
+    return "ERROR" if req_id in report.errors else "PENDING"
+
+
+def _status_counts(report: BuildStatusReport) -> dict[str, int]:
+    counts: dict[str, int] = {}
+    for status, requests in report.statuses.items():
+        for req_id in requests:
+            name = _request_status_name(report, status, req_id)
+            counts[name] = counts.get(name, 0) + 1
+    return counts
+
+
+def _pr_result(reports: list[BuildStatusReport]) -> str:
+    if any(has_failures(report) for report in reports):
+        return "failure"
+    if any(report.errors for report in reports):
+        return "error"
+    if any(report.parent_status is None or report.incomplete for report in reports):
+        return "pending"
+    return "success"
+
+
+def build_records(
+    pr_url: str,
+    builds: list[BuildWithTriggers],
+    reports: list[BuildStatusReport],
+) -> list[dict[str, Any]]:
+    """Build the NDJSON records for a checked pull request"""
+    records: list[dict[str, Any]] = [
+        {
+            "type": "pr",
+            "pr_url": pr_url,
+            "result": _pr_result(reports),
+            "exit_code": 1 if any(has_failures(r) for r in reports) else 0,
+            "builds": [
+                {
+                    "url": build.url,
+                    "parent_status": _status_name(report.parent_status),
+                    "triggered": len(build.build_requests),
+                    "statuses": _status_counts(report),
+                }
+                for build, report in zip(builds, reports, strict=True)
+            ],
+        }
+    ]
+    for build, report in zip(builds, reports, strict=True):
+        for status, requests in report.statuses.items():
+            for req_id in sorted(requests):
+                records.append(
+                    {
+                        "type": "build",
+                        "pr_url": pr_url,
+                        "parent_url": build.url,
+                        "request_id": req_id,
+                        "build_id": report.build_id_map.get(req_id),
+                        "name": get_display_name(report, req_id),
+                        "status": _request_status_name(report, status, req_id),
+                        "complete": req_id not in report.incomplete,
+                        "log_urls": [
+                            log.url for log in report.log_urls.get(req_id, [])
+                        ],
+                    }
+                )
+    return records
+
+
+async def check_pr_records(
+    pr_url: str,
+    scheduler: RequestScheduler,
+    included_statuses: set[BuildStatus],
+) -> list[dict[str, Any]]:
+    """Check one pull request and return its NDJSON records"""
+    try:
+        platform, owner, repo, pr_num = get_pr_info(pr_url)
+        with profile_phase(PHASE_DISCOVERY):
+            if platform == "github":
+                buildbot_urls = await scheduler.run(
+                    "api.github.com",
+                    Priority.STATUS,
+                    get_buildbot_urls_from_github,
+                    owner,
+                    repo,
+                    pr_num,
+                )
+            else:  # gitea
+                buildbot_urls = await scheduler.run(
+                    urllib.parse.urlsplit(pr_url).netloc,
+                    Priority.STATUS,
+                    get_buildbot_urls_from_gitea,
+                    pr_url,
+                    owner,
+                    repo,
+                    pr_num,
+                )
+        builds = await filter_builds_with_triggers(buildbot_urls, scheduler)
+        reports = list(
+            await asyncio.gather(
+                *(
+                    check_build_status(build, scheduler, included_statuses)
+                    for build in builds
+                )
+            )
+        )
+    except BuildbotCheckError as e:
+        return [
+            {
+                "type": "pr",
+                "pr_url": pr_url,
+                "result": "error",
+                "exit_code": 1,
+                "error": str(e),
+                "builds": [],
+            }
+        ]
+    return build_records(pr_url, builds, reports)
+
+
+async def _check_prs(
+    pr_urls: list[str], included_statuses: set[BuildStatus], out: TextIO
+) -> int:
+    exit_code = 0
+    async with RequestScheduler() as scheduler:
+        tasks = [
+            check_pr_records(pr_url, scheduler, included_statuses)
+            for pr_url in dict.fromkeys(pr_urls)
+        ]
+        # Write each pull request's records as soon as it has been checked
+        for task in asyncio.as_completed(tasks):
+            records = await task
+            exit_code = max(exit_code, records[0]["exit_code"])
+            out.writelines(json.dumps(record) + "\n" for record in records)
+            out.flush()
+    return exit_code
+
+
+def check_prs(
+    pr_urls: list[str],
+    included_statuses: set[BuildStatus] | None = None,
+    use_cache: bool = True,
+    profile: bool = False,
+    hedge: bool = False,
+) -> int:
+    """Check many pull requests at once, writing NDJSON records to stdout.
+
+    With profile, request timings are printed to stderr at the end. With
+    hedge, slow Buildbot and forge GETs are sent a second time.
+
+    Returns:
+        Exit code: 0 if no pull request has failed builds, 1 otherwise
+    """
+    if included_statuses is None:
+        included_statuses = set(DEFAULT_INCLUDED_STATUSES)
+
+    out = sys.stdout
+    # Keep stdout machine-readable, warnings go to stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        cache = ResponseCache.open_default() if use_cache else None
+        profiling = profile_requests() if profile else contextlib.nullcontext()
+        hedging = hedge_requests() if hedge else contextlib.nullcontext()
+        try:
+            with (
+                profiling as profiler,
+                hedging,
+                memoize_requests(),
+                use_response_cache(cache),
+            ):
+                return asyncio.run(_check_prs(pr_urls, included_statuses, out))
+        finally:
+            if cache is not None:
+                cache.close()
+            if profiler is not None:
+                profiler.print_report()
@@ -1,17 +1,55 @@
 """Buildbot API functions for buildbot-pr-check."""
 
+import asyncio
 import json
+import logging
 import re
 import urllib.error
-import urllib.request
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import urllib.parse
 from dataclasses import dataclass
 
 from .build_status import BuildStatus, get_build_status
+from .cache import is_complete
 from .exceptions import BuildbotAPIError
+from .http_client import fetch_json
+from .scheduler import Priority, RequestScheduler
+
+logger = logging.getLogger(__name__)
 
-MAX_LOG_WORKERS = 10
 FAILED_STEP_RESULT_MINIMUM = 2
+# Build request IDs per filtered collection query, keeps URLs well under 8 KiB
+BULK_QUERY_CHUNK_SIZE = 100
+# Log lines per /contents request when fetching a log excerpt
+EXCERPT_PAGE_LINES = 1000
+# Excerpt lines are cut to this many characters, nix logs can have huge lines
+MAX_EXCERPT_LINE_LENGTH = 500
+
+# Attributes selected with field= for each kind of entity; everything else
+# is left out of the responses. complete is always selected because
+# is_complete decides whether a response may be cached.
+BUILD_REQUEST_FIELDS = ("buildrequestid", "complete", "results", "properties")
+BUILD_FIELDS = ("buildid", "buildrequestid", "complete", "results")
+# urls lists the build requests a trigger step started
+STEP_FIELDS = ("stepid", "name", "complete", "results", "urls")
+LOG_FIELDS = ("logid", "name", "type", "num_lines", "complete")
+LOG_CHUNK_FIELDS = ("content",)
+# Build request properties selected with property=, instead of all of them
+BUILD_REQUEST_PROPERTIES = ("virtual_builder_name",)
+
+
+def api_url(
+    base_url: str,
+    path: str,
+    fields: tuple[str, ...],
+    params: list[tuple[str, str]] | None = None,
+) -> str:
+    """URL of a Data API endpoint that only returns the given fields"""
+    query = [*(params or []), *(("field", name) for name in fields)]
+    return f"https://{base_url}/api/v2/{path}?{urllib.parse.urlencode(query)}"
+
+
+def _request_property_params() -> list[tuple[str, str]]:
+    return [("property", name) for name in BUILD_REQUEST_PROPERTIES]
 
 
 @dataclass
@@ -22,6 +60,7 @@ class BuildRequestStatus:
     status: BuildStatus | None
     build_id: int | None
     virtual_builder_name: str | None = None
+    complete: bool = False
 
 
 @dataclass
@@ -31,6 +70,13 @@ class LogUrl:
     step_name: str
     log_name: str
     url: str
+    log_id: int | None = None
+    num_lines: int = 0
+    # Buildbot log type: "s" (stdio stream), "t" (text) or "h" (html)
+    log_type: str = "s"
+    complete: bool = False
+    # The last lines of the log, if an excerpt was requested
+    excerpt: list[str] | None = None
 
 
 @dataclass
@@ -46,16 +92,28 @@ class BuildWithTriggers:
 
 def get_triggered_builds(base_url: str, builder_id: str, build_num: str) -> list[int]:
     """Get all triggered builds from a parent build"""
+    request_ids, _ = get_triggered_builds_progress(base_url, builder_id, build_num)
+    return request_ids
+
+
+def get_triggered_builds_progress(
+    base_url: str, builder_id: str, build_num: str
+) -> tuple[list[int], bool]:
+    """Get the triggered builds of a parent build and whether triggering is done.
+
+    Triggering is done once every step that triggered builds has finished;
+    after that the list of build requests cannot grow anymore.
+    """
     # Get build steps
-    api_url = (
-        f"https://{base_url}/api/v2/builders/{builder_id}/builds/{build_num}/steps"
+    steps_url = api_url(
+        base_url, f"builders/{builder_id}/builds/{build_num}/steps", STEP_FIELDS
     )
 
     build_requests = []
+    trigger_steps_complete = []
 
     try:
-        with urllib.request.urlopen(api_url) as response:
-            data = json.loads(response.read())
+        data = fetch_json(steps_url)
     except (urllib.error.URLError, urllib.error.HTTPError) as e:
         raise BuildbotAPIError(f"Failed to fetch build steps from Buildbot: {e}")
     except json.JSONDecodeError as e:
@@ -64,250 +122,517 @@ def get_triggered_builds(base_url: str, builder_id: str, build_num: str) -> list
     for step in data.get("steps", []):
         if step.get("name") == "build flake" or "build" in step.get("name", "").lower():
             # Extract build request IDs from URLs
+            step_requests = []
             for url_info in step.get("urls", []):
                 url = url_info.get("url", "")
                 if "buildrequests" in url:
                     match = re.search(r"buildrequests/(\d+)", url)
                     if match:
-                        build_requests.append(int(match.group(1)))
+                        step_requests.append(int(match.group(1)))
+            if step_requests:
+                build_requests.extend(step_requests)
+                trigger_steps_complete.append(bool(step.get("complete")))
 
-    return sorted(build_requests)
+    done = bool(trigger_steps_complete) and all(trigger_steps_complete)
+    return sorted(build_requests), done
 
 
 def check_build_request_status(base_url: str, request_id: int) -> BuildRequestStatus:
     """Check the status of a build request and return build ID"""
-    api_url = f"https://{base_url}/api/v2/buildrequests/{request_id}?property=*"
+    request_url = api_url(
+        base_url,
+        f"buildrequests/{request_id}",
+        BUILD_REQUEST_FIELDS,
+        _request_property_params(),
+    )
 
     try:
-        with urllib.request.urlopen(api_url) as response:
-            data = json.loads(response.read())
-            request = data["buildrequests"][0]
-            result = request.get("results")
-            status = get_build_status(result)
-
-            # Get virtual_builder_name from properties
-            virtual_builder_name = None
-            properties = request.get("properties", {})
-            if properties and "virtual_builder_name" in properties:
-                virtual_builder_name = properties["virtual_builder_name"][0]
-
-            # Get build ID from the builds endpoint
-            build_id = None
-            if request.get("complete"):
-                builds_url = (
-                    f"https://{base_url}/api/v2/buildrequests/{request_id}/builds"
-                )
-                try:
-                    with urllib.request.urlopen(builds_url) as builds_response:
-                        builds_data = json.loads(builds_response.read())
-                        if builds_data.get("builds"):
-                            build_id = builds_data["builds"][0].get("buildid")
-                except (
-                    urllib.error.URLError,
-                    urllib.error.HTTPError,
-                    json.JSONDecodeError,
-                ):
-                    pass
-
-            return BuildRequestStatus(
-                request_id=request_id,
-                status=status,
-                build_id=build_id,
-                virtual_builder_name=virtual_builder_name,
+        data = fetch_json(request_url, immutable=is_complete)
+        request = data["buildrequests"][0]
+        result = request.get("results")
+        status = get_build_status(result)
+
+        virtual_builder_name = _get_virtual_builder_name(request)
+
+        # Get build ID from the builds endpoint
+        build_id = None
+        if request.get("complete"):
+            builds_url = api_url(
+                base_url, f"buildrequests/{request_id}/builds", BUILD_FIELDS
             )
+            try:
+                builds_data = fetch_json(builds_url, immutable=is_complete)
+                if builds_data.get("builds"):
+                    build_id = builds_data["builds"][0].get("buildid")
+            except (
+                urllib.error.URLError,
+                urllib.error.HTTPError,
+                json.JSONDecodeError,
+            ):
+                pass
+
+        return BuildRequestStatus(
+            request_id=request_id,
+            status=status,
+            build_id=build_id,
+            virtual_builder_name=virtual_builder_name,
+            complete=bool(request.get("complete")),
+        )
     except (
         urllib.error.URLError,
         urllib.error.HTTPError,
         json.JSONDecodeError,
         KeyError,
-    ):
+    ) as e:
+        # Transient errors were already retried by the HTTP client
+        logger.debug(f"Could not check build request {request_id}: {e}")
         return BuildRequestStatus(request_id=request_id, status=None, build_id=None)
 
 
+def _get_virtual_builder_name(request: dict) -> str | None:
+    """Get virtual_builder_name from build request properties"""
+    properties = request.get("properties", {})
+    if properties and "virtual_builder_name" in properties:
+        return properties["virtual_builder_name"][0]
+    return None
+
+
+def _bulk_query(
+    base_url: str, collection: str, request_ids: list[int], cacheable: bool = True
+) -> list[dict]:
+    """Fetch the entries of a collection filtered to a set of build request IDs.
+
+    With cacheable, the response is cached once every entry is complete.
+    Raises BuildbotAPIError if an entry belongs to a build request that was
+    not asked for, i.e. the master ignored the buildrequestid__in filter.
+    """
+    params = [("buildrequestid__in", str(request_id)) for request_id in request_ids]
+    if collection == "buildrequests":
+        params += _request_property_params()
+        fields = BUILD_REQUEST_FIELDS
+    else:
+        params.append(("order", "buildid"))
+        fields = BUILD_FIELDS
+    entries = fetch_json(
+        api_url(base_url, collection, fields, params),
+        immutable=is_complete if cacheable else None,
+    )[collection]
+    requested = set(request_ids)
+    if any(entry["buildrequestid"] not in requested for entry in entries):
+        raise BuildbotAPIError(
+            f"Buildbot ignored the buildrequestid__in filter on {collection}"
+        )
+    return entries
+
+
+def chunk_request_ids(request_ids: list[int]) -> list[list[int]]:
+    """Split build request IDs into sorted, de-duplicated bulk query chunks"""
+    unique_ids = sorted(set(request_ids))
+    return [
+        unique_ids[start : start + BULK_QUERY_CHUNK_SIZE]
+        for start in range(0, len(unique_ids), BULK_QUERY_CHUNK_SIZE)
+    ]
+
+
+def get_build_request_statuses(
+    base_url: str, request_ids: list[int]
+) -> dict[int, BuildRequestStatus]:
+    """Check many build requests with filtered collection queries.
+
+    Fetches the build requests and the builds of the completed ones in
+    chunks of BULK_QUERY_CHUNK_SIZE, so the number of round trips does not
+    grow with every triggered build. Produces the same results as calling
+    check_build_request_status for each ID.
+    """
+    statuses: dict[int, BuildRequestStatus] = {}
+
+    for chunk in chunk_request_ids(request_ids):
+        try:
+            requests = {
+                request["buildrequestid"]: request
+                for request in _bulk_query(base_url, "buildrequests", chunk)
+            }
+
+            completed = [rid for rid in chunk if requests.get(rid, {}).get("complete")]
+            build_ids: dict[int, int | None] = {}
+            if completed:
+                for build in _bulk_query(base_url, "builds", completed):
+                    # Keep the first build of a request, like /buildrequests/{id}/builds
+                    build_ids.setdefault(build["buildrequestid"], build.get("buildid"))
+        except (urllib.error.URLError, urllib.error.HTTPError) as e:
+            raise BuildbotAPIError(f"Failed to query build requests from Buildbot: {e}")
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            raise BuildbotAPIError(f"Failed to parse Buildbot API response: {e}")
+
+        for request_id in chunk:
+            request = requests.get(request_id)
+            if request is None:
+                statuses[request_id] = BuildRequestStatus(
+                    request_id=request_id, status=None, build_id=None
+                )
+                continue
+            statuses[request_id] = BuildRequestStatus(
+                request_id=request_id,
+                status=get_build_status(request.get("results")),
+                build_id=build_ids.get(request_id),
+                virtual_builder_name=_get_virtual_builder_name(request),
+                complete=bool(request.get("complete")),
+            )
+
+    return statuses
+
+
+def get_build_ids(base_url: str, request_ids: list[int]) -> dict[int, int]:
+    """Get the build ID of each running build request's running build.
+
+    A running request can still start another build, e.g. after one that
+    finished with RETRY, so finished builds are left out and the response
+    is never cached.
+    """
+    build_ids: dict[int, int] = {}
+    for chunk in chunk_request_ids(request_ids):
+        try:
+            for build in _bulk_query(base_url, "builds", chunk, cacheable=False):
+                if not build.get("complete"):
+                    build_ids[build["buildrequestid"]] = build["buildid"]
+        except (urllib.error.URLError, urllib.error.HTTPError) as e:
+            raise BuildbotAPIError(f"Failed to query builds from Buildbot: {e}")
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            raise BuildbotAPIError(f"Failed to parse Buildbot API response: {e}")
+    return build_ids
+
+
+def is_failed_step(step: dict) -> bool:
+    """Check whether a build step finished with FAILURE or worse"""
+    results = step.get("results")
+    return results is not None and results >= FAILED_STEP_RESULT_MINIMUM
+
+
 def get_step_log_urls(base_url: str, step_id: int, step_name: str) -> list[LogUrl]:
     """Get log URLs for a specific step."""
     log_urls = []
-    logs_url = f"https://{base_url}/api/v2/steps/{step_id}/logs"
+    logs_url = api_url(base_url, f"steps/{step_id}/logs", LOG_FIELDS)
 
     try:
-        with urllib.request.urlopen(logs_url) as log_response:
-            log_data = json.loads(log_response.read())
-
-            for log in log_data.get("logs", []):
-                log_id = log.get("logid")
-                if log_id:
-                    raw_log_url = f"https://{base_url}/api/v2/logs/{log_id}/raw_inline"
-                    log_urls.append(
-                        LogUrl(
-                            step_name=step_name,
-                            log_name=log.get("name", "stdio"),
-                            url=raw_log_url,
-                        )
+        log_data = fetch_json(logs_url, immutable=is_complete)
+
+        for log in log_data.get("logs", []):
+            log_id = log.get("logid")
+            if log_id:
+                raw_log_url = f"https://{base_url}/api/v2/logs/{log_id}/raw_inline"
+                log_urls.append(
+                    LogUrl(
+                        step_name=step_name,
+                        log_name=log.get("name", "stdio"),
+                        url=raw_log_url,
+                        log_id=log_id,
+                        num_lines=log.get("num_lines") or 0,
+                        log_type=log.get("type") or "s",
+                        complete=bool(log.get("complete")),
                     )
+                )
     except (urllib.error.URLError, urllib.error.HTTPError, json.JSONDecodeError):
         pass
 
     return log_urls
 
 
-def get_build_log_urls(base_url: str, build_id: int) -> list[LogUrl]:
-    """Get log URLs for a build"""
+def get_build_steps(base_url: str, build_id: int) -> list[dict]:
+    """Get the steps of a finished build"""
+    steps_url = api_url(base_url, f"builds/{build_id}/steps", STEP_FIELDS)
+    try:
+        data = fetch_json(steps_url, immutable=is_complete)
+    except (urllib.error.URLError, urllib.error.HTTPError, json.JSONDecodeError):
+        return []
+    return data.get("steps", [])
+
+
+async def get_build_log_urls(
+    scheduler: RequestScheduler, base_url: str, build_id: int | None
+) -> list[LogUrl]:
+    """Get log URLs of a build's failed steps, fetching them concurrently"""
     if build_id is None:
         return []
 
-    log_urls = []
+    steps = await scheduler.run(
+        base_url, Priority.LOGS, get_build_steps, base_url, build_id
+    )
+    # Only failed steps have logs worth reading, like for the parent build
+    step_refs = [
+        (step["stepid"], step.get("name", "Unknown step"))
+        for step in steps
+        if step.get("stepid") and is_failed_step(step)
+    ]
+    results = await asyncio.gather(
+        *(
+            scheduler.run(
+                base_url, Priority.LOGS, get_step_log_urls, base_url, step_id, name
+            )
+            for step_id, name in step_refs
+        ),
+        return_exceptions=True,
+    )
 
-    try:
-        # Get build steps
-        steps_url = f"https://{base_url}/api/v2/builds/{build_id}/steps"
-        with urllib.request.urlopen(steps_url) as response:
-            data = json.loads(response.read())
-            steps = data.get("steps", [])
-
-            if not steps:
-                return []
-
-            # Use ThreadPoolExecutor for parallel log fetching
-            max_workers = min(MAX_LOG_WORKERS, max(1, len(steps)))
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                # Submit all step log requests to the thread pool
-                future_to_step = {}
-                for step in steps:
-                    step_id = step.get("stepid")
-                    if step_id:
-                        step_name = step.get("name", "Unknown step")
-                        future = executor.submit(
-                            get_step_log_urls, base_url, step_id, step_name
-                        )
-                        future_to_step[future] = (step_id, step_name)
+    log_urls: list[LogUrl] = []
+    for (step_id, step_name), result in zip(step_refs, results, strict=True):
+        if isinstance(result, BaseException):
+            # Keep other step logs when one lookup fails unexpectedly.
+            logger.warning(
+                f"Error getting logs for step {step_name} (ID: {step_id}): {result}"
+            )
+            continue
+        log_urls.extend(result)
 
-                # Collect results as they complete
-                for future in as_completed(future_to_step):
-                    try:
-                        step_logs = future.result()
-                        log_urls.extend(step_logs)
-                    except Exception as error:  # noqa: BLE001
-                        # Keep other step logs when one worker fails unexpectedly.
-                        step_id, step_name = future_to_step[future]
-                        print(
-                            f"Error getting logs for step {step_name} (ID: {step_id}): {error}"
-                        )
+    return log_urls
 
-    except (urllib.error.URLError, urllib.error.HTTPError, json.JSONDecodeError):
+
+def get_log_tail(base_url: str, log: LogUrl, lines: int) -> list[str]:
+    """Get the last lines of a log without downloading all of it.
+
+    Reads only the tail through the paged /logs/{id}/contents endpoint, at
+    most EXCERPT_PAGE_LINES lines per request, so memory use is bounded by
+    the number of lines asked for rather than the size of the log.
+    """
+    if log.log_id is None or lines <= 0 or log.num_lines <= 0:
         return []
 
-    return log_urls
+    tail: list[str] = []
+    offset = max(0, log.num_lines - lines)
+    while offset < log.num_lines:
+        limit = min(EXCERPT_PAGE_LINES, log.num_lines - offset)
+        contents_url = api_url(
+            base_url,
+            f"logs/{log.log_id}/contents",
+            LOG_CHUNK_FIELDS,
+            [("offset", str(offset)), ("limit", str(limit))],
+        )
+        # Lines of a finished log never change
+        data = fetch_json(contents_url, immutable=lambda _: log.complete)
+        chunks = data.get("logchunks", [])
+        if not chunks:
+            break
+        tail.extend(_chunk_lines(log, chunks))
+        offset += limit
+    return tail[-lines:]
+
+
+def _chunk_lines(log: LogUrl, chunks: list[dict]) -> list[str]:
+    lines = []
+    for chunk in chunks:
+        for line in chunk.get("content", "").splitlines():
+            if log.log_type == "s":
+                # Stream logs prefix every line with its stream (o/e/h)
+                line = line[1:]
+            lines.append(line[:MAX_EXCERPT_LINE_LENGTH])
+    return lines
+
+
+def get_log_lines(
+    base_url: str, log: LogUrl, offset: int, lines: int
+) -> tuple[int, list[str]]:
+    """Read a log from line offset up to what has been written so far.
+
+    Pages of EXCERPT_PAGE_LINES lines are read until one comes back short,
+    so a running log can be followed by passing the number of lines already
+    read. Returns the number of lines read and the last `lines` of them.
+    """
+    if log.log_id is None:
+        return 0, []
+
+    read = 0
+    tail: list[str] = []
+    while True:
+        contents_url = api_url(
+            base_url,
+            f"logs/{log.log_id}/contents",
+            LOG_CHUNK_FIELDS,
+            [("offset", str(offset + read)), ("limit", str(EXCERPT_PAGE_LINES))],
+        )
+        # Not cached, the log is still being written
+        data = fetch_json(contents_url)
+        page = _chunk_lines(log, data.get("logchunks", []))
+        read += len(page)
+        tail = (tail + page)[-lines:] if lines > 0 else []
+        if len(page) < EXCERPT_PAGE_LINES:
+            return read, tail
+
+
+async def fetch_log_excerpts(
+    scheduler: RequestScheduler, base_url: str, logs: list[LogUrl], lines: int
+) -> None:
+    """Fetch the last lines of each log concurrently into LogUrl.excerpt"""
+    if lines <= 0:
+        return
+    results = await asyncio.gather(
+        *(
+            scheduler.run(base_url, Priority.LOGS, get_log_tail, base_url, log, lines)
+            for log in logs
+        ),
+        return_exceptions=True,
+    )
+    for log, result in zip(logs, results, strict=True):
+        if isinstance(result, (urllib.error.URLError, json.JSONDecodeError)):
+            logger.debug(f"Could not fetch excerpt of {log.url}: {result}")
+            continue
+        if isinstance(result, BaseException):
+            raise result
+        log.excerpt = result
+
+
+def get_build_id(base_url: str, builder_id: str, build_num: str) -> int:
+    """Get the ID of a build given by builder and build number"""
+    build_url = api_url(
+        base_url, f"builders/{builder_id}/builds/{build_num}", BUILD_FIELDS
+    )
+    try:
+        data = fetch_json(build_url, immutable=is_complete)
+        return int(data["builds"][0]["buildid"])
+    except (urllib.error.URLError, urllib.error.HTTPError) as e:
+        raise BuildbotAPIError(f"Failed to fetch build from Buildbot: {e}")
+    except (json.JSONDecodeError, KeyError, IndexError, TypeError, ValueError) as e:
+        raise BuildbotAPIError(f"Failed to parse Buildbot API response: {e}")
 
 
 def get_parent_build_status(
-    base_url: str, builder_id: str, build_num: str
+    base_url: str, builder_id: str, build_num: str, with_logs: bool = True
 ) -> tuple[BuildStatus | None, list[LogUrl]]:
-    """Get parent build status and logs from failed steps."""
+    """Get parent build status and, with_logs, the logs of failed steps."""
     try:
         # Get build data
-        build_url = (
-            f"https://{base_url}/api/v2/builders/{builder_id}/builds/{build_num}"
+        build_url = api_url(
+            base_url, f"builders/{builder_id}/builds/{build_num}", BUILD_FIELDS
         )
-        with urllib.request.urlopen(build_url) as response:
-            data = json.loads(response.read())
-            build = data["builds"][0]
-
-            # Check if build failed
-            results = build.get("results")
-            if results is None:
-                return None, []  # Build still in progress
-
-            status = get_build_status(results)
-
-            # If failed, get logs from failed steps
-            log_urls = []
-            if status in [
-                BuildStatus.FAILURE,
-                BuildStatus.EXCEPTION,
-                BuildStatus.CANCELLED,
-            ]:
-                steps_url = f"https://{base_url}/api/v2/builders/{builder_id}/builds/{build_num}/steps"
-                with urllib.request.urlopen(steps_url) as steps_response:
-                    steps_data = json.loads(steps_response.read())
-
-                    for step in steps_data.get("steps", []):
-                        # Check if step failed
-                        step_results = step.get("results")
-                        if step_results and step_results >= FAILED_STEP_RESULT_MINIMUM:
-                            step_id = step.get("stepid")
-                            if step_id:
-                                step_logs = get_step_log_urls(
-                                    base_url, step_id, step.get("name", "Unknown step")
-                                )
-                                log_urls.extend(step_logs)
-
-            return status, log_urls
+        data = fetch_json(build_url, immutable=is_complete)
+        build = data["builds"][0]
+
+        # Check if build failed
+        results = build.get("results")
+        if results is None:
+            return None, []  # Build still in progress
+
+        status = get_build_status(results)
+
+        # If failed, get logs from failed steps
+        log_urls = []
+        if with_logs and status in [
+            BuildStatus.FAILURE,
+            BuildStatus.EXCEPTION,
+            BuildStatus.CANCELLED,
+        ]:
+            # Same URL as get_triggered_builds, so it is memoized
+            steps_url = api_url(
+                base_url,
+                f"builders/{builder_id}/builds/{build_num}/steps",
+                STEP_FIELDS,
+            )
+            # The build is finished, so its step list can no longer grow
+            steps_data = fetch_json(steps_url, immutable=is_complete)
+
+            for step in steps_data.get("steps", []):
+                if is_failed_step(step):
+                    step_id = step.get("stepid")
+                    if step_id:
+                        step_logs = get_step_log_urls(
+                            base_url, step_id, step.get("name", "Unknown step")
+                        )
+                        log_urls.extend(step_logs)
+
+        return status, log_urls
 
     except (urllib.error.URLError, urllib.error.HTTPError, json.JSONDecodeError) as e:
-        print(f"Warning: Could not fetch parent build status: {e}")
+        logger.warning(f"Could not fetch parent build status: {e}")
         return None, []
 
 
 def get_build_names(base_url: str, builder_id: str, build_num: str) -> dict[int, str]:
-    """Get mapping of request IDs to build names"""
-    api_url = (
+    """Get mapping of request IDs to build names.
+
+    Downloads all properties of the parent build, since the names come from
+    property keys; only needed for build requests without a
+    virtual_builder_name.
+    """
+    # No property= filter: the relevant keys are not known in advance
+    properties_url = (
         f"https://{base_url}/api/v2/builders/{builder_id}/builds/{build_num}/properties"
     )
 
     request_to_name = {}
 
     try:
-        with urllib.request.urlopen(api_url) as response:
-            data = json.loads(response.read())
-            props = data["properties"][0]
-
-            # Extract all nixos systems in order
-            systems = []
-            for key in sorted(props.keys()):
-                if ".nixos-" in key and "-drv_path" in key:
-                    system_name = key.split(".nixos-")[1].split("-drv_path")[0]
-                    arch = key.split(".")[0]
-                    systems.append(f"{arch}.nixos-{system_name}")
-
-            # Map to request IDs (assuming they start from the first triggered request)
-            if systems:
-                # We need to find the starting request ID
-                build_requests = get_triggered_builds(base_url, builder_id, build_num)
-                if build_requests:
-                    start_id = min(build_requests)
-                    for i, system in enumerate(systems):
-                        request_to_name[start_id + i] = system
+        data = fetch_json(properties_url)
+        props = data["properties"][0]
+
+        # Extract all nixos systems in order
+        systems = []
+        for key in sorted(props.keys()):
+            if ".nixos-" in key and "-drv_path" in key:
+                system_name = key.split(".nixos-")[1].split("-drv_path")[0]
+                arch = key.split(".")[0]
+                systems.append(f"{arch}.nixos-{system_name}")
+
+        # Map to request IDs (assuming they start from the first triggered request)
+        if systems:
+            # We need to find the starting request ID
+            build_requests = get_triggered_builds(base_url, builder_id, build_num)
+            if build_requests:
+                start_id = min(build_requests)
+                for i, system in enumerate(systems):
+                    request_to_name[start_id + i] = system
     except (urllib.error.URLError, urllib.error.HTTPError, json.JSONDecodeError):
         pass
 
     return request_to_name
 
 
-def filter_builds_with_triggers(buildbot_urls: list[str]) -> list[BuildWithTriggers]:
+async def filter_builds_with_triggers(
+    buildbot_urls: list[str], scheduler: RequestScheduler
+) -> list[BuildWithTriggers]:
     """Filter buildbot URLs to only include those with triggered sub-builds."""
     from .url_parser import extract_build_info
 
-    builds_with_triggers = []
-
+    # (url, base_url, builder_id, build_num) for every parseable buildbot URL
+    targets: list[tuple[str, str, str, str]] = []
     for url in buildbot_urls:
         build_info = extract_build_info(url)
         if build_info.base_url and build_info.builder_id and build_info.build_num:
-            try:
-                build_requests = get_triggered_builds(
-                    build_info.base_url, build_info.builder_id, build_info.build_num
-                )
-                # Include builds even without triggered builds so we can check parent build status
-                builds_with_triggers.append(
-                    BuildWithTriggers(
-                        url=url,
-                        base_url=build_info.base_url,
-                        builder_id=build_info.builder_id,
-                        build_num=build_info.build_num,
-                        build_requests=build_requests,
-                    )
-                )
-            except BuildbotAPIError as e:
-                print(f"Warning: Could not fetch triggered builds for {url}: {e}")
-                continue
+            targets.append(
+                (url, build_info.base_url, build_info.builder_id, build_info.build_num)
+            )
+
+    # Look up the triggered builds of all parent builds concurrently
+    results = await asyncio.gather(
+        *(
+            scheduler.run(
+                base_url,
+                Priority.STATUS,
+                get_triggered_builds,
+                base_url,
+                builder_id,
+                build_num,
+            )
+            for _, base_url, builder_id, build_num in targets
+        ),
+        return_exceptions=True,
+    )
+
+    builds_with_triggers = []
+    for (url, base_url, builder_id, build_num), result in zip(
+        targets, results, strict=True
+    ):
+        if isinstance(result, BuildbotAPIError):
+            logger.warning(f"Could not fetch triggered builds for {url}: {result}")
+            continue
+        if isinstance(result, BaseException):
+            raise result
+        # Include builds even without triggered builds so we can check parent build status
+        builds_with_triggers.append(
+            BuildWithTriggers(
+                url=url,
+                base_url=base_url,
+                builder_id=builder_id,
+                build_num=build_num,
+                build_requests=result,
+            )
+        )
 
     return builds_with_triggers
@@ -0,0 +1,266 @@
+"""Persistent on-disk cache for API responses.
+
+Build requests, builds, steps and logs never change once they are
+complete, so their responses are stored permanently (until evicted) in a
+SQLite database under the XDG cache directory. Anything still running is
+never stored and is fetched again on every run.
+
+Responses that can change (GitHub's) are stored together with their ETag
+so they can be revalidated with a conditional request.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from types import TracebackType
+from typing import Any, Self
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILE_NAME = "responses.sqlite3"
+# Size of the stored (compressed) bodies before least recently used ones go
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+# Evict down to this fraction of the limit, so eviction doesn't run every time
+EVICTION_TARGET_RATIO = 0.9
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    url TEXT PRIMARY KEY,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+CREATE TABLE IF NOT EXISTS revalidated (
+    url TEXT PRIMARY KEY,
+    etag TEXT NOT NULL,
+    body BLOB NOT NULL,
+    link TEXT,
+    size INTEGER NOT NULL,
+    accessed REAL NOT NULL
+);
+"""
+
+
+def default_cache_dir() -> Path:
+    """Get the cache directory, following the XDG base directory spec."""
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    base = Path(cache_home) if cache_home else Path.home() / ".cache"
+    return base / "buildbot-pr-check"
+
+
+def is_complete(data: Any) -> bool:
+    """Check that every entity in a Buildbot API response is complete.
+
+    Buildbot responses look like ``{"builds": [...], "meta": {...}}``; this
+    requires at least one entity and ``complete`` to be true on all of them.
+    """
+    if not isinstance(data, dict):
+        return False
+    entities = [
+        entity
+        for key, value in data.items()
+        if key != "meta" and isinstance(value, list)
+        for entity in value
+    ]
+    return bool(entities) and all(
+        isinstance(entity, dict) and entity.get("complete") is True
+        for entity in entities
+    )
+
+
+class ResponseCache:
+    """SQLite-backed store of decoded JSON responses keyed by URL.
+
+    Reads go straight to the database; writes and access times are kept in
+    memory and written in a single transaction by flush() (and close()),
+    so a run holds no write lock while it is fetching.
+    """
+
+    def __init__(self, path: Path, max_bytes: int = MAX_CACHE_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.stored = 0
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._pending: dict[str, bytes] = {}
+        self._accessed: dict[str, float] = {}
+        self._pending_validated: dict[str, tuple[str, bytes, str | None]] = {}
+        self._accessed_validated: dict[str, float] = {}
+        # URLs read from or put into the cache by this process
+        self._known: set[str] = set()
+
+    @classmethod
+    def open_default(cls) -> "ResponseCache | None":
+        """Open the cache in the XDG cache directory, or None if unusable."""
+        path = default_cache_dir() / CACHE_FILE_NAME
+        try:
+            return cls(path)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Response cache disabled, could not open {path}: {e}")
+            return None
+
+    def get(self, url: str) -> Any | None:
+        """Get a cached response, or None if the URL is not cached."""
+        with self._lock:
+            body = self._pending.get(url)
+            if body is None:
+                try:
+                    row = self._db.execute(
+                        "SELECT body FROM responses WHERE url = ?", (url,)
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    logger.debug(f"Response cache read failed for {url}: {e}")
+                    return None
+                if row is None:
+                    return None
+                body = row[0]
+            self._accessed[url] = time.time()
+            self._known.add(url)
+            self.hits += 1
+        return json.loads(zlib.decompress(body))
+
+    def put(self, url: str, data: Any) -> None:
+        """Store the response for an immutable URL."""
+        with self._lock:
+            if url in self._known:
+                return
+            self._known.add(url)
+        body = zlib.compress(json.dumps(data, separators=(",", ":")).encode())
+        with self._lock:
+            self._pending[url] = body
+            self._accessed[url] = time.time()
+            self.stored += 1
+
+    def get_validated(self, url: str) -> tuple[str, Any, str | None] | None:
+        """Get the ETag, response and Link header stored for a URL to revalidate."""
+        with self._lock:
+            pending = self._pending_validated.get(url)
+            if pending is None:
+                try:
+                    row = self._db.execute(
+                        "SELECT etag, body, link FROM revalidated WHERE url = ?",
+                        (url,),
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    logger.debug(f"Response cache read failed for {url}: {e}")
+                    return None
+                if row is None:
+                    return None
+                pending = row
+            self._accessed_validated[url] = time.time()
+        etag, body, link = pending
+        return etag, json.loads(zlib.decompress(body)), link
+
+    def put_validated(
+        self, url: str, etag: str, data: Any, link: str | None = None
+    ) -> None:
+        """Store a response with the ETag to revalidate it with later.
+
+        link is the response's Link header, which paginated responses need
+        to find their next page when they are served from the cache.
+        """
+        body = zlib.compress(json.dumps(data, separators=(",", ":")).encode())
+        with self._lock:
+            self._pending_validated[url] = (etag, body, link)
+            self._accessed_validated[url] = time.time()
+
+    def flush(self) -> None:
+        """Write pending responses and access times, then evict if too large."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            accessed, self._accessed = self._accessed, {}
+            validated, self._pending_validated = self._pending_validated, {}
+            accessed_validated, self._accessed_validated = (
+                self._accessed_validated,
+                {},
+            )
+            if not (pending or accessed or validated or accessed_validated):
+                return
+            try:
+                with self._db:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO responses (url, body, size, accessed)"
+                        " VALUES (?, ?, ?, ?)",
+                        [
+                            (url, body, len(body), accessed.get(url, time.time()))
+                            for url, body in pending.items()
+                        ],
+                    )
+                    self._db.executemany(
+                        "UPDATE responses SET accessed = ? WHERE url = ?",
+                        [
+                            (when, url)
+                            for url, when in accessed.items()
+                            if url not in pending
+                        ],
+                    )
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO revalidated"
+                        " (url, etag, body, link, size, accessed)"
+                        " VALUES (?, ?, ?, ?, ?, ?)",
+                        [
+                            (url, etag, body, link, len(body), accessed_validated[url])
+                            for url, (etag, body, link) in validated.items()
+                        ],
+                    )
+                    self._db.executemany(
+                        "UPDATE revalidated SET accessed = ? WHERE url = ?",
+                        [
+                            (when, url)
+                            for url, when in accessed_validated.items()
+                            if url not in validated
+                        ],
+                    )
+                    self._evict()
+            except sqlite3.Error as e:
+                logger.debug(f"Response cache write failed: {e}")
+
+    def _evict(self) -> None:
+        """Drop least recently used responses while over the size limit."""
+        (total,) = self._db.execute(
+            "SELECT (SELECT COALESCE(SUM(size), 0) FROM responses)"
+            " + (SELECT COALESCE(SUM(size), 0) FROM revalidated)"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * EVICTION_TARGET_RATIO)
+        doomed: dict[str, list[tuple[str]]] = {"responses": [], "revalidated": []}
+        for table, url, size, _ in self._db.execute(
+            "SELECT 'responses', url, size, accessed FROM responses"
+            " UNION ALL SELECT 'revalidated', url, size, accessed FROM revalidated"
+            " ORDER BY accessed"
+        ):
+            if total <= target:
+                break
+            doomed[table].append((url,))
+            total -= size
+        for table, urls in doomed.items():
+            # Table names come from the fixed set above, never from input
+            self._db.executemany(f"DELETE FROM {table} WHERE url = ?", urls)
+        evicted = sum(len(urls) for urls in doomed.values())
+        logger.debug(f"Evicted {evicted} responses from the response cache")
+
+    def close(self) -> None:
+        """Flush pending writes and close the database."""
+        self.flush()
+        self._db.close()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
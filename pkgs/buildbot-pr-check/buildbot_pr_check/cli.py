@@ -1,19 +1,42 @@
 """Command-line interface for buildbot-pr-check."""
 
 import argparse
+import asyncio
+import contextlib
 import logging
 import sys
-import urllib.request
 
+from .batch import check_prs, read_pr_urls
 from .build_status import BuildStatus
-from .buildbot_api import filter_builds_with_triggers, get_parent_build_status
+from .buildbot_api import BuildWithTriggers, filter_builds_with_triggers
+from .cache import ResponseCache
 from .colors import Colors, colorize
 from .exceptions import BuildbotCheckError
 from .git import get_current_branch_pr_url
 from .gitea_api import get_buildbot_urls_from_gitea
 from .github_api import get_buildbot_urls_from_github
-from .reporting import check_build_status, print_build_report
+from .http_client import (
+    RequestMemo,
+    hedge_requests,
+    memoize_requests,
+    use_response_cache,
+)
+from .profiling import PHASE_DISCOVERY, format_bytes, profile_phase, profile_requests
+from .reporting import (
+    DEFAULT_INCLUDED_STATUSES,
+    BuildStatusReport,
+    check_build_status,
+    find_first_failure,
+    has_failures,
+    print_build_header,
+    print_build_report,
+    print_first_failure,
+    print_request_result,
+    print_triggered_count,
+)
+from .scheduler import RequestScheduler
 from .url_parser import get_pr_info
+from .watch import watch_builds
 
 logger = logging.getLogger(__name__)
 
@@ -38,16 +61,69 @@ def parse_included_statuses(value: str) -> set[BuildStatus]:
     return statuses
 
 
-def check_pr(pr_url: str, included_statuses: set[BuildStatus] | None = None) -> int:
+def check_pr(
+    pr_url: str,
+    included_statuses: set[BuildStatus] | None = None,
+    use_cache: bool = True,
+    watch: bool = False,
+    stream: bool = False,
+    profile: bool = False,
+    excerpt_lines: int = 0,
+    group_failures: bool = False,
+    use_events: bool = True,
+    hedge: bool = False,
+    fail_fast: bool = False,
+) -> int:
     """Check buildbot status for a pull request.
 
     Args:
         pr_url: The GitHub or Gitea pull request URL
         included_statuses: Set of statuses to include in detailed output
+        use_cache: Serve completed builds from the on-disk response cache
+        watch: Keep polling until all triggered builds have finished
+        stream: Print each failed build as soon as it is known
+        profile: Print per-endpoint request timings and per-phase wall time
+        excerpt_lines: Show this many lines from the end of each failed step's log
+        group_failures: Group failed builds by the first failing derivation
+        use_events: Watch through Buildbot's websocket events instead of polling
+        hedge: Send a second GET when a response takes longer than the host's p95
+        fail_fast: Stop at the first failed parent build or triggered build
 
     Returns:
         Exit code: 0 for success, 1 for failure/canceled builds
     """
+    profiling = profile_requests() if profile else contextlib.nullcontext()
+    hedging = hedge_requests() if hedge else contextlib.nullcontext()
+    with profiling as profiler, hedging:
+        exit_code = _check_pr(
+            pr_url,
+            included_statuses,
+            use_cache,
+            watch,
+            stream,
+            excerpt_lines,
+            group_failures,
+            use_events,
+            fail_fast,
+            profile,
+        )
+    if profiler is not None:
+        profiler.print_report()
+    return exit_code
+
+
+def _check_pr(
+    pr_url: str,
+    included_statuses: set[BuildStatus] | None,
+    use_cache: bool,
+    watch: bool,
+    stream: bool,
+    excerpt_lines: int,
+    group_failures: bool,
+    use_events: bool,
+    fail_fast: bool,
+    profile: bool = False,
+) -> int:
     try:
         platform, owner, repo, pr_num = get_pr_info(pr_url)
         print(
@@ -55,27 +131,82 @@ def check_pr(pr_url: str, included_statuses: set[BuildStatus] | None = None) ->
         )
         print("═" * 80)
 
-        # Get buildbot URLs from PR
-        if platform == "github":
-            buildbot_urls = get_buildbot_urls_from_github(owner, repo, pr_num)
-        else:  # gitea
-            buildbot_urls = get_buildbot_urls_from_gitea(pr_url, owner, repo, pr_num)
-
-        if not buildbot_urls:
-            print("No buildbot builds found for this PR")
-            print("\nTrying to find builds manually...")
-            print("Please check the PR page for buildbot links in:")
-            print("  - Check runs")
-            print("  - Status checks")
-            print("  - PR comments")
-            sys.exit(0)
+        # Share responses across the whole run so repeated lookups are free;
+        # GitHub responses are revalidated against their cached ETags
+        cache = ResponseCache.open_default() if use_cache else None
+        try:
+            with use_response_cache(cache):
+                with profile_phase(PHASE_DISCOVERY):
+                    if platform == "github":
+                        buildbot_urls = get_buildbot_urls_from_github(
+                            owner, repo, pr_num
+                        )
+                    else:  # gitea
+                        buildbot_urls = get_buildbot_urls_from_gitea(
+                            pr_url, owner, repo, pr_num
+                        )
+
+                if not buildbot_urls:
+                    print("No buildbot builds found for this PR")
+                    print("\nTrying to find builds manually...")
+                    print("Please check the PR page for buildbot links in:")
+                    print("  - Check runs")
+                    print("  - Status checks")
+                    print("  - PR comments")
+                    return 0
+
+                print(
+                    f"Found {colorize(str(len(buildbot_urls)), Colors.BOLD)} buildbot build(s)"
+                )
+
+                with memoize_requests() as memo:
+                    exit_code = asyncio.run(
+                        _check_builds(
+                            buildbot_urls,
+                            included_statuses,
+                            watch,
+                            stream,
+                            excerpt_lines,
+                            group_failures,
+                            use_events,
+                            fail_fast,
+                        )
+                    )
+        finally:
+            if cache is not None:
+                cache.close()
+        if profile:
+            _print_request_stats(memo, cache)
+        # No build triggered sub-builds, there is nothing to fail
+        return 0 if exit_code is None else exit_code
+
+    except BuildbotCheckError as e:
+        print(f"Error: {e}")
+        return 1
 
-        print(
-            f"Found {colorize(str(len(buildbot_urls)), Colors.BOLD)} buildbot build(s)"
-        )
 
+async def _check_builds(
+    buildbot_urls: list[str],
+    included_statuses: set[BuildStatus] | None,
+    watch: bool = False,
+    stream: bool = False,
+    excerpt_lines: int = 0,
+    group_failures: bool = False,
+    use_events: bool = True,
+    fail_fast: bool = False,
+) -> int | None:
+    """Check all builds of a PR through one shared request scheduler.
+
+    Returns None when no build has triggered sub-builds.
+    """
+    if included_statuses is None:
+        included_statuses = set(DEFAULT_INCLUDED_STATUSES)
+
+    async with RequestScheduler() as scheduler:
         # Filter out builds without triggered builds
-        builds_with_triggers = filter_builds_with_triggers(buildbot_urls)
+        builds_with_triggers = await filter_builds_with_triggers(
+            buildbot_urls, scheduler
+        )
 
         if not builds_with_triggers:
             print(
@@ -84,48 +215,121 @@ def check_pr(pr_url: str, included_statuses: set[BuildStatus] | None = None) ->
             print(
                 "All CI statuses appear to be for builds without triggered sub-builds"
             )
-            sys.exit(0)
+            return None
 
         print(
             f"\nFound {colorize(str(len(builds_with_triggers)), Colors.BOLD)} build(s) with triggered sub-builds"
         )
 
-        # Process each build
-        exit_code = 0
-        for build in builds_with_triggers:
-            report = check_build_status(build)
-            print_build_report(build, report, included_statuses)
-
-            # Check parent build status for exit code
-            parent_status, _ = get_parent_build_status(
-                build.base_url, build.builder_id, build.build_num
+        if fail_fast:
+            return await _fail_fast_builds(
+                builds_with_triggers, scheduler, included_statuses
+            )
+        if stream:
+            reports = await _stream_builds(
+                builds_with_triggers, scheduler, included_statuses, excerpt_lines
+            )
+        else:
+            # Check all builds concurrently, but report them in order
+            tasks = [
+                asyncio.create_task(
+                    check_build_status(
+                        build,
+                        scheduler,
+                        included_statuses,
+                        excerpt_lines=excerpt_lines,
+                        group_by_root_cause=group_failures,
+                    )
+                )
+                for build in builds_with_triggers
+            ]
+            reports = []
+            for build, task in zip(builds_with_triggers, tasks, strict=True):
+                report = await task
+                print_build_report(
+                    build, report, included_statuses, grouped=group_failures
+                )
+                reports.append(report)
+
+        if watch:
+            await watch_builds(
+                builds_with_triggers,
+                reports,
+                scheduler,
+                included_statuses,
+                excerpt_lines=excerpt_lines,
+                use_events=use_events,
             )
-            if parent_status in [
-                BuildStatus.FAILURE,
-                BuildStatus.EXCEPTION,
-                BuildStatus.CANCELLED,
-            ]:
-                exit_code = 1
-
-            # Set exit code to 1 if there are any failures or cancellations
-            if (
-                BuildStatus.FAILURE in report.statuses
-                or BuildStatus.CANCELLED in report.statuses
-            ):
-                exit_code = 1
-
-        return exit_code
-
-    except BuildbotCheckError as e:
-        print(f"Error: {e}")
-        return 1
-
 
-def _install_url_opener() -> None:
-    """Set a User-Agent so Cloudflare doesn't block urllib requests."""
-    opener = urllib.request.build_opener()
-    opener.addheaders = [("User-Agent", "buildbot-pr-check/0.1")]
-    urllib.request.install_opener(opener)
+        return 1 if any(has_failures(report) for report in reports) else 0
+
+
+async def _stream_builds(
+    builds: list[BuildWithTriggers],
+    scheduler: RequestScheduler,
+    included_statuses: set[BuildStatus],
+    excerpt_lines: int = 0,
+) -> list[BuildStatusReport]:
+    """Check builds one at a time, printing failures as soon as they resolve."""
+    reports = []
+    for build in builds:
+        print_build_header(build)
+        print_triggered_count(build)
+        print()
+        report = await check_build_status(
+            build,
+            scheduler,
+            included_statuses,
+            on_failure=print_request_result,
+            excerpt_lines=excerpt_lines,
+        )
+        print_build_report(build, report, included_statuses, streamed=True)
+        reports.append(report)
+    return reports
+
+
+async def _fail_fast_builds(
+    builds: list[BuildWithTriggers],
+    scheduler: RequestScheduler,
+    included_statuses: set[BuildStatus],
+) -> int:
+    """Check builds until the first failure and report what is known by then."""
+    reports = [
+        BuildStatusReport(
+            statuses={}, build_id_map={}, name_map={}, virtual_builder_map={}
+        )
+        for _ in builds
+    ]
+    failure = await find_first_failure(builds, reports, scheduler)
+    for build, report in zip(builds, reports, strict=True):
+        print_build_report(build, report, included_statuses)
+    if failure is None:
+        return 0
+    checked = sum(
+        len(req_ids) for report in reports for req_ids in report.statuses.values()
+    )
+    total = sum(len(build.build_requests) for build in builds)
+    failed_report = reports[builds.index(failure.build)]
+    print_first_failure(failure, failed_report, checked, total)
+    return 1
+
+
+def _print_request_stats(memo: RequestMemo, cache: ResponseCache | None) -> None:
+    """Print how many Buildbot API requests the memo and cache saved."""
+    if not memo.fetched:
+        return
+    logger.debug(
+        f"Received {format_bytes(memo.received_bytes)} in {memo.received} "
+        "Buildbot API responses"
+    )
+    cache_hits = cache.hits if cache is not None else 0
+    saved = memo.saved + cache_hits
+    print(
+        f"\n{colorize('♻️  Saved', Colors.CYAN)} {colorize(str(saved), Colors.BOLD)} "
+        f"of {memo.fetched + memo.saved} Buildbot API requests "
+        f"({memo.reused} reused, {memo.coalesced} coalesced in flight, "
+        f"{cache_hits} from disk cache)"
+    )
 
 
 def main() -> None:
@@ -138,6 +342,11 @@ Examples:
   Gitea:  buildbot-pr-check https://git.clan.lol/clan/clan-core/pulls/4210
   Auto:   buildbot-pr-check  # Uses current branch
   Show skipped: buildbot-pr-check --include SKIPPED,SUCCESS
+  Wait for CI:  buildbot-pr-check --watch
+  Log tails:    buildbot-pr-check --excerpt 20
+  Root causes:  buildbot-pr-check --group-failures --excerpt 20
+  Many PRs:     buildbot-pr-check <pr-url> <pr-url> ...  # NDJSON output
+  From a list:  gh pr list --json url --jq '.[].url' | buildbot-pr-check --from-file -
 
 Optional: Set GITHUB_TOKEN environment variable for API rate limits
         """,
@@ -145,22 +354,117 @@ Optional: Set GITHUB_TOKEN environment variable for API rate limits
     )
 
     parser.add_argument(
-        "pr_url",
-        nargs="?",
+        "pr_urls",
+        nargs="*",
+        metavar="pr_url",
         help="Pull request URL (GitHub or Gitea). If not provided, will try to detect PR for current branch",
     )
 
+    parser.add_argument(
+        "--from-file",
+        metavar="FILE",
+        help="Read pull request URLs from FILE, one per line ('-' for stdin)",
+    )
+
+    parser.add_argument(
+        "--ndjson",
+        action="store_true",
+        help="Print one JSON record per pull request and triggered build (implied for several PRs)",
+    )
+
     parser.add_argument(
         "--include",
         type=parse_included_statuses,
         help=f"Comma-separated list of statuses to show details for. Default: FAILURE,CANCELLED. Valid values: {', '.join(status.name for status in BuildStatus)}",
     )
 
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep polling until all triggered builds finish, printing only state changes",
+    )
+
+    parser.add_argument(
+        "--poll",
+        action="store_true",
+        help="With --watch, poll the REST API instead of following Buildbot's websocket events",
+    )
+
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Print each failed build as soon as it is known, and the summary at the end",
+    )
+
+    parser.add_argument(
+        "--excerpt",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Show the last N lines of each failed step's log",
+    )
+
+    parser.add_argument(
+        "--group-failures",
+        action="store_true",
+        help="Group failed builds by the first failing derivation in their logs and show one log per group",
+    )
+
+    parser.add_argument(
+        "--fail-fast",
+        action="store_true",
+        help="Exit 1 as soon as the parent build or any triggered build has failed, without fetching logs",
+    )
+
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not read or write the on-disk cache of completed build responses",
+    )
+
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="Send a second request when a response takes longer than 95%% of recent ones",
+    )
+
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print request counts and latency per API endpoint and wall time per phase",
+    )
+
     parser.add_argument("--debug", action="store_true", help="Enable debug logging")
 
     args = parser.parse_args()
 
-    _install_url_opener()
+    pr_urls = list(args.pr_urls)
+    if args.from_file:
+        try:
+            pr_urls.extend(read_pr_urls(args.from_file))
+        except OSError as e:
+            parser.error(f"could not read {args.from_file}: {e}")
+    batch = args.ndjson or args.from_file is not None or len(pr_urls) > 1
+    if batch and (
+        args.watch
+        or args.stream
+        or args.excerpt
+        or args.group_failures
+        or args.fail_fast
+    ):
+        parser.error(
+            "--watch, --stream, --excerpt, --group-failures and --fail-fast only work with a single PR"
+        )
+    if args.stream and args.group_failures:
+        parser.error("--group-failures cannot be combined with --stream")
+    if args.fail_fast and (
+        args.watch or args.stream or args.excerpt or args.group_failures
+    ):
+        parser.error(
+            "--fail-fast cannot be combined with --watch, --stream, --excerpt or --group-failures"
+        )
+    if args.excerpt < 0:
+        parser.error("--excerpt must not be negative")
 
     # Configure logging
     if args.debug:
@@ -168,8 +472,21 @@ Optional: Set GITHUB_TOKEN environment variable for API rate limits
     else:
         logging.basicConfig(level=logging.WARNING, format="%(levelname)s: %(message)s")
 
+    if batch:
+        if not pr_urls:
+            parser.error("no pull request URLs given")
+        sys.exit(
+            check_prs(
+                pr_urls,
+                args.include,
+                use_cache=not args.no_cache,
+                profile=args.profile,
+                hedge=args.hedge,
+            )
+        )
+
     # Get PR URL
-    pr_url = args.pr_url
+    pr_url = pr_urls[0] if pr_urls else None
     if pr_url is None:
         pr_url = get_current_branch_pr_url()
         if not pr_url:
@@ -184,7 +501,23 @@ Optional: Set GITHUB_TOKEN environment variable for API rate limits
             sys.exit(1)
         print(f"Auto-detected PR: {pr_url}")
 
-    exit_code = check_pr(pr_url, args.include)
+    try:
+        exit_code = check_pr(
+            pr_url,
+            args.include,
+            use_cache=not args.no_cache,
+            watch=args.watch,
+            stream=args.stream,
+            profile=args.profile,
+            excerpt_lines=args.excerpt,
+            group_failures=args.group_failures,
+            use_events=not args.poll,
+            hedge=args.hedge,
+            fail_fast=args.fail_fast,
+        )
+    except KeyboardInterrupt:
+        print("\nInterrupted")
+        sys.exit(130)
     sys.exit(exit_code)
 
 
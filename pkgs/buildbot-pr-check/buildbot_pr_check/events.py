@@ -0,0 +1,321 @@
+"""Buildbot data events over its /ws websocket.
+
+Buildbot pushes a message for every change of its data (a build request
+completing, a build finishing, a step adding URLs) to websocket clients
+that subscribed to a matching path. EventStream is a minimal RFC 6455
+client for that endpoint, so watchers can wait for events instead of
+polling every incomplete build request.
+
+A subscription path has one segment per routing key segment, ``*``
+matching any single segment: ``buildrequests/*/complete`` delivers
+``buildrequests/1234/complete`` with the build request as its data.
+"""
+
+import asyncio
+import base64
+import collections
+import hashlib
+import json
+import logging
+import os
+import ssl
+import struct
+import urllib.parse
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from types import TracebackType
+from typing import Any, Self
+
+from .exceptions import EventStreamError
+from .http_client import USER_AGENT
+
+logger = logging.getLogger(__name__)
+
+EVENT_CONNECT_TIMEOUT = 10.0
+# Largest message accepted from the server
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+
+_WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+_OP_CONTINUATION = 0x0
+_OP_TEXT = 0x1
+_OP_CLOSE = 0x8
+_OP_PING = 0x9
+_OP_PONG = 0xA
+
+Streams = tuple[asyncio.StreamReader, asyncio.StreamWriter]
+# Opens the connection to a Buildbot host ("host" or "host:port")
+Connector = Callable[[str], Awaitable[Streams]]
+
+
+@dataclass
+class Event:
+    """A Buildbot data event"""
+
+    key: tuple[str, ...]
+    data: dict[str, Any]
+
+
+async def _open_tls_connection(base_url: str) -> Streams:
+    parsed = urllib.parse.urlsplit(f"https://{base_url}")
+    host = parsed.hostname or base_url
+    return await asyncio.open_connection(
+        host, parsed.port or 443, ssl=ssl.create_default_context()
+    )
+
+
+# Tests point this at a local stand-in, like the shared HTTP client
+_connector: Connector = _open_tls_connection
+
+
+def set_connector(connector: Connector | None) -> None:
+    """Open event streams with connector, or over TLS again if None."""
+    global _connector
+    _connector = connector or _open_tls_connection
+
+
+def _apply_mask(data: bytes, mask: bytes) -> bytes:
+    repeated = (mask * (len(data) // 4 + 1))[: len(data)]
+    masked = int.from_bytes(data, "big") ^ int.from_bytes(repeated, "big")
+    return masked.to_bytes(len(data), "big")
+
+
+class EventStream:
+    """Subscription to the data events of one Buildbot master.
+
+    A background task reads the socket; events are queued until
+    next_event() or drain() picks them up, and command replies resolve the
+    command that is waiting for them.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ):
+        self.base_url = base_url
+        self._reader = reader
+        self._writer = writer
+        self._next_id = 0
+        self._replies: dict[int, asyncio.Future[dict[str, Any]]] = {}
+        self._events: collections.deque[Event] = collections.deque()
+        self._wakeup = asyncio.Event()
+        self._error: EventStreamError | None = None
+        self._read_task: asyncio.Task[None] | None = None
+
+    @classmethod
+    async def connect(
+        cls, base_url: str, timeout: float = EVENT_CONNECT_TIMEOUT
+    ) -> Self:
+        """Open the websocket of a Buildbot master.
+
+        Raises EventStreamError if it cannot be reached or does not speak
+        websocket (e.g. because a proxy in front of it doesn't).
+        """
+        try:
+            reader, writer = await asyncio.wait_for(_connector(base_url), timeout)
+        except (OSError, TimeoutError) as e:
+            raise EventStreamError(f"Could not connect to {base_url}/ws: {e}") from e
+        stream = cls(base_url, reader, writer)
+        try:
+            await asyncio.wait_for(stream._handshake(), timeout)
+        except (OSError, TimeoutError, EOFError, ValueError) as e:
+            stream._writer.close()
+            raise EventStreamError(
+                f"Websocket handshake with {base_url} failed: {e}"
+            ) from e
+        except EventStreamError:
+            stream._writer.close()
+            raise
+        stream._read_task = asyncio.create_task(stream._read_loop())
+        logger.debug(f"Opened the event stream of {base_url}")
+        return stream
+
+    async def _handshake(self) -> None:
+        key = base64.b64encode(os.urandom(16)).decode()
+        request = (
+            "GET /ws HTTP/1.1\r\n"
+            f"Host: {self.base_url}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\n"
+            "Sec-WebSocket-Version: 13\r\n"
+            f"User-Agent: {USER_AGENT}\r\n"
+            "\r\n"
+        )
+        self._writer.write(request.encode())
+        await self._writer.drain()
+
+        status_line = (await self._reader.readline()).decode("latin-1")
+        headers: dict[str, str] = {}
+        while True:
+            line = (await self._reader.readline()).decode("latin-1")
+            if line in ("\r\n", "\n", ""):
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        parts = status_line.split(maxsplit=2)
+        if len(parts) < 2 or parts[1] != "101":
+            raise EventStreamError(
+                f"{self.base_url}/ws answered {status_line.strip() or 'nothing'}"
+            )
+        expected = base64.b64encode(
+            hashlib.sha1((key + _WEBSOCKET_GUID).encode()).digest()
+        ).decode()
+        if headers.get("sec-websocket-accept") != expected:
+            raise EventStreamError(f"{self.base_url}/ws sent a bad accept key")
+
+    async def _send_frame(self, opcode: int, payload: bytes) -> None:
+        # Client frames are always final and masked
+        header = bytearray([0x80 | opcode])
+        length = len(payload)
+        if length < 126:
+            header.append(0x80 | length)
+        elif length < 1 << 16:
+            header.append(0x80 | 126)
+            header += struct.pack("!H", length)
+        else:
+            header.append(0x80 | 127)
+            header += struct.pack("!Q", length)
+        mask = os.urandom(4)
+        self._writer.write(bytes(header) + mask + _apply_mask(payload, mask))
+        await self._writer.drain()
+
+    async def _read_frame(self) -> tuple[bool, int, bytes]:
+        first, second = await self._reader.readexactly(2)
+        length = second & 0x7F
+        if length == 126:
+            (length,) = struct.unpack("!H", await self._reader.readexactly(2))
+        elif length == 127:
+            (length,) = struct.unpack("!Q", await self._reader.readexactly(8))
+        if length > MAX_MESSAGE_BYTES:
+            raise EventStreamError(f"Event message of {length} bytes is too large")
+        mask = await self._reader.readexactly(4) if second & 0x80 else None
+        payload = await self._reader.readexactly(length)
+        if mask is not None:
+            payload = _apply_mask(payload, mask)
+        return bool(first & 0x80), first & 0x0F, payload
+
+    async def _read_message(self) -> Any:
+        fragments: list[bytes] = []
+        while True:
+            final, opcode, payload = await self._read_frame()
+            if opcode == _OP_PING:
+                await self._send_frame(_OP_PONG, payload)
+                continue
+            if opcode == _OP_PONG:
+                continue
+            if opcode == _OP_CLOSE:
+                raise EventStreamError(f"{self.base_url} closed the event stream")
+            if opcode not in (_OP_TEXT, _OP_CONTINUATION):
+                raise EventStreamError(f"Unexpected websocket opcode {opcode}")
+            fragments.append(payload)
+            if final:
+                return json.loads(b"".join(fragments))
+
+    async def _read_loop(self) -> None:
+        try:
+            while True:
+                message = await self._read_message()
+                if not isinstance(message, dict):
+                    continue
+                reply = self._replies.pop(message.get("_id", -1), None)
+                if reply is not None:
+                    if not reply.done():
+                        reply.set_result(message)
+                elif isinstance(message.get("k"), str):
+                    data = message.get("m")
+                    self._events.append(
+                        Event(
+                            tuple(message["k"].split("/")),
+                            data if isinstance(data, dict) else {},
+                        )
+                    )
+                    self._wakeup.set()
+        except EventStreamError as e:
+            self._fail(e)
+        except (OSError, EOFError, ValueError) as e:
+            self._fail(EventStreamError(f"Event stream of {self.base_url} failed: {e}"))
+
+    def _fail(self, error: EventStreamError) -> None:
+        logger.debug(str(error))
+        self._error = error
+        for reply in self._replies.values():
+            if not reply.done():
+                reply.set_exception(error)
+        self._replies.clear()
+        self._wakeup.set()
+
+    async def _command(self, cmd: str, **args: str) -> dict[str, Any]:
+        if self._error is not None:
+            raise self._error
+        self._next_id += 1
+        reply: asyncio.Future[dict[str, Any]] = (
+            asyncio.get_running_loop().create_future()
+        )
+        self._replies[self._next_id] = reply
+        message = {"cmd": cmd, "_id": self._next_id, **args}
+        try:
+            await self._send_frame(_OP_TEXT, json.dumps(message).encode())
+            result = await asyncio.wait_for(reply, EVENT_CONNECT_TIMEOUT)
+        except (OSError, TimeoutError) as e:
+            raise EventStreamError(f"{cmd} on {self.base_url} failed: {e}") from e
+        if result.get("code") != 200:
+            raise EventStreamError(
+                f"{self.base_url} refused {cmd} {args}: {result.get('msg')}"
+            )
+        return result
+
+    async def subscribe(self, path: str) -> None:
+        """Receive the events whose routing key matches path."""
+        await self._command("startConsuming", path=path)
+
+    async def ping(self) -> None:
+        """Check that the server still answers."""
+        await self._command("ping")
+
+    def drain(self) -> list[Event]:
+        """Take the events received so far, without waiting."""
+        events = list(self._events)
+        self._events.clear()
+        self._wakeup.clear()
+        return events
+
+    async def next_event(self) -> Event:
+        """Wait for the next event.
+
+        Raises EventStreamError once the stream has failed and every event
+        received before that has been taken.
+        """
+        while not self._events:
+            if self._error is not None:
+                raise self._error
+            await self._wakeup.wait()
+            self._wakeup.clear()
+        return self._events.popleft()
+
+    async def close(self) -> None:
+        """Stop reading and close the connection."""
+        if self._read_task is not None:
+            self._read_task.cancel()
+            try:
+                await self._read_task
+            except asyncio.CancelledError:
+                pass
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except OSError:
+            pass
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        await self.close()
@@ -23,3 +23,7 @@ class GitHubAPIError(APIError):
 
 class GiteaAPIError(APIError):
     """Raised when Gitea API calls fail"""
+
+
+class EventStreamError(BuildbotAPIError):
+    """Raised when Buildbot's event websocket fails or is unavailable"""
@@ -3,8 +3,8 @@
 import json
 import re
 import urllib.error
-import urllib.request
 
+from .http_client import fetch_json
 from .url_parser import is_safe_url
 
 
@@ -19,44 +19,36 @@ def get_buildbot_urls_from_gitea(
 
     base_url = match.group(1)
     api_url = f"{base_url}/api/v1/repos/{owner}/{repo}/pulls/{pr_num}"
+    headers = {"Accept": "application/json"}
 
     buildbot_urls = []
 
     try:
-        req = urllib.request.Request(api_url)
-        req.add_header("Accept", "application/json")
-
-        with urllib.request.urlopen(req) as response:
-            pr_data = json.loads(response.read())
-            head_sha = pr_data.get("head", {}).get("sha", "")
-
-            if head_sha:
-                # Get commit status
-                status_url = (
-                    f"{base_url}/api/v1/repos/{owner}/{repo}/statuses/{head_sha}"
-                )
-                req = urllib.request.Request(status_url)
-                req.add_header("Accept", "application/json")
-
-                try:
-                    with urllib.request.urlopen(req) as status_response:
-                        statuses = json.loads(status_response.read())
-
-                        for status in statuses:
-                            if "buildbot" in status.get("context", "").lower():
-                                target_url = status.get("target_url", "")
-                                if (
-                                    target_url
-                                    and "buildbot" in target_url
-                                    and is_safe_url(target_url)
-                                ):
-                                    buildbot_urls.append(target_url)
-                except (
-                    urllib.error.URLError,
-                    urllib.error.HTTPError,
-                    json.JSONDecodeError,
-                ):
-                    pass
+        pr_data = fetch_json(api_url, headers=headers)
+        head_sha = pr_data.get("head", {}).get("sha", "")
+
+        if head_sha:
+            # Get commit status
+            status_url = f"{base_url}/api/v1/repos/{owner}/{repo}/statuses/{head_sha}"
+
+            try:
+                statuses = fetch_json(status_url, headers=headers)
+
+                for status in statuses:
+                    if "buildbot" in status.get("context", "").lower():
+                        target_url = status.get("target_url", "")
+                        if (
+                            target_url
+                            and "buildbot" in target_url
+                            and is_safe_url(target_url)
+                        ):
+                            buildbot_urls.append(target_url)
+            except (
+                urllib.error.URLError,
+                urllib.error.HTTPError,
+                json.JSONDecodeError,
+            ):
+                pass
     except (urllib.error.URLError, urllib.error.HTTPError, json.JSONDecodeError):
         pass
 
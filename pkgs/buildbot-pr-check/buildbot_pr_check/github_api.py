@@ -1,17 +1,103 @@
 """GitHub API functions for buildbot-pr-check."""
 
+import email.utils
+import functools
 import json
 import logging
 import os
+import re
 import subprocess
+import threading
+import time
 import urllib.error
-import urllib.request
+from collections.abc import Iterator
+from dataclasses import dataclass
+from typing import Any
 
+from .cache import ResponseCache
 from .exceptions import GitHubAPIError
+from .http_client import Response, get_client, get_response_cache, use_response_cache
+from .profiling import record_retry
 from .url_parser import is_safe_url
 
 logger = logging.getLogger(__name__)
 
+GITHUB_API_URL = "https://api.github.com"
+GITHUB_GRAPHQL_URL = f"{GITHUB_API_URL}/graphql"
+# Check runs and status contexts per GraphQL page (the API maximum)
+GRAPHQL_PAGE_SIZE = 100
+
+# Below this many remaining requests, spread the rest out until the reset
+RATE_LIMIT_RESERVE = 100
+# Longest we wait for a rate limit before giving up
+MAX_RATE_LIMIT_WAIT = 300.0
+# Retries after a secondary rate limit (403/429 with Retry-After)
+MAX_RATE_LIMIT_RETRIES = 3
+# Wait used for secondary rate limits that don't say how long to wait
+SECONDARY_RATE_LIMIT_WAIT = 60.0
+
+_NEXT_LINK_RE = re.compile(r'<([^>]+)>;\s*rel="next"')
+
+# Head commit check runs and status contexts of a PR, in one connection
+_CHECK_CONTEXTS_QUERY = """
+query($owner: String!, $repo: String!, $number: Int!, $pageSize: Int!, $cursor: String) {
+  repository(owner: $owner, name: $repo) {
+    pullRequest(number: $number) {
+      commits(last: 1) {
+        nodes {
+          commit {
+            statusCheckRollup {
+              contexts(first: $pageSize, after: $cursor) {
+                pageInfo { hasNextPage endCursor }
+                nodes {
+                  __typename
+                  ... on CheckRun { name detailsUrl checkSuite { app { name } } }
+                  ... on StatusContext { context targetUrl }
+                }
+              }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+
+# Merge state and head commit checks of a PR, with the fields of
+# `gh pr view --json state,mergeable,autoMergeRequest,statusCheckRollup,url`
+_PR_STATUS_QUERY = """
+query($owner: String!, $repo: String!, $number: Int!, $pageSize: Int!, $cursor: String) {
+  repository(owner: $owner, name: $repo) {
+    pullRequest(number: $number) {
+      state
+      mergeable
+      url
+      autoMergeRequest { enabledAt mergeMethod }
+      commits(last: 1) {
+        nodes {
+          commit {
+            statusCheckRollup {
+              contexts(first: $pageSize, after: $cursor) {
+                pageInfo { hasNextPage endCursor }
+                nodes {
+                  __typename
+                  ... on CheckRun {
+                    name status conclusion detailsUrl startedAt completedAt
+                  }
+                  ... on StatusContext { context state targetUrl startedAt: createdAt }
+                }
+              }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
 
 def get_github_token() -> str | None:
     """Get GitHub token from gh CLI or environment"""
@@ -20,7 +106,12 @@ def get_github_token() -> str | None:
     if github_token:
         return github_token
 
-    # Try to get token from gh CLI
+    return _get_gh_cli_token()
+
+
+@functools.cache
+def _get_gh_cli_token() -> str | None:
+    """Get the token from gh CLI, running it at most once per process"""
     try:
         result = subprocess.run(
             ["gh", "auth", "token"], capture_output=True, text=True, check=True
@@ -38,43 +129,411 @@ def get_github_token() -> str | None:
     return None
 
 
+@dataclass
+class RateLimit:
+    """Rate limit state of one GitHub API resource (core, graphql, ...)"""
+
+    limit: int | None = None
+    remaining: int | None = None
+    reset: float | None = None
+
+    def update(self, headers: Any) -> None:
+        """Update from X-RateLimit-* response headers."""
+        try:
+            if headers.get("X-RateLimit-Limit") is not None:
+                self.limit = int(headers["X-RateLimit-Limit"])
+            if headers.get("X-RateLimit-Remaining") is not None:
+                self.remaining = int(headers["X-RateLimit-Remaining"])
+            if headers.get("X-RateLimit-Reset") is not None:
+                self.reset = float(headers["X-RateLimit-Reset"])
+        except ValueError as e:
+            logger.debug(f"Ignoring malformed GitHub rate limit headers: {e}")
+
+    def delay(self, now: float) -> float:
+        """Seconds to wait before the next request to stay within the quota."""
+        if self.remaining is None or self.reset is None:
+            return 0.0
+        until_reset = max(0.0, self.reset - now)
+        if self.remaining <= 0:
+            return until_reset
+        if self.remaining < RATE_LIMIT_RESERVE:
+            # Spread what is left evenly over the rest of the window
+            return until_reset / self.remaining
+        return 0.0
+
+
+def _retry_after(error: urllib.error.HTTPError, now: float) -> float | None:
+    """Seconds to wait before retrying a rate limited request, or None."""
+    if error.code not in (403, 429):
+        return None
+    retry_after = error.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            when = email.utils.parsedate_to_datetime(retry_after)
+            return max(0.0, when.timestamp() - now)
+    if error.headers.get("X-RateLimit-Remaining") == "0":
+        reset = error.headers.get("X-RateLimit-Reset")
+        return max(0.0, float(reset) - now) if reset else SECONDARY_RATE_LIMIT_WAIT
+    if error.code == 429:
+        return SECONDARY_RATE_LIMIT_WAIT
+    return None
+
+
+class GitHubClient:
+    """GitHub API client that conserves the token's rate limit.
+
+    GET responses are stored with their ETag and Link header in the response
+    cache and revalidated with If-None-Match; 304 responses don't count
+    against the rate limit. X-RateLimit-* headers are tracked per resource and requests
+    are slowed down before the quota runs out.
+    """
+
+    def __init__(self) -> None:
+        self.rate_limits: dict[str, RateLimit] = {}
+        self.not_modified = 0
+        self._lock = threading.Lock()
+
+    def _headers(self, resource: str) -> dict[str, str]:
+        headers = {"Accept": "application/vnd.github.v3+json"}
+        github_token = get_github_token()
+        if github_token:
+            scheme = "bearer" if resource == "graphql" else "token"
+            headers["Authorization"] = f"{scheme} {github_token}"
+        return headers
+
+    def _wait_for_quota(self, resource: str) -> None:
+        with self._lock:
+            rate_limit = self.rate_limits.get(resource)
+            delay = rate_limit.delay(time.time()) if rate_limit else 0.0
+        if delay > MAX_RATE_LIMIT_WAIT:
+            raise GitHubAPIError(
+                f"GitHub {resource} rate limit exhausted, resets in {delay:.0f}s"
+            )
+        if delay >= 1:
+            logger.warning(f"Waiting {delay:.0f}s to stay within the GitHub rate limit")
+        if delay > 0:
+            time.sleep(delay)
+
+    def _track(self, resource: str, headers: Any) -> None:
+        with self._lock:
+            self.rate_limits.setdefault(resource, RateLimit()).update(headers)
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str] | None = None,
+        body: bytes | None = None,
+        idempotent: bool | None = None,
+    ) -> Response:
+        """Send a request, waiting out rate limits and revalidating GETs."""
+        resource = "graphql" if url == GITHUB_GRAPHQL_URL else "core"
+        request_headers = self._headers(resource)
+        if headers:
+            request_headers.update(headers)
+
+        cache = get_response_cache() if method == "GET" else None
+        stored = cache.get_validated(url) if cache is not None else None
+        if stored is not None:
+            request_headers["If-None-Match"] = stored[0]
+
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            self._wait_for_quota(resource)
+            try:
+                response = get_client().request(
+                    method, url, request_headers, body, idempotent
+                )
+            except urllib.error.HTTPError as e:
+                self._track(resource, e.headers)
+                wait = _retry_after(e, time.time())
+                if wait is None or attempt == MAX_RATE_LIMIT_RETRIES:
+                    raise
+                if wait > MAX_RATE_LIMIT_WAIT:
+                    raise GitHubAPIError(
+                        f"GitHub rate limit exceeded, retry in {wait:.0f}s"
+                    ) from e
+                logger.warning(f"GitHub rate limit hit, retrying in {wait:.0f}s")
+                record_retry(url)
+                time.sleep(wait)
+                continue
+            break
+        self._track(resource, response.headers)
+
+        if stored is not None and response.status == 304:
+            self.not_modified += 1
+            logger.debug(f"Not modified: {url}")
+            _, data, link = stored
+            response.status = 200
+            response.body = json.dumps(data).encode()
+            # The stored page's Link header leads to the next page
+            del response.headers["Link"]
+            if link is not None:
+                response.headers["Link"] = link
+            return response
+
+        etag = response.headers.get("ETag")
+        if cache is not None and etag and response.status == 200:
+            try:
+                cache.put_validated(
+                    url, etag, response.json(), response.headers.get("Link")
+                )
+            except json.JSONDecodeError:
+                pass
+        return response
+
+    def get_json(self, url: str) -> Any:
+        """GET a REST resource and decode the JSON response."""
+        return self.request("GET", url).json()
+
+    def get_pages(self, url: str) -> Iterator[Any]:
+        """GET a REST collection page by page, following Link: rel="next"."""
+        next_url: str | None = url
+        while next_url:
+            response = self.request("GET", next_url)
+            yield response.json()
+            match = _NEXT_LINK_RE.search(response.headers.get("Link", ""))
+            next_url = match.group(1) if match else None
+
+    def graphql(self, query: str, variables: dict[str, Any]) -> Any:
+        """Run a GraphQL query and return the decoded response."""
+        body = json.dumps({"query": query, "variables": variables}).encode()
+        return self.request(
+            "POST",
+            GITHUB_GRAPHQL_URL,
+            {"Content-Type": "application/json"},
+            body,
+            # Queries only read, so they are as safe to retry as GETs
+            idempotent=True,
+        ).json()
+
+
+_github_client: GitHubClient | None = None
+_github_client_lock = threading.Lock()
+
+
+def get_github_client() -> GitHubClient:
+    """Get the shared GitHub client, creating it on first use."""
+    global _github_client
+    with _github_client_lock:
+        if _github_client is None:
+            _github_client = GitHubClient()
+        return _github_client
+
+
+def _is_buildbot_url(url: str | None) -> bool:
+    return url is not None and "buildbot" in url and is_safe_url(url)
+
+
 def get_buildbot_urls_from_github(owner: str, repo: str, pr_num: str) -> list[str]:
-    """Get buildbot URLs from GitHub PR checks"""
-    # Get PR commits
-    api_url = f"https://api.github.com/repos/{owner}/{repo}/pulls/{pr_num}"
+    """Get buildbot URLs from GitHub PR checks
 
-    req = urllib.request.Request(api_url)
-    req.add_header("Accept", "application/vnd.github.v3+json")
+    Uses a single paginated GraphQL query when a token is available and
+    falls back to the REST API otherwise.
+    """
+    client = get_github_client()
+    if get_github_token():
+        try:
+            return _get_buildbot_urls_graphql(client, owner, repo, pr_num)
+        except GitHubAPIError as e:
+            logger.debug(f"GraphQL lookup failed, falling back to REST: {e}")
+    return _get_buildbot_urls_rest(client, owner, repo, pr_num)
 
-    # Get GitHub token
-    github_token = get_github_token()
-    if github_token:
-        req.add_header("Authorization", f"token {github_token}")
 
+def _get_buildbot_urls_graphql(
+    client: GitHubClient, owner: str, repo: str, pr_num: str
+) -> list[str]:
+    """Get buildbot URLs from every check run and status context via GraphQL"""
+    variables: dict[str, Any] = {
+        "owner": owner,
+        "repo": repo,
+        "number": int(pr_num),
+        "pageSize": GRAPHQL_PAGE_SIZE,
+        "cursor": None,
+    }
+
+    buildbot_urls = []
+    while True:
+        _, contexts = _query_pull_request(client, _CHECK_CONTEXTS_QUERY, variables)
+        if contexts is None:
+            break
+
+        for node in contexts["nodes"]:
+            if node.get("__typename") == "CheckRun":
+                app = (node.get("checkSuite") or {}).get("app") or {}
+                if (
+                    "buildbot" in node.get("name", "").lower()
+                    or "buildbot" in (app.get("name") or "").lower()
+                ) and _is_buildbot_url(node.get("detailsUrl")):
+                    buildbot_urls.append(node["detailsUrl"])
+            elif node.get("__typename") == "StatusContext":
+                if "buildbot" in node.get("context", "").lower() and _is_buildbot_url(
+                    node.get("targetUrl")
+                ):
+                    buildbot_urls.append(node["targetUrl"])
+
+        page_info = contexts["pageInfo"]
+        if not page_info["hasNextPage"]:
+            break
+        variables["cursor"] = page_info["endCursor"]
+
+    return list(set(buildbot_urls))  # Remove duplicates
+
+
+def _query_pull_request(
+    client: GitHubClient, query: str, variables: dict[str, Any]
+) -> tuple[dict[str, Any], dict[str, Any] | None]:
+    """Run a pull request GraphQL query.
+
+    Returns the pullRequest object and the page of head commit check
+    contexts in it, None if the commit has no checks.
+    """
     try:
-        with urllib.request.urlopen(req) as response:
-            pr_data = json.loads(response.read())
-            head_sha = pr_data["head"]["sha"]
+        data = client.graphql(query, variables)
+    except (urllib.error.URLError, urllib.error.HTTPError) as e:
+        raise GitHubAPIError(f"Failed to query GitHub GraphQL API: {e}")
+    except json.JSONDecodeError as e:
+        raise GitHubAPIError(f"Failed to parse GitHub GraphQL response: {e}")
+    if data.get("errors"):
+        raise GitHubAPIError(f"GitHub GraphQL query failed: {data['errors']}")
+
+    try:
+        pull_request = data["data"]["repository"]["pullRequest"]
+        commits = pull_request["commits"]["nodes"]
+    except (KeyError, TypeError) as e:
+        raise GitHubAPIError(f"Unexpected GitHub GraphQL response: {e}")
+    rollup = commits[0]["commit"]["statusCheckRollup"] if commits else None
+    return pull_request, rollup["contexts"] if rollup else None
+
+
+class PRStatusPoller:
+    """Polls the merge state and checks of one pull request.
+
+    poll() returns the fields of `gh pr view --json state,mergeable,
+    autoMergeRequest,statusCheckRollup,url` without starting gh. GitHub
+    doesn't answer GraphQL queries conditionally, so every poll first
+    revalidates the PR and its head commit's check runs and statuses over
+    REST with their ETags; 304s don't count against the rate limit. The
+    ETags live in the response cache of use_response_cache(), or in the
+    default one the poller opens itself outside of it. The GraphQL query
+    only runs when one of the probes changed.
+    """
+
+    def __init__(
+        self,
+        owner: str,
+        repo: str,
+        pr_num: str,
+        client: GitHubClient | None = None,
+    ):
+        self.owner = owner
+        self.repo = repo
+        self.pr_num = pr_num
+        self.client = client or get_github_client()
+        # Polls answered without the GraphQL query
+        self.unchanged = 0
+        self._probe: list[Any] | None = None
+        self._status: dict[str, Any] | None = None
+        # Opened by the poller when no response cache is active
+        self._cache: ResponseCache | None = None
+
+    def _response_cache(self) -> ResponseCache | None:
+        """The cache holding the probes' ETags"""
+        active = get_response_cache()
+        if active is not None:
+            return active
+        if self._cache is None:
+            self._cache = ResponseCache.open_default()
+        return self._cache
+
+    def close(self) -> None:
+        """Close the response cache the poller opened, if any."""
+        if self._cache is not None:
+            self._cache.close()
+            self._cache = None
+
+    def _fetch_probe(self) -> list[Any]:
+        """The REST resources whose changes can change the status"""
+        repo_url = f"{GITHUB_API_URL}/repos/{self.owner}/{self.repo}"
+        pull = self.client.get_json(f"{repo_url}/pulls/{self.pr_num}")
+        head_sha = pull["head"]["sha"]
+        check_runs = list(
+            self.client.get_pages(
+                f"{repo_url}/commits/{head_sha}/check-runs?per_page=100"
+            )
+        )
+        statuses = list(self.client.get_pages(f"{repo_url}/commits/{head_sha}/status"))
+        return [pull, check_runs, statuses]
+
+    def _query_status(self) -> dict[str, Any]:
+        variables: dict[str, Any] = {
+            "owner": self.owner,
+            "repo": self.repo,
+            "number": int(self.pr_num),
+            "pageSize": GRAPHQL_PAGE_SIZE,
+            "cursor": None,
+        }
+        nodes: list[dict[str, Any]] = []
+        while True:
+            pull_request, contexts = _query_pull_request(
+                self.client, _PR_STATUS_QUERY, variables
+            )
+            if contexts is None:
+                break
+            nodes.extend(contexts["nodes"])
+            if not contexts["pageInfo"]["hasNextPage"]:
+                break
+            variables["cursor"] = contexts["pageInfo"]["endCursor"]
+        return {
+            "state": pull_request.get("state"),
+            "mergeable": pull_request.get("mergeable"),
+            "autoMergeRequest": pull_request.get("autoMergeRequest"),
+            "statusCheckRollup": nodes,
+            "url": pull_request.get("url"),
+        }
+
+    def poll(self) -> dict[str, Any]:
+        """Get the current status of the pull request."""
+        try:
+            with use_response_cache(self._response_cache()):
+                probe = self._fetch_probe()
+        except (urllib.error.URLError, urllib.error.HTTPError) as e:
+            raise GitHubAPIError(f"Failed to fetch PR data from GitHub: {e}")
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            raise GitHubAPIError(f"Failed to parse GitHub API response: {e}")
+
+        if self._status is not None and probe == self._probe:
+            self.unchanged += 1
+            logger.debug(f"PR #{self.pr_num} unchanged, skipping the GraphQL query")
+            return self._status
+        self._status = self._query_status()
+        self._probe = probe
+        return self._status
+
+
+def _get_buildbot_urls_rest(
+    client: GitHubClient, owner: str, repo: str, pr_num: str
+) -> list[str]:
+    """Get buildbot URLs from the PR's check runs and commit statuses via REST"""
+    # Get PR commits
+    api_url = f"{GITHUB_API_URL}/repos/{owner}/{repo}/pulls/{pr_num}"
+
+    try:
+        pr_data = client.get_json(api_url)
+        head_sha = pr_data["head"]["sha"]
     except (urllib.error.URLError, urllib.error.HTTPError) as e:
         raise GitHubAPIError(f"Failed to fetch PR data from GitHub: {e}")
     except json.JSONDecodeError as e:
         raise GitHubAPIError(f"Failed to parse GitHub API response: {e}")
 
     # Get check runs for the commit
-    checks_url = (
-        f"https://api.github.com/repos/{owner}/{repo}/commits/{head_sha}/check-runs"
-    )
-    req = urllib.request.Request(checks_url)
-    req.add_header("Accept", "application/vnd.github.v3+json")
-    if github_token:
-        req.add_header("Authorization", f"token {github_token}")
+    checks_url = f"{GITHUB_API_URL}/repos/{owner}/{repo}/commits/{head_sha}/check-runs?per_page=100"
 
     buildbot_urls = []
 
     try:
-        with urllib.request.urlopen(req) as response:
-            checks_data = json.loads(response.read())
-
+        for checks_data in client.get_pages(checks_url):
             for check in checks_data.get("check_runs", []):
                 # Look for buildbot checks
                 if (
@@ -82,32 +541,20 @@ def get_buildbot_urls_from_github(owner: str, repo: str, pr_num: str) -> list[st
                     or "buildbot" in check.get("app", {}).get("name", "").lower()
                 ):
                     details_url = check.get("details_url", "")
-                    if "buildbot" in details_url and is_safe_url(details_url):
+                    if _is_buildbot_url(details_url):
                         buildbot_urls.append(details_url)
     except (urllib.error.URLError, urllib.error.HTTPError, json.JSONDecodeError):
         pass
 
     # Also check commit statuses
-    status_url = (
-        f"https://api.github.com/repos/{owner}/{repo}/commits/{head_sha}/status"
-    )
-    req = urllib.request.Request(status_url)
-    req.add_header("Accept", "application/vnd.github.v3+json")
-    if github_token:
-        req.add_header("Authorization", f"token {github_token}")
+    status_url = f"{GITHUB_API_URL}/repos/{owner}/{repo}/commits/{head_sha}/status"
 
     try:
-        with urllib.request.urlopen(req) as response:
-            status_data = json.loads(response.read())
-
+        for status_data in client.get_pages(status_url):
             for status in status_data.get("statuses", []):
                 if "buildbot" in status.get("context", "").lower():
                     target_url = status.get("target_url", "")
-                    if (
-                        target_url
-                        and "buildbot" in target_url
-                        and is_safe_url(target_url)
-                    ):
+                    if _is_buildbot_url(target_url):
                         buildbot_urls.append(target_url)
     except (urllib.error.URLError, urllib.error.HTTPError, json.JSONDecodeError):
         pass
@@ -0,0 +1,576 @@
+"""Pooled keep-alive HTTP client for buildbot-pr-check."""
+
+import contextvars
+import gzip
+import http.client
+import io
+import json
+import logging
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import zlib
+from collections import deque
+from collections.abc import Callable, Iterator
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+from .profiling import percentile, record_hedge, record_request, record_retry
+
+if TYPE_CHECKING:
+    from .cache import ResponseCache
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "buildbot-pr-check/0.1"
+DEFAULT_TIMEOUT = 30.0
+# Upper bound on concurrent requests per host, shared by the request scheduler
+MAX_CONNECTIONS_PER_HOST = 20
+MAX_REDIRECTS = 5
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+
+# Wall time one request may take, retries included
+REQUEST_DEADLINE = 60.0
+# Attempts of an idempotent request, the first one included
+MAX_ATTEMPTS = 3
+# Backoff before retry n is random between 0 and RETRY_BACKOFF * 2**n seconds
+RETRY_BACKOFF = 0.5
+RETRY_BACKOFF_MAX = 8.0
+# Statuses of a server (or a proxy in front of it) that may be gone on retry
+RETRY_STATUSES = frozenset({500, 502, 503, 504})
+
+# A hedged GET is duplicated once it takes longer than this percentile of
+# the host's recent response times
+HEDGE_PERCENTILE = 0.95
+# Response times kept per host, and needed before hedging starts
+HEDGE_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+
+# Errors that mean a kept-alive connection was closed by the server while idle
+_STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    BrokenPipeError,
+    ConnectionResetError,
+    ConnectionAbortedError,
+)
+
+
+@dataclass
+class Response:
+    """A fully read HTTP response"""
+
+    url: str
+    status: int
+    reason: str
+    headers: http.client.HTTPMessage
+    body: bytes
+
+    def json(self) -> Any:
+        """Decode the response body as JSON"""
+        return json.loads(self.body)
+
+
+class _HostPool:
+    """Bounded pool of idle keep-alive connections to a single host"""
+
+    def __init__(self, scheme: str, netloc: str, max_size: int, timeout: float):
+        self.scheme = scheme
+        self.netloc = netloc
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._idle: list[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+
+    def connect(self) -> http.client.HTTPConnection:
+        """Open a new (lazily connecting) connection to the host."""
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(self.netloc, timeout=self.timeout)
+        return http.client.HTTPConnection(self.netloc, timeout=self.timeout)
+
+    def acquire(self) -> tuple[http.client.HTTPConnection, bool]:
+        """Take a connection slot. Returns (connection, reused)."""
+        self._slots.acquire()
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self.connect(), False
+
+    def release(self, conn: http.client.HTTPConnection, reusable: bool) -> None:
+        """Return a connection slot, keeping the connection if it is still usable."""
+        if reusable:
+            with self._lock:
+                self._idle.append(conn)
+        else:
+            conn.close()
+        self._slots.release()
+
+    def close(self) -> None:
+        """Close all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+class HTTPClient:
+    """HTTP client that keeps one bounded connection pool per host.
+
+    Errors are reported the same way as ``urllib.request.urlopen``:
+    ``urllib.error.HTTPError`` for 4xx/5xx responses and
+    ``urllib.error.URLError`` for connection failures and timeouts.
+    """
+
+    def __init__(
+        self,
+        max_connections_per_host: int = MAX_CONNECTIONS_PER_HOST,
+        timeout: float = DEFAULT_TIMEOUT,
+        user_agent: str = USER_AGENT,
+    ):
+        self.max_connections_per_host = max_connections_per_host
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self._pools: dict[tuple[str, str], _HostPool] = {}
+        self._latencies: dict[str, deque[float]] = {}
+        self._hedge_executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def _pool_for(self, scheme: str, netloc: str) -> _HostPool:
+        key = (scheme, netloc)
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                pool = _HostPool(
+                    scheme, netloc, self.max_connections_per_host, self.timeout
+                )
+                self._pools[key] = pool
+            return pool
+
+    def _send(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str],
+        body: bytes | None,
+        timeout: float,
+    ) -> Response:
+        parsed = urllib.parse.urlsplit(url)
+        if parsed.scheme not in ("http", "https") or not parsed.netloc:
+            raise urllib.error.URLError(f"unsupported URL: {url}")
+        path = parsed.path or "/"
+        if parsed.query:
+            path = f"{path}?{parsed.query}"
+
+        pool = self._pool_for(parsed.scheme, parsed.netloc)
+        conn, reused = pool.acquire()
+        start = time.perf_counter()
+        try:
+            _set_timeout(conn, timeout)
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                raw = conn.getresponse()
+            except _STALE_CONNECTION_ERRORS:
+                if not reused:
+                    raise
+                # The server dropped an idle keep-alive connection; retry once fresh
+                logger.debug(f"Reconnecting to {parsed.netloc} after stale connection")
+                record_retry(url)
+                conn.close()
+                conn = pool.connect()
+                _set_timeout(conn, timeout)
+                conn.request(method, path, body=body, headers=headers)
+                raw = conn.getresponse()
+            data = raw.read()
+        except (OSError, http.client.HTTPException) as e:
+            pool.release(conn, reusable=False)
+            raise urllib.error.URLError(e) from e
+
+        # Only http.client responses know whether the server kept the socket open
+        pool.release(conn, reusable=not getattr(raw, "will_close", True))
+        try:
+            body = _decode_body(data, raw.headers.get("Content-Encoding"))
+        except (OSError, EOFError, zlib.error) as e:
+            raise urllib.error.URLError(f"corrupt response body: {e}") from e
+        logger.debug(
+            f"{method} {url}: {raw.status}, {len(data)} bytes ({len(body)} decoded)"
+        )
+        self._record_latency(parsed.netloc, time.perf_counter() - start)
+        return Response(
+            url=url,
+            status=raw.status,
+            reason=raw.reason,
+            headers=raw.headers,
+            body=body,
+        )
+
+    def _record_latency(self, netloc: str, latency: float) -> None:
+        with self._lock:
+            latencies = self._latencies.setdefault(netloc, deque(maxlen=HEDGE_WINDOW))
+            latencies.append(latency)
+
+    def _hedge_delay(self, url: str) -> float | None:
+        """Seconds after which a GET of url is duplicated, None if too few samples"""
+        netloc = urllib.parse.urlsplit(url).netloc
+        with self._lock:
+            latencies = list(self._latencies.get(netloc, ()))
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return percentile(latencies, HEDGE_PERCENTILE)
+
+    def _send_hedged(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str],
+        body: bytes | None,
+        timeout: float,
+    ) -> Response:
+        """Send a request, plus a duplicate GET if the first one is slow.
+
+        Within hedge_requests(), a GET that has not been answered after the
+        host's p95 response time is sent a second time; whichever response
+        arrives first is used.
+        """
+        delay = self._hedge_delay(url) if method == "GET" and _hedging.get() else None
+        if delay is None:
+            return self._send(method, url, headers, body, timeout)
+
+        with self._lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(
+                    2 * self.max_connections_per_host, thread_name_prefix="hedge"
+                )
+            executor = self._hedge_executor
+        first = executor.submit(self._send, method, url, headers, body, timeout)
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+
+        logger.debug(f"Hedging {url} after {delay * 1000:.0f}ms")
+        record_hedge(url)
+        pending = {
+            first,
+            executor.submit(self._send, method, url, headers, body, timeout),
+        }
+        error: BaseException | None = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                future_error = future.exception()
+                if future_error is None:
+                    return future.result()
+                error = error or future_error
+        assert error is not None
+        raise error
+
+    def _request_once(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str],
+        body: bytes | None,
+        deadline: float,
+    ) -> Response:
+        """Send a request once, following redirects."""
+        for _ in range(MAX_REDIRECTS + 1):
+            timeout = min(self.timeout, deadline - time.monotonic())
+            if timeout <= 0:
+                raise urllib.error.URLError(
+                    TimeoutError(f"no response within {REQUEST_DEADLINE:.0f}s")
+                )
+            start = time.perf_counter()
+            try:
+                response = self._send_hedged(method, url, headers, body, timeout)
+            except urllib.error.URLError:
+                record_request(url, time.perf_counter() - start, None, 0)
+                raise
+            record_request(
+                url, time.perf_counter() - start, response.status, len(response.body)
+            )
+            location = response.headers.get("Location")
+            if response.status not in REDIRECT_STATUSES or not location:
+                break
+            url = urllib.parse.urljoin(url, location)
+            if response.status == 303:
+                method, body = "GET", None
+        else:
+            raise urllib.error.URLError(f"too many redirects: {url}")
+
+        if response.status >= 400:
+            raise urllib.error.HTTPError(
+                url,
+                response.status,
+                response.reason,
+                response.headers,
+                io.BytesIO(response.body),
+            )
+        return response
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str] | None = None,
+        body: bytes | None = None,
+        idempotent: bool | None = None,
+    ) -> Response:
+        """Send a request, following redirects, and return the full response.
+
+        Idempotent requests (GETs, unless told otherwise) that fail with a
+        connection error, a timeout or one of RETRY_STATUSES are retried up
+        to MAX_ATTEMPTS times with jittered exponential backoff. No attempt
+        starts after REQUEST_DEADLINE.
+        """
+        request_headers = {
+            "User-Agent": self.user_agent,
+            "Accept-Encoding": "gzip, deflate",
+            "Connection": "keep-alive",
+        }
+        if headers:
+            request_headers.update(headers)
+        if idempotent is None:
+            idempotent = method == "GET"
+
+        deadline = time.monotonic() + REQUEST_DEADLINE
+        attempts = MAX_ATTEMPTS if idempotent else 1
+        attempt = 1
+        while True:
+            try:
+                return self._request_once(method, url, request_headers, body, deadline)
+            except urllib.error.URLError as e:
+                if attempt >= attempts or not _is_transient(e):
+                    raise
+                backoff = random.uniform(
+                    0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2 ** (attempt - 1))
+                )
+                if time.monotonic() + backoff >= deadline:
+                    raise
+                logger.debug(f"Retrying {url} in {backoff:.2f}s: {e}")
+                record_retry(url)
+                time.sleep(backoff)
+                attempt += 1
+
+    def get(self, url: str, headers: dict[str, str] | None = None) -> Response:
+        """Send a GET request."""
+        return self.request("GET", url, headers=headers)
+
+    def get_json(self, url: str, headers: dict[str, str] | None = None) -> Any:
+        """Send a GET request and decode the JSON response."""
+        return self.get(url, headers=headers).json()
+
+    def close(self) -> None:
+        """Close all idle pooled connections."""
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools.clear()
+            executor, self._hedge_executor = self._hedge_executor, None
+        for pool in pools:
+            pool.close()
+        if executor is not None:
+            # Losing hedged requests finish on their own
+            executor.shutdown(wait=False)
+
+
+def _set_timeout(conn: http.client.HTTPConnection, timeout: float) -> None:
+    conn.timeout = timeout
+    if conn.sock is not None:
+        conn.sock.settimeout(timeout)
+
+
+def _is_transient(error: urllib.error.URLError) -> bool:
+    """Whether a failed request may succeed when sent again"""
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code in RETRY_STATUSES
+    # Connection failures and timeouts, not e.g. unsupported URLs
+    return isinstance(error.reason, (OSError, http.client.HTTPException))
+
+
+def _decode_body(data: bytes, encoding: str | None) -> bytes:
+    """Undo gzip/deflate content encoding."""
+    if not encoding:
+        return data
+    encoding = encoding.strip().lower()
+    if encoding in ("gzip", "x-gzip"):
+        return gzip.decompress(data)
+    if encoding == "deflate":
+        try:
+            return zlib.decompress(data)
+        except zlib.error:
+            # Some servers send raw deflate without the zlib header
+            return zlib.decompress(data, -zlib.MAX_WBITS)
+    return data
+
+
+class RequestMemo:
+    """Per-run memo of decoded JSON responses keyed by URL.
+
+    Concurrent callers asking for the same URL wait on the first caller's
+    fetch instead of sending their own. Failed fetches are not remembered,
+    so a later caller retries. Memoized values are shared between callers
+    and must not be mutated.
+    """
+
+    def __init__(self) -> None:
+        self._entries: dict[tuple[str, tuple[tuple[str, str], ...]], Future[Any]] = {}
+        self._lock = threading.Lock()
+        self.fetched = 0
+        self.reused = 0
+        self.coalesced = 0
+        # Responses that came from the network and their decoded size
+        self.received = 0
+        self.received_bytes = 0
+
+    @property
+    def saved(self) -> int:
+        """Requests that were answered without going to the network"""
+        return self.reused + self.coalesced
+
+    def record_received(self, size: int) -> None:
+        """Count a response body of size bytes received from the network."""
+        with self._lock:
+            self.received += 1
+            self.received_bytes += size
+
+    def get_json(
+        self,
+        url: str,
+        headers: dict[str, str] | None,
+        fetch: Callable[[], Any],
+    ) -> Any:
+        """Return the memoized response for url, calling fetch() at most once."""
+        key = (url, tuple(sorted((headers or {}).items())))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = Future()
+                self._entries[key] = entry
+                self.fetched += 1
+                owner = True
+            else:
+                if entry.done():
+                    self.reused += 1
+                else:
+                    self.coalesced += 1
+                owner = False
+
+        if not owner:
+            return entry.result()
+
+        try:
+            value = fetch()
+        except BaseException as e:
+            with self._lock:
+                del self._entries[key]
+            entry.set_exception(e)
+            raise
+        entry.set_result(value)
+        return value
+
+
+_default_client: HTTPClient | None = None
+_default_client_lock = threading.Lock()
+
+
+def get_client() -> HTTPClient:
+    """Get the shared HTTP client, creating it on first use."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = HTTPClient()
+        return _default_client
+
+
+def close_client() -> None:
+    """Close the shared HTTP client and drop its pooled connections."""
+    global _default_client
+    with _default_client_lock:
+        client, _default_client = _default_client, None
+    if client is not None:
+        client.close()
+
+
+# Context variables rather than globals: asyncio tasks that enter these
+# contexts concurrently each see their own, and RequestScheduler runs calls
+# in a copy of the caller's context.
+_active_memo: contextvars.ContextVar[RequestMemo | None] = contextvars.ContextVar(
+    "active_memo", default=None
+)
+_active_cache: contextvars.ContextVar["ResponseCache | None"] = contextvars.ContextVar(
+    "active_cache", default=None
+)
+_hedging = contextvars.ContextVar("hedging", default=False)
+
+
+@contextmanager
+def memoize_requests() -> Iterator[RequestMemo]:
+    """Share fetch_json responses by URL until the context exits."""
+    memo = RequestMemo()
+    token = _active_memo.set(memo)
+    try:
+        yield memo
+    finally:
+        _active_memo.reset(token)
+
+
+@contextmanager
+def use_response_cache(cache: "ResponseCache | None") -> Iterator[None]:
+    """Serve and store immutable fetch_json responses from cache in the context."""
+    token = _active_cache.set(cache)
+    try:
+        yield
+    finally:
+        _active_cache.reset(token)
+
+
+@contextmanager
+def hedge_requests() -> Iterator[None]:
+    """Duplicate GETs that are slower than usual until the context exits."""
+    token = _hedging.set(True)
+    try:
+        yield
+    finally:
+        _hedging.reset(token)
+
+
+def get_response_cache() -> "ResponseCache | None":
+    """Get the response cache enabled with use_response_cache(), if any."""
+    return _active_cache.get()
+
+
+def fetch_json(
+    url: str,
+    headers: dict[str, str] | None = None,
+    immutable: Callable[[Any], bool] | None = None,
+) -> Any:
+    """Fetch and decode JSON through the shared HTTP client.
+
+    Inside memoize_requests() each URL is only fetched once. Inside
+    use_response_cache() cached responses are returned without a request,
+    and responses for which immutable(response) is true are stored.
+    """
+    cache = _active_cache.get()
+    memo = _active_memo.get()
+
+    def load() -> Any:
+        if cache is not None:
+            cached = cache.get(url)
+            if cached is not None:
+                return cached
+        response = get_client().get(url, headers=headers)
+        if memo is not None:
+            memo.record_received(len(response.body))
+        return response.json()
+
+    data = load() if memo is None else memo.get_json(url, headers, load)
+    if cache is not None and immutable is not None and immutable(data):
+        cache.put(url, data)
+    return data
@@ -0,0 +1,218 @@
+"""Request and phase instrumentation for --profile.
+
+Inside profile_requests() every HTTP call made through the shared client
+is recorded under its endpoint template (IDs and commit hashes replaced
+by placeholders), and the scheduler records how long each phase was
+busy. Outside of it the record functions do nothing.
+"""
+
+import math
+import re
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from .colors import Colors, colorize
+
+PHASE_DISCOVERY = "URL discovery"
+
+_SHA_RE = re.compile(r"[0-9a-f]{40}")
+
+
+def endpoint_template(url: str) -> str:
+    """Turn a request URL into its endpoint template.
+
+    ``https://ci.example.org/api/v2/builds/42/steps?field=name`` becomes
+    ``ci.example.org/api/v2/builds/{id}/steps?field``.
+    """
+    parsed = urllib.parse.urlsplit(url)
+    segments = []
+    for segment in parsed.path.split("/"):
+        if segment.isdigit():
+            segments.append("{id}")
+        elif _SHA_RE.fullmatch(segment):
+            segments.append("{sha}")
+        else:
+            segments.append(segment)
+    template = parsed.netloc + "/".join(segments)
+    keys = sorted({key for key, _ in urllib.parse.parse_qsl(parsed.query)})
+    if keys:
+        template += "?" + "&".join(keys)
+    return template
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def busy_time(intervals: list[tuple[float, float]]) -> float:
+    """Length of the union of (start, end) intervals"""
+    total = 0.0
+    current_start = current_end = None
+    for start, end in sorted(intervals):
+        if current_end is None or start > current_end:
+            if current_start is not None and current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_start is not None and current_end is not None:
+        total += current_end - current_start
+    return total
+
+
+@dataclass
+class EndpointStats:
+    """Calls recorded for one endpoint template"""
+
+    latencies: list[float] = field(default_factory=list)
+    statuses: Counter[str] = field(default_factory=Counter)
+    bytes: int = 0
+    retries: int = 0
+    hedges: int = 0
+
+
+class Profiler:
+    """Collects per-endpoint request stats and per-phase wall time."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.endpoints: dict[str, EndpointStats] = {}
+        self.phases: dict[str, list[tuple[float, float]]] = {}
+        self._lock = threading.Lock()
+
+    def record_request(
+        self, url: str, latency: float, status: int | None, size: int
+    ) -> None:
+        """Record one HTTP call; status is None if no response arrived."""
+        template = endpoint_template(url)
+        with self._lock:
+            stats = self.endpoints.setdefault(template, EndpointStats())
+            stats.latencies.append(latency)
+            stats.statuses[str(status) if status is not None else "error"] += 1
+            stats.bytes += size
+
+    def record_retry(self, url: str) -> None:
+        """Record that a call to url is being retried."""
+        template = endpoint_template(url)
+        with self._lock:
+            self.endpoints.setdefault(template, EndpointStats()).retries += 1
+
+    def record_hedge(self, url: str) -> None:
+        """Record that a duplicate of a slow call to url was sent."""
+        template = endpoint_template(url)
+        with self._lock:
+            self.endpoints.setdefault(template, EndpointStats()).hedges += 1
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Count the time spent inside the block towards a phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self.phases.setdefault(name, []).append((start, end))
+
+    def print_report(self) -> None:
+        """Print the endpoint histogram and the wall time of each phase."""
+        total = time.perf_counter() - self.started
+        print(f"\n{colorize('⏱️  Profile', Colors.BOLD)}")
+        print("─" * 80)
+        print(f"{'Phase':<40} {'Busy':>8}")
+        for name, intervals in self.phases.items():
+            print(f"{name:<40} {busy_time(intervals):>7.2f}s")
+        print(f"{'Total wall time':<40} {total:>7.2f}s")
+        print("(phases overlap when they run concurrently)")
+
+        if not self.endpoints:
+            return
+        print()
+        print(
+            f"{'Count':>5} {'p50':>7} {'p95':>7} {'max':>7} {'Bytes':>9} "
+            f"{'Retry':>5} {'Hedge':>5}  Endpoint [status×count]"
+        )
+        by_time = sorted(
+            self.endpoints.items(),
+            key=lambda item: sum(item[1].latencies),
+            reverse=True,
+        )
+        for template, stats in by_time:
+            latencies = stats.latencies or [0.0]
+            statuses = " ".join(
+                f"{status}×{count}" for status, count in sorted(stats.statuses.items())
+            )
+            print(
+                f"{len(stats.latencies):>5} "
+                f"{_format_ms(percentile(latencies, 0.5)):>7} "
+                f"{_format_ms(percentile(latencies, 0.95)):>7} "
+                f"{_format_ms(max(latencies)):>7} "
+                f"{format_bytes(stats.bytes):>9} {stats.retries:>5} "
+                f"{stats.hedges:>5}  "
+                f"{template} [{statuses}]"
+            )
+
+
+def _format_ms(seconds: float) -> str:
+    return f"{seconds * 1000:.0f}ms"
+
+
+def format_bytes(size: int) -> str:
+    """Human-readable size, e.g. 1.5KiB"""
+    if size < 1024:
+        return f"{size}B"
+    if size < 1024 * 1024:
+        return f"{size / 1024:.1f}KiB"
+    return f"{size / (1024 * 1024):.1f}MiB"
+
+
+_active_profiler: Profiler | None = None
+
+
+@contextmanager
+def profile_requests() -> Iterator[Profiler]:
+    """Record every HTTP call and scheduled phase while the block runs."""
+    global _active_profiler
+    previous = _active_profiler
+    profiler = Profiler()
+    _active_profiler = profiler
+    try:
+        yield profiler
+    finally:
+        _active_profiler = previous
+
+
+def record_request(url: str, latency: float, status: int | None, size: int) -> None:
+    """Record an HTTP call with the active profiler, if any."""
+    if _active_profiler is not None:
+        _active_profiler.record_request(url, latency, status, size)
+
+
+def record_retry(url: str) -> None:
+    """Record a retried HTTP call with the active profiler, if any."""
+    if _active_profiler is not None:
+        _active_profiler.record_retry(url)
+
+
+def record_hedge(url: str) -> None:
+    """Record a hedged HTTP call with the active profiler, if any."""
+    if _active_profiler is not None:
+        _active_profiler.record_hedge(url)
+
+
+@contextmanager
+def profile_phase(name: str) -> Iterator[None]:
+    """Count the block towards a phase of the active profiler, if any."""
+    profiler = _active_profiler
+    if profiler is None:
+        yield
+        return
+    with profiler.phase(name):
+        yield
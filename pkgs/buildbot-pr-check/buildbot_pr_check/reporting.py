@@ -1,23 +1,44 @@
 """Reporting functions for buildbot-pr-check."""
 
+import asyncio
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from dataclasses import dataclass
+from collections.abc import Callable, Collection
+from dataclasses import dataclass, field
+from typing import TypeGuard
 
 from .build_status import BuildStatus
 from .buildbot_api import (
+    BuildRequestStatus,
     BuildWithTriggers,
+    LogUrl,
     check_build_request_status,
+    chunk_request_ids,
+    fetch_log_excerpts,
     get_build_log_urls,
     get_build_names,
+    get_build_request_statuses,
+    get_log_tail,
     get_parent_build_status,
 )
 from .colors import Colors, colorize
+from .exceptions import BuildbotAPIError
+from .root_cause import (
+    ROOT_CAUSE_SCAN_LINES,
+    derivation_name,
+    find_root_cause,
+    group_failures,
+)
+from .scheduler import Priority, RequestScheduler
 
 logger = logging.getLogger(__name__)
 
 REPORT_DIVIDER_WIDTH = 80
-MAX_STATUS_WORKERS = 20
+FAILED_STATUSES = frozenset(
+    {BuildStatus.FAILURE, BuildStatus.EXCEPTION, BuildStatus.CANCELLED}
+)
+DEFAULT_INCLUDED_STATUSES = frozenset({BuildStatus.FAILURE, BuildStatus.CANCELLED})
+# Names listed per root-cause group before the rest are summarized
+MAX_GROUP_NAMES_SHOWN = 5
 
 
 @dataclass
@@ -28,99 +49,457 @@ class BuildStatusReport:
     build_id_map: dict[int, int | None]
     name_map: dict[int, str]
     virtual_builder_map: dict[int, str | None]
+    parent_status: BuildStatus | None = None
+    parent_logs: list[LogUrl] = field(default_factory=list)
+    log_urls: dict[int, list[LogUrl]] = field(default_factory=dict)
+    # Build requests that Buildbot has not finished yet
+    incomplete: set[int] = field(default_factory=set)
+    # Build requests whose status could not be looked up
+    errors: set[int] = field(default_factory=set)
+    # First failing derivation of failed build requests, if found in their logs
+    root_causes: dict[int, str] = field(default_factory=dict)
 
 
-def check_build_status(build: BuildWithTriggers) -> BuildStatusReport:
-    """Check status of all build requests for a build."""
-    print(f"\n{colorize('🔍 Checking:', Colors.CYAN)} {build.url}")
-    print("─" * REPORT_DIVIDER_WIDTH)
+# Called with (report, request ID, status) when a failed request resolves
+FailureCallback = Callable[[BuildStatusReport, int, BuildStatus], None]
+
 
-    # First check parent build status
-    parent_status, parent_logs = get_parent_build_status(
-        build.base_url, build.builder_id, build.build_num
+async def _check_request_chunk(
+    scheduler: RequestScheduler, base_url: str, chunk: list[int]
+) -> dict[int, BuildRequestStatus | None]:
+    """Check a chunk of build requests, one by one if the bulk query fails."""
+    results: dict[int, BuildRequestStatus | None] = {}
+    try:
+        results.update(
+            await scheduler.run(
+                base_url,
+                Priority.STATUS,
+                get_build_request_statuses,
+                base_url,
+                chunk,
+            )
+        )
+    except BuildbotAPIError as e:
+        logger.debug(f"Bulk build request query failed, checking one by one: {e}")
+    else:
+        return results
+
+    single_results = await asyncio.gather(
+        *(
+            scheduler.run(
+                base_url, Priority.STATUS, check_build_request_status, base_url, req_id
+            )
+            for req_id in chunk
+        ),
+        return_exceptions=True,
     )
+    for req_id, result in zip(chunk, single_results, strict=True):
+        if isinstance(result, BaseException):
+            # Keep other request results when one lookup fails unexpectedly.
+            logger.warning(f"Error checking request {req_id}: {result}")
+            results[req_id] = None
+        else:
+            results[req_id] = result
+    return results
 
-    if parent_status and parent_status in [
-        BuildStatus.FAILURE,
-        BuildStatus.EXCEPTION,
-        BuildStatus.CANCELLED,
-    ]:
-        print(
-            f"{colorize('⚠️  Parent build failed:', Colors.RED)} {parent_status.display_name}"
+
+async def check_build_requests(
+    scheduler: RequestScheduler, base_url: str, request_ids: list[int]
+) -> dict[int, BuildRequestStatus | None]:
+    """Check build requests with one bulk query per chunk, concurrently"""
+    results: dict[int, BuildRequestStatus | None] = {}
+    for chunk_results in await asyncio.gather(
+        *(
+            _check_request_chunk(scheduler, base_url, chunk)
+            for chunk in chunk_request_ids(request_ids)
         )
-        if parent_logs:
-            print(f"\n{colorize('📋 Parent build logs:', Colors.CYAN)}")
-            for log in parent_logs:
-                print(
-                    f"  • {log.step_name} ({log.log_name}): {colorize(log.url, Colors.BLUE)}"
+    ):
+        results.update(chunk_results)
+    return results
+
+
+async def check_build_status(
+    build: BuildWithTriggers,
+    scheduler: RequestScheduler,
+    included_statuses: set[BuildStatus] | None = None,
+    on_failure: FailureCallback | None = None,
+    excerpt_lines: int = 0,
+    group_by_root_cause: bool = False,
+) -> BuildStatusReport:
+    """Check status of all build requests for a build.
+
+    Status lookups and the parent build are fetched concurrently. The name
+    mapping, which needs all parent build properties, is only fetched once
+    a build request turns out to have no virtual_builder_name. As soon as a
+    chunk of build requests resolves, log URLs (and the last excerpt_lines
+    lines of each log) are fetched for its failed requests whose status is
+    included in the detailed output, and on_failure is called for each of
+    them once its logs are known.
+
+    With group_by_root_cause, the log tails of failed requests are scanned
+    for the first failing derivation instead, and excerpts are only kept
+    for one representative per root cause.
+    """
+    if included_statuses is None:
+        included_statuses = set(DEFAULT_INCLUDED_STATUSES)
+    shown_failures = FAILED_STATUSES & included_statuses
+
+    parent_task = asyncio.create_task(
+        check_parent_build(scheduler, build, excerpt_lines)
+    )
+    names_task: asyncio.Task[dict[int, str]] | None = None
+    scanner = (
+        RootCauseScanner(scheduler, build.base_url) if group_by_root_cause else None
+    )
+
+    def fetch_names() -> asyncio.Task[dict[int, str]]:
+        nonlocal names_task
+        if names_task is None:
+            names_task = asyncio.create_task(
+                scheduler.run(
+                    build.base_url,
+                    Priority.NAMES,
+                    get_build_names,
+                    build.base_url,
+                    build.builder_id,
+                    build.build_num,
                 )
-        print()
+            )
+        return names_task
 
-    print(
-        f"Found {colorize(str(len(build.build_requests)), Colors.BOLD)} triggered builds"
+    report = BuildStatusReport(
+        statuses={}, build_id_map={}, name_map={}, virtual_builder_map={}
     )
 
-    # Get build names mapping
-    name_map = get_build_names(build.base_url, build.builder_id, build.build_num)
-
-    # Check status of each build request in parallel
-    statuses: dict[BuildStatus | None, list[int]] = {}
-    build_id_map = {}
-    virtual_builder_map = {}
-
-    # Use ThreadPoolExecutor for parallel requests
-    max_workers = min(MAX_STATUS_WORKERS, max(1, len(build.build_requests)))
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Submit all requests to the thread pool
-        future_to_req_id = {
-            executor.submit(check_build_request_status, build.base_url, req_id): req_id
-            for req_id in build.build_requests
-        }
-
-        # Process results as they complete
-        for future in as_completed(future_to_req_id):
-            req_id = future_to_req_id[future]
-            try:
-                req_status = future.result()
-                if req_status.status not in statuses:
-                    statuses[req_status.status] = []
-                statuses[req_status.status].append(req_id)
-                build_id_map[req_id] = req_status.build_id
-                virtual_builder_map[req_id] = req_status.virtual_builder_name
-            except Exception as error:  # noqa: BLE001
-                # Keep other request results when one worker fails unexpectedly.
-                print(f"Error checking request {req_id}: {error}")
-                if None not in statuses:
-                    statuses[None] = []
-                statuses[None].append(req_id)
-                build_id_map[req_id] = None
-                virtual_builder_map[req_id] = None
-
-    return BuildStatusReport(
-        statuses=statuses,
-        build_id_map=build_id_map,
-        name_map=name_map,
-        virtual_builder_map=virtual_builder_map,
+    async def resolve_failure(req_id: int, status: BuildStatus) -> None:
+        await fetch_failed_log_urls(
+            scheduler,
+            build,
+            report,
+            {req_id},
+            included_statuses,
+            0 if scanner is not None else excerpt_lines,
+            scanner,
+        )
+        if on_failure is None:
+            return
+        if not report.virtual_builder_map.get(req_id):
+            # The display name has to come from the parent's properties
+            report.name_map = await fetch_names()
+        on_failure(report, req_id, status)
+
+    async def check_chunk(chunk: list[int]) -> None:
+        results = await _check_request_chunk(scheduler, build.base_url, chunk)
+        failed = []
+        for req_id in chunk:
+            status = update_request_status(report, req_id, results.get(req_id))
+            if status in shown_failures:
+                failed.append((req_id, status))
+        if any(not report.virtual_builder_map.get(req_id) for req_id in chunk):
+            fetch_names()
+        await asyncio.gather(
+            *(resolve_failure(req_id, status) for req_id, status in failed)
+        )
+
+    await asyncio.gather(
+        *(check_chunk(chunk) for chunk in chunk_request_ids(build.build_requests))
     )
+    if scanner is not None:
+        await fetch_representative_excerpts(
+            scanner, report, shown_failures, excerpt_lines
+        )
 
+    report.parent_status, report.parent_logs = await parent_task
+    if names_task is not None:
+        report.name_map = await names_task
+    return report
 
-def print_build_report(
+
+@dataclass
+class FirstFailure:
+    """The failure that stopped a fail-fast check"""
+
+    build: BuildWithTriggers
+    # None if the parent build itself failed
+    request_id: int | None
+    status: BuildStatus
+
+
+class _FailureFound(Exception):
+    def __init__(self, failure: FirstFailure):
+        super().__init__(failure)
+        self.failure = failure
+
+
+async def find_first_failure(
+    builds: list[BuildWithTriggers],
+    reports: list[BuildStatusReport],
+    scheduler: RequestScheduler,
+) -> FirstFailure | None:
+    """Check builds only until a parent build or build request has failed.
+
+    The parent builds and all chunks of build requests are looked up
+    concurrently. The first one that resolves to a failed status cancels
+    the lookups that are still queued or in flight, so reports only hold
+    what was known by then. Logs and names are never fetched.
+    """
+
+    async def check_parent(build: BuildWithTriggers, report: BuildStatusReport) -> None:
+        report.parent_status, _ = await scheduler.run(
+            build.base_url,
+            Priority.STATUS,
+            get_parent_build_status,
+            build.base_url,
+            build.builder_id,
+            build.build_num,
+            False,
+        )
+        if is_failed_status(report.parent_status):
+            raise _FailureFound(FirstFailure(build, None, report.parent_status))
+
+    async def check_chunk(
+        build: BuildWithTriggers, report: BuildStatusReport, chunk: list[int]
+    ) -> None:
+        results = await _check_request_chunk(scheduler, build.base_url, chunk)
+        for req_id in chunk:
+            status = update_request_status(report, req_id, results.get(req_id))
+            if is_failed_status(status):
+                raise _FailureFound(FirstFailure(build, req_id, status))
+
+    failures: list[FirstFailure] = []
+    try:
+        # A task raising _FailureFound cancels all the others
+        async with asyncio.TaskGroup() as group:
+            for build, report in zip(builds, reports, strict=True):
+                group.create_task(check_parent(build, report))
+                for chunk in chunk_request_ids(build.build_requests):
+                    group.create_task(check_chunk(build, report, chunk))
+    except* _FailureFound as found:
+        failures = [
+            error.failure
+            for error in found.exceptions
+            if isinstance(error, _FailureFound)
+        ]
+    return failures[0] if failures else None
+
+
+async def check_parent_build(
+    scheduler: RequestScheduler, build: BuildWithTriggers, excerpt_lines: int = 0
+) -> tuple[BuildStatus | None, list[LogUrl]]:
+    """Get the parent build's status and the logs of its failed steps"""
+    status, logs = await scheduler.run(
+        build.base_url,
+        Priority.STATUS,
+        get_parent_build_status,
+        build.base_url,
+        build.builder_id,
+        build.build_num,
+    )
+    await fetch_log_excerpts(scheduler, build.base_url, logs, excerpt_lines)
+    return status, logs
+
+
+def is_failed_status(status: BuildStatus | None) -> TypeGuard[BuildStatus]:
+    """Check whether a build failed, was cancelled or hit an exception"""
+    return status in FAILED_STATUSES
+
+
+def has_failures(report: BuildStatusReport) -> bool:
+    """Check whether the parent build or any triggered build failed"""
+    if is_failed_status(report.parent_status):
+        return True
+    return any(
+        is_failed_status(status) and req_ids
+        for status, req_ids in report.statuses.items()
+    )
+
+
+def update_request_status(
+    report: BuildStatusReport,
+    req_id: int,
+    req_status: BuildRequestStatus | None,
+) -> BuildStatus | None:
+    """Record the latest status of a build request in the report.
+
+    Moves the request out of the status bucket it was in before and
+    returns its new status.
+    """
+    for old_status, requests in report.statuses.items():
+        if req_id in requests:
+            requests.remove(req_id)
+            if not requests:
+                del report.statuses[old_status]
+            break
+
+    status = req_status.status if req_status else None
+    report.statuses.setdefault(status, []).append(req_id)
+    report.build_id_map[req_id] = req_status.build_id if req_status else None
+    report.virtual_builder_map[req_id] = (
+        req_status.virtual_builder_name if req_status else None
+    )
+    if req_status and req_status.complete:
+        report.incomplete.discard(req_id)
+    else:
+        report.incomplete.add(req_id)
+    if req_status is None:
+        report.errors.add(req_id)
+    else:
+        report.errors.discard(req_id)
+    return status
+
+
+class RootCauseScanner:
+    """Scans the log tails of failed builds for their first failing derivation.
+
+    The scanned tails are kept so excerpts of up to ROOT_CAUSE_SCAN_LINES
+    lines can be cut from them instead of being fetched again.
+    """
+
+    def __init__(self, scheduler: RequestScheduler, base_url: str) -> None:
+        self._scheduler = scheduler
+        self._base_url = base_url
+        # Scanned log tails by log URL
+        self.tails: dict[str, list[str]] = {}
+
+    async def scan(self, logs: list[LogUrl]) -> str | None:
+        """Find the root cause of a failed build in the tails of its logs"""
+        tails = await asyncio.gather(
+            *(
+                self._scheduler.run(
+                    self._base_url,
+                    Priority.LOGS,
+                    get_log_tail,
+                    self._base_url,
+                    log,
+                    ROOT_CAUSE_SCAN_LINES,
+                )
+                for log in logs
+            ),
+            return_exceptions=True,
+        )
+        root_causes = []
+        for log, tail in zip(logs, tails, strict=True):
+            if isinstance(tail, BaseException):
+                logger.debug(f"Could not scan {log.url} for a root cause: {tail}")
+                continue
+            self.tails[log.url] = tail
+            root_causes.append(find_root_cause(tail))
+        return next((cause for cause in root_causes if cause is not None), None)
+
+    async def fetch_excerpts(self, logs: list[LogUrl], lines: int) -> None:
+        """Set log excerpts from the scanned tails, fetching the rest"""
+        if lines <= 0:
+            return
+        missing = []
+        for log in logs:
+            tail = self.tails.get(log.url)
+            if tail is None or lines > ROOT_CAUSE_SCAN_LINES:
+                missing.append(log)
+            else:
+                log.excerpt = tail[-lines:]
+        await fetch_log_excerpts(self._scheduler, self._base_url, missing, lines)
+
+
+async def fetch_failed_log_urls(
+    scheduler: RequestScheduler,
     build: BuildWithTriggers,
     report: BuildStatusReport,
-    included_statuses: set[BuildStatus] | None = None,
+    req_ids: Collection[int],
+    included_statuses: set[BuildStatus],
+    excerpt_lines: int = 0,
+    scanner: RootCauseScanner | None = None,
 ) -> None:
-    """Print detailed report for a build.
+    """Fetch log URLs of the given requests that failed and are shown in detail.
 
-    Args:
-        build: The build with triggers
-        report: The build status report
-        included_statuses: Set of statuses to include in detailed output. If None, defaults to FAILURE and CANCELLED.
+    With excerpt_lines, the last lines of every log are fetched as well.
+    With a scanner, the log tails are scanned for the first failing
+    derivation, which is recorded in report.root_causes.
     """
-    # Default to showing FAILURE and CANCELLED if not specified
-    if included_statuses is None:
-        included_statuses = {BuildStatus.FAILURE, BuildStatus.CANCELLED}
+    shown = FAILED_STATUSES & included_statuses
+    log_req_ids = []
+    for status in shown:
+        for req_id in report.statuses.get(status, []):
+            if req_id not in req_ids:
+                continue
+            if report.build_id_map.get(req_id):
+                log_req_ids.append(req_id)
+            else:
+                logger.debug(f"No build_id found for request {req_id}")
+
+    async def fetch_logs(req_id: int) -> list[LogUrl]:
+        logs = await get_build_log_urls(
+            scheduler, build.base_url, report.build_id_map[req_id]
+        )
+        if scanner is not None:
+            root_cause = await scanner.scan(logs)
+            if root_cause is not None:
+                report.root_causes[req_id] = root_cause
+        await fetch_log_excerpts(scheduler, build.base_url, logs, excerpt_lines)
+        return logs
+
+    log_results = await asyncio.gather(*(fetch_logs(req_id) for req_id in log_req_ids))
+    report.log_urls.update(zip(log_req_ids, log_results, strict=True))
 
-    # Report summary
+
+async def fetch_representative_excerpts(
+    scanner: RootCauseScanner,
+    report: BuildStatusReport,
+    statuses: Collection[BuildStatus],
+    excerpt_lines: int,
+) -> None:
+    """Fetch log excerpts for one failed build per root-cause group"""
+    representatives = [
+        group.representative
+        for status in statuses
+        for group in group_failures(report.statuses.get(status, []), report.root_causes)
+    ]
+    await asyncio.gather(
+        *(
+            scanner.fetch_excerpts(report.log_urls.get(req_id, []), excerpt_lines)
+            for req_id in representatives
+        )
+    )
+
+
+def flake_attribute(virtual_builder_name: str) -> str:
+    """Get the flake attribute part of a virtual builder name"""
+    return virtual_builder_name.split("#", 1)[-1]
+
+
+def get_display_name(report: BuildStatusReport, req_id: int) -> str:
+    """Get the name to show for a build request"""
+    # Use virtual_builder_name if available, otherwise fall back to name_map
+    virtual_name = report.virtual_builder_map.get(req_id)
+    if virtual_name:
+        return flake_attribute(virtual_name)
+    return report.name_map.get(req_id, f"Request {req_id}")
+
+
+def print_log_urls(log_urls: list[LogUrl], indent: str = "  ") -> None:
+    """Print log URLs as a bullet list, each followed by its excerpt if any"""
+    for log in log_urls:
+        print(
+            f"{indent}• {log.step_name} ({log.log_name}): {colorize(log.url, Colors.BLUE)}"
+        )
+        for line in log.excerpt or []:
+            print(f"{indent}  │ {line}")
+
+
+def print_parent_failure(report: BuildStatusReport) -> None:
+    """Print the parent build failure and its logs, if the parent failed"""
+    if report.parent_status not in FAILED_STATUSES:
+        return
+    print(
+        f"{colorize('⚠️  Parent build failed:', Colors.RED)} {report.parent_status.display_name}"
+    )
+    if report.parent_logs:
+        print(f"\n{colorize('📋 Parent build logs:', Colors.CYAN)}")
+        print_log_urls(report.parent_logs)
+    print()
+
+
+def print_build_summary(report: BuildStatusReport) -> None:
+    """Print the number of builds per status"""
     print(f"\n{colorize('📊 Build Summary:', Colors.BOLD)}")
     for status, requests in sorted(
         report.statuses.items(), key=lambda x: (x[0] is None, x[0].value if x[0] else 0)
@@ -133,52 +512,144 @@ def print_build_report(
             status_colored = colorize(status.display_name, status.color)
         print(f"  {icon} {status_colored}: {len(requests)} builds")
 
+
+def print_request_result(
+    report: BuildStatusReport,
+    req_id: int,
+    status: BuildStatus | None,
+    prefix: str = " ",
+) -> None:
+    """Print the result of a single build request and its log URLs"""
+    name = get_display_name(report, req_id)
+    if status is None:
+        print(f"{prefix} • {colorize(name, Colors.RED)}: ERROR")
+        return
+    print(
+        f"{prefix} {status.icon} {colorize(name, status.color)}: {status.display_name}"
+    )
+    log_urls = report.log_urls.get(req_id)
+    if log_urls:
+        print_log_urls(log_urls, indent="      ")
+
+
+def print_first_failure(
+    failure: FirstFailure, report: BuildStatusReport, checked: int, total: int
+) -> None:
+    """Print the failure that stopped a fail-fast check"""
+    if failure.request_id is None:
+        name = f"Parent build {failure.build.url}"
+    else:
+        name = get_display_name(report, failure.request_id)
+    print(
+        f"\n{colorize('⛔ Failing fast:', Colors.RED)} "
+        f"{colorize(name, failure.status.color)} {failure.status.display_name} "
+        f"({checked} of {total} triggered builds checked)"
+    )
+
+
+def print_build_header(build: BuildWithTriggers) -> None:
+    """Print the heading for a build's report"""
+    print(f"\n{colorize('🔍 Checking:', Colors.CYAN)} {build.url}")
+    print("─" * REPORT_DIVIDER_WIDTH)
+
+
+def print_triggered_count(build: BuildWithTriggers) -> None:
+    """Print how many builds the parent build triggered"""
+    print(
+        f"Found {colorize(str(len(build.build_requests)), Colors.BOLD)} triggered builds"
+    )
+
+
+def print_request_log_urls(
+    report: BuildStatusReport, req_id: int, label: str = "Log URLs:"
+) -> None:
+    """Print the log URLs of a failed build request"""
+    log_urls = report.log_urls.get(req_id)
+    if not log_urls:
+        logger.debug(f"No log URLs found for request {req_id}")
+        return
+
+    print(f"    {colorize(label, Colors.CYAN)}")
+    print_log_urls(log_urls, indent="      ")
+
+
+def print_failure_groups(report: BuildStatusReport, status: BuildStatus) -> None:
+    """Print failed build requests grouped by root cause.
+
+    Each group lists its members and the logs of one representative;
+    requests without a known root cause are printed on their own.
+    """
+    for group in group_failures(report.statuses[status], report.root_causes):
+        names = [get_display_name(report, req_id) for req_id in group.request_ids]
+        if group.root_cause is None:
+            print(f"  → {colorize(names[0], status.color)}")
+            print_request_log_urls(report, group.representative)
+            continue
+
+        count = len(names)
+        print(
+            f"  🧩 {colorize(derivation_name(group.root_cause), Colors.BOLD)}"
+            f" failed for {count} build{'s' if count != 1 else ''}:"
+        )
+        for name in names[:MAX_GROUP_NAMES_SHOWN]:
+            print(f"    → {colorize(name, status.color)}")
+        if count > MAX_GROUP_NAMES_SHOWN:
+            print(f"    … and {count - MAX_GROUP_NAMES_SHOWN} more")
+        print_request_log_urls(report, group.representative, f"Log URLs ({names[0]}):")
+
+
+def print_build_report(
+    build: BuildWithTriggers,
+    report: BuildStatusReport,
+    included_statuses: set[BuildStatus] | None = None,
+    streamed: bool = False,
+    grouped: bool = False,
+) -> None:
+    """Print detailed report for a build.
+
+    Args:
+        build: The build with triggers
+        report: The build status report
+        included_statuses: Set of statuses to include in detailed output. If None, defaults to FAILURE and CANCELLED.
+        streamed: The header and the failed builds were already printed while checking
+        grouped: Group failed builds by their root cause
+    """
+    # Default to showing FAILURE and CANCELLED if not specified
+    if included_statuses is None:
+        included_statuses = set(DEFAULT_INCLUDED_STATUSES)
+
+    if not streamed:
+        print_build_header(build)
+    elif report.parent_status in FAILED_STATUSES:
+        print()
+
+    print_parent_failure(report)
+
+    if not streamed:
+        print_triggered_count(build)
+
+    print_build_summary(report)
+
     # Show detailed output for included statuses
     for status in included_statuses:
         if status not in report.statuses:
             continue
+        if streamed and status in FAILED_STATUSES:
+            continue
 
         print(
             f"\n{colorize(f'{status.icon} {status.title}', status.color)} ({len(report.statuses[status])} total):"
         )
+        if grouped and status in FAILED_STATUSES:
+            print_failure_groups(report, status)
+            continue
         for req_id in sorted(report.statuses[status]):
-            # Use virtual_builder_name if available, otherwise fall back to name_map
-            virtual_name = report.virtual_builder_map.get(req_id)
-            if virtual_name:
-                # Extract just the flake attribute part
-                if "#" in virtual_name:
-                    display_name = virtual_name.split("#", 1)[1]
-                else:
-                    display_name = virtual_name
-            else:
-                display_name = report.name_map.get(req_id, f"Request {req_id}")
-
+            display_name = get_display_name(report, req_id)
             print(f"  → {colorize(display_name, status.color)}")
 
-            # Get log URLs for failed builds
-            if status not in [
-                BuildStatus.FAILURE,
-                BuildStatus.EXCEPTION,
-                BuildStatus.CANCELLED,
-            ]:
-                continue
-
-            build_id = report.build_id_map.get(req_id)
-            if not build_id:
-                logger.debug(f"No build_id found for request {req_id}")
-                continue
-
-            logger.debug(f"Fetching log URLs for build_id {build_id}")
-            log_urls = get_build_log_urls(build.base_url, build_id)
-            if not log_urls:
-                logger.debug(f"No log URLs found for build_id {build_id}")
-                continue
-
-            print(f"    {colorize('Log URLs:', Colors.CYAN)}")
-            for log in log_urls:
-                print(
-                    f"      • {log.step_name} ({log.log_name}): {colorize(log.url, Colors.BLUE)}"
-                )
+            # Show log URLs for failed builds
+            if status in FAILED_STATUSES:
+                print_request_log_urls(report, req_id)
 
     # Handle None status (errors) if present
     if None not in report.statuses or None not in included_statuses:
@@ -0,0 +1,74 @@
+"""Root-cause grouping of failed sub-builds.
+
+When a shared derivation breaks, every sub-build that depends on it fails
+with the same error. The first derivation whose builder failed is found in
+the tail of each failed build's log, and builds are grouped by it so only
+one representative per group needs to be shown.
+"""
+
+import re
+from dataclasses import dataclass
+
+# Log lines scanned from the end of a failed step's log for the root cause
+ROOT_CAUSE_SCAN_LINES = 100
+
+# "error: builder for '/nix/store/...-foo.drv' failed with exit code 1;"
+_BUILDER_FAILED_RE = re.compile(r"builder for '(/nix/store/[^']+\.drv)' failed")
+# Nix >= 2.19: "error: Cannot build '/nix/store/...-foo.drv'.\n  Reason: builder failed ..."
+# Derivations that only failed because of a dependency give a different reason.
+_CANNOT_BUILD_RE = re.compile(
+    r"Cannot build '(/nix/store/[^']+\.drv)'\.\s+Reason: builder failed"
+)
+_STORE_PREFIX_RE = re.compile(r"^/nix/store/[0-9a-z]{32}-")
+
+
+def find_root_cause(lines: list[str]) -> str | None:
+    """Find the first derivation whose builder failed in log lines"""
+    text = "\n".join(lines)
+    matches = [
+        match
+        for regex in (_BUILDER_FAILED_RE, _CANNOT_BUILD_RE)
+        for match in regex.finditer(text)
+    ]
+    if not matches:
+        return None
+    return min(matches, key=lambda match: match.start()).group(1)
+
+
+def derivation_name(drv_path: str) -> str:
+    """Strip the store directory and hash from a derivation path"""
+    return _STORE_PREFIX_RE.sub("", drv_path)
+
+
+@dataclass
+class FailureGroup:
+    """Failed build requests that share a root cause"""
+
+    root_cause: str | None
+    request_ids: list[int]
+
+    @property
+    def representative(self) -> int:
+        return self.request_ids[0]
+
+
+def group_failures(
+    request_ids: list[int], root_causes: dict[int, str]
+) -> list[FailureGroup]:
+    """Group build requests by root cause, largest groups first.
+
+    Requests without a known root cause each get a group of their own.
+    """
+    by_cause: dict[str, list[int]] = {}
+    groups = []
+    for req_id in sorted(request_ids):
+        root_cause = root_causes.get(req_id)
+        if root_cause is None:
+            groups.append(FailureGroup(None, [req_id]))
+        else:
+            by_cause.setdefault(root_cause, []).append(req_id)
+    groups.extend(FailureGroup(cause, ids) for cause, ids in by_cause.items())
+    # Stable sort keeps request ID order among equally sized groups
+    return sorted(
+        groups, key=lambda group: (-len(group.request_ids), group.root_cause is None)
+    )
@@ -0,0 +1,142 @@
+"""Shared request scheduler for buildbot-pr-check.
+
+All Buildbot work of a run goes through one RequestScheduler: blocking API
+calls run on a single bounded thread pool, and each host gets a limiter
+that admits at most MAX_CONNECTIONS_PER_HOST calls at once, handing out
+free slots by priority (status lookups before name lookups before logs).
+"""
+
+import asyncio
+import concurrent.futures
+import contextvars
+import heapq
+import itertools
+from collections.abc import Callable
+from enum import IntEnum
+from types import TracebackType
+from typing import Any, Self, TypeVar
+
+from .http_client import MAX_CONNECTIONS_PER_HOST
+from .profiling import profile_phase
+
+T = TypeVar("T")
+
+# Enough threads to keep the per-host limit busy for a couple of hosts
+MAX_SCHEDULER_THREADS = 2 * MAX_CONNECTIONS_PER_HOST
+
+
+class Priority(IntEnum):
+    """Scheduling priority, lower values are admitted first"""
+
+    STATUS = 0
+    NAMES = 1
+    LOGS = 2
+
+
+class _PriorityLimiter:
+    """Semaphore that admits waiters in priority order"""
+
+    def __init__(self, limit: int):
+        self._limit = limit
+        self._active = 0
+        self._waiters: list[tuple[int, int, asyncio.Future[None]]] = []
+        self._counter = itertools.count()
+
+    async def acquire(self, priority: int) -> None:
+        if self._active < self._limit and not self._waiters:
+            self._active += 1
+            return
+
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed to us just before cancellation
+                self.release()
+            raise
+
+    def release(self) -> None:
+        # Hand the slot straight to the best waiter, keeping _active unchanged
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._active -= 1
+
+
+class RequestScheduler:
+    """Runs blocking API calls for every stage of a check run.
+
+    Use as an async context manager; the worker threads are shut down on
+    exit and queued calls that have not started are dropped.
+    """
+
+    def __init__(
+        self,
+        max_per_host: int | None = None,
+        max_threads: int | None = None,
+    ):
+        self.max_per_host = max_per_host or MAX_CONNECTIONS_PER_HOST
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_threads or MAX_SCHEDULER_THREADS,
+            thread_name_prefix="buildbot-pr-check",
+        )
+        self._limiters: dict[str, _PriorityLimiter] = {}
+
+    def _limiter_for(self, host: str) -> _PriorityLimiter:
+        limiter = self._limiters.get(host)
+        if limiter is None:
+            limiter = _PriorityLimiter(self.max_per_host)
+            self._limiters[host] = limiter
+        return limiter
+
+    async def run(
+        self,
+        host: str,
+        priority: Priority,
+        func: Callable[..., T],
+        *args: Any,
+    ) -> T:
+        """Run func(*args) on the worker pool once host has a free slot.
+
+        The slot is held until the call has finished on its thread, even if
+        the caller is cancelled while it runs. func runs in a copy of the
+        caller's context, so memoize_requests() and friends apply to it.
+        """
+        limiter = self._limiter_for(host)
+        await limiter.acquire(priority)
+        loop = asyncio.get_running_loop()
+        try:
+            future = self._executor.submit(contextvars.copy_context().run, func, *args)
+        except BaseException:
+            limiter.release()
+            raise
+
+        def release(_: concurrent.futures.Future[T]) -> None:
+            try:
+                loop.call_soon_threadsafe(limiter.release)
+            except RuntimeError:
+                # The event loop is gone, and its limiters with it
+                pass
+
+        future.add_done_callback(release)
+        with profile_phase(priority.name.lower()):
+            return await asyncio.wrap_future(future)
+
+    def close(self) -> None:
+        """Stop the worker threads, dropping calls that have not started."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
@@ -0,0 +1,424 @@
+"""Watch mode for buildbot-pr-check.
+
+After the first full report, only the parent builds that are still
+running and the build requests that are still incomplete are checked
+again. Only state transitions are printed.
+
+With events, the Buildbot master's websocket says which build requests
+completed and when a parent build changed, so only those are fetched.
+Without them (or when the websocket is unavailable) the incomplete build
+requests are polled with a backoff.
+"""
+
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable, Collection
+
+from .build_status import BuildStatus
+from .buildbot_api import (
+    BuildWithTriggers,
+    fetch_log_excerpts,
+    get_build_id,
+    get_build_names,
+    get_parent_build_status,
+    get_triggered_builds,
+)
+from .colors import Colors, colorize
+from .events import Event, EventStream
+from .exceptions import BuildbotAPIError
+from .http_client import memoize_requests
+from .reporting import (
+    FAILED_STATUSES,
+    BuildStatusReport,
+    check_build_requests,
+    fetch_failed_log_urls,
+    print_build_header,
+    print_build_summary,
+    print_parent_failure,
+    print_request_result,
+    update_request_status,
+)
+from .scheduler import Priority, RequestScheduler
+
+logger = logging.getLogger(__name__)
+
+WATCH_MIN_INTERVAL = 5.0
+WATCH_MAX_INTERVAL = 60.0
+WATCH_BACKOFF_FACTOR = 1.5
+# Running builds are re-checked over REST this often even while events arrive,
+# in case one was missed
+EVENT_RESYNC_INTERVAL = WATCH_MAX_INTERVAL
+# Events arriving this soon after the first one are handled together
+EVENT_BATCH_DELAY = 0.2
+
+
+def next_poll_interval(interval: float, changed: bool) -> float:
+    """Poll again soon after a change, back off while nothing happens"""
+    if changed:
+        return WATCH_MIN_INTERVAL
+    return min(interval * WATCH_BACKOFF_FACTOR, WATCH_MAX_INTERVAL)
+
+
+def is_finished(report: BuildStatusReport) -> bool:
+    """Check whether the parent build and all its triggered builds are done"""
+    return report.parent_status is not None and not report.incomplete
+
+
+def _timestamp() -> str:
+    return colorize(time.strftime("[%H:%M:%S]"), Colors.BOLD)
+
+
+async def _poll_parent(
+    scheduler: RequestScheduler,
+    build: BuildWithTriggers,
+    report: BuildStatusReport,
+    excerpt_lines: int = 0,
+) -> bool:
+    """Re-check a running parent build and pick up newly triggered builds."""
+    try:
+        request_ids = await scheduler.run(
+            build.base_url,
+            Priority.STATUS,
+            get_triggered_builds,
+            build.base_url,
+            build.builder_id,
+            build.build_num,
+        )
+    except BuildbotAPIError as e:
+        logger.debug(f"Could not refresh triggered builds for {build.url}: {e}")
+        request_ids = []
+
+    changed = False
+    known = set(build.build_requests)
+    new_ids = [req_id for req_id in request_ids if req_id not in known]
+    if new_ids:
+        changed = True
+        build.build_requests.extend(new_ids)
+        for req_id in new_ids:
+            update_request_status(report, req_id, None)
+        report.name_map = await scheduler.run(
+            build.base_url,
+            Priority.NAMES,
+            get_build_names,
+            build.base_url,
+            build.builder_id,
+            build.build_num,
+        )
+        print(
+            f"{_timestamp()} Found {colorize(str(len(new_ids)), Colors.BOLD)} new triggered builds"
+        )
+
+    status, logs = await scheduler.run(
+        build.base_url,
+        Priority.STATUS,
+        get_parent_build_status,
+        build.base_url,
+        build.builder_id,
+        build.build_num,
+    )
+    if status is not None:
+        changed = True
+        await fetch_log_excerpts(scheduler, build.base_url, logs, excerpt_lines)
+        report.parent_status, report.parent_logs = status, logs
+        if status in FAILED_STATUSES:
+            print(f"{_timestamp()} ", end="")
+            print_parent_failure(report)
+        else:
+            print(
+                f"{_timestamp()} {status.icon} Parent build finished: "
+                f"{colorize(status.display_name, status.color)}"
+            )
+    return changed
+
+
+async def _poll_requests(
+    scheduler: RequestScheduler,
+    build: BuildWithTriggers,
+    report: BuildStatusReport,
+    included_statuses: set[BuildStatus],
+    excerpt_lines: int = 0,
+    request_ids: Collection[int] | None = None,
+) -> bool:
+    """Re-check incomplete build requests and print the ones that finished.
+
+    Only the given request_ids are checked, if any.
+    """
+    pending = sorted(
+        report.incomplete
+        if request_ids is None
+        else report.incomplete.intersection(request_ids)
+    )
+    if not pending:
+        return False
+
+    results = await check_build_requests(scheduler, build.base_url, pending)
+    finished: dict[int, BuildStatus | None] = {}
+    for req_id in pending:
+        req_status = results.get(req_id)
+        if req_status is None or not req_status.complete:
+            continue
+        finished[req_id] = update_request_status(report, req_id, req_status)
+
+    await fetch_failed_log_urls(
+        scheduler, build, report, finished.keys(), included_statuses, excerpt_lines
+    )
+
+    for req_id, status in finished.items():
+        print_request_result(report, req_id, status, prefix=_timestamp())
+    return bool(finished)
+
+
+async def _poll_build(
+    scheduler: RequestScheduler,
+    build: BuildWithTriggers,
+    report: BuildStatusReport,
+    included_statuses: set[BuildStatus],
+    excerpt_lines: int = 0,
+) -> bool:
+    changed = False
+    if report.parent_status is None:
+        changed = await _poll_parent(scheduler, build, report, excerpt_lines)
+    if await _poll_requests(scheduler, build, report, included_statuses, excerpt_lines):
+        changed = True
+    return changed
+
+
+Watched = list[tuple[BuildWithTriggers, BuildStatusReport]]
+
+
+def _unfinished(watched: Watched) -> Watched:
+    return [(build, report) for build, report in watched if not is_finished(report)]
+
+
+async def _poll_once(
+    scheduler: RequestScheduler,
+    watched: Watched,
+    included_statuses: set[BuildStatus],
+    excerpt_lines: int = 0,
+) -> bool:
+    """Re-check every running build once, returns whether anything changed"""
+    # Every poll must see fresh responses, so each gets its own memo
+    with memoize_requests():
+        changes = await asyncio.gather(
+            *(
+                _poll_build(scheduler, build, report, included_statuses, excerpt_lines)
+                for build, report in watched
+            )
+        )
+    return any(changes)
+
+
+async def _poll_until_finished(
+    scheduler: RequestScheduler,
+    watched: Watched,
+    included_statuses: set[BuildStatus],
+    sleep: Callable[[float], Awaitable[None]],
+    excerpt_lines: int = 0,
+) -> None:
+    interval = WATCH_MIN_INTERVAL
+    while watched:
+        await sleep(interval)
+        changed = await _poll_once(scheduler, watched, included_statuses, excerpt_lines)
+        interval = next_poll_interval(interval, changed)
+        logger.debug(f"Next poll in {interval:.0f}s")
+        watched = _unfinished(watched)
+
+
+async def _apply_events(
+    scheduler: RequestScheduler,
+    build: BuildWithTriggers,
+    report: BuildStatusReport,
+    parent_changed: bool,
+    completed: set[int],
+    included_statuses: set[BuildStatus],
+    excerpt_lines: int = 0,
+) -> None:
+    """Fetch what the events say changed about one watched build"""
+    new_ids: set[int] = set()
+    if parent_changed and report.parent_status is None:
+        known = set(build.build_requests)
+        await _poll_parent(scheduler, build, report, excerpt_lines)
+        # Triggered builds we just learned about may have completed already
+        new_ids = set(build.build_requests) - known
+    await _poll_requests(
+        scheduler,
+        build,
+        report,
+        included_statuses,
+        excerpt_lines,
+        request_ids=completed | new_ids,
+    )
+
+
+async def _next_events(stream: EventStream, timeout: float) -> list[Event]:
+    """Wait up to timeout for events, then collect the ones right behind them"""
+    try:
+        first = await asyncio.wait_for(stream.next_event(), max(timeout, 0.0))
+    except TimeoutError:
+        return []
+    await asyncio.sleep(EVENT_BATCH_DELAY)
+    return [first, *stream.drain()]
+
+
+async def _watch_events(
+    base_url: str,
+    scheduler: RequestScheduler,
+    watched: Watched,
+    included_statuses: set[BuildStatus],
+    excerpt_lines: int = 0,
+) -> None:
+    """Follow the builds of one Buildbot master through its events.
+
+    Build requests are only fetched once an event says they completed, and
+    a running parent build only when it or one of its steps changed. All
+    running builds are polled once after subscribing, to catch up on what
+    happened before, and every EVENT_RESYNC_INTERVAL.
+    """
+    async with await EventStream.connect(base_url) as stream:
+        # Completions of the whole master, triggered builds are filtered here
+        await stream.subscribe("buildrequests/*/complete")
+        parent_ids: dict[int, int] = {}
+        for index, (build, report) in enumerate(watched):
+            if report.parent_status is not None:
+                continue
+            build_id = await scheduler.run(
+                base_url,
+                Priority.STATUS,
+                get_build_id,
+                base_url,
+                build.builder_id,
+                build.build_num,
+            )
+            parent_ids[index] = build_id
+            await stream.subscribe(f"builds/{build_id}/*")
+            await stream.subscribe(f"builds/{build_id}/steps/*/*")
+
+        completed: set[int] = set()
+        await _poll_once(scheduler, watched, included_statuses, excerpt_lines)
+        last_sync = time.monotonic()
+        while _unfinished(watched):
+            events = await _next_events(
+                stream, last_sync + EVENT_RESYNC_INTERVAL - time.monotonic()
+            )
+            if time.monotonic() - last_sync >= EVENT_RESYNC_INTERVAL:
+                logger.debug(f"Re-checking running builds on {base_url}")
+                await stream.ping()
+                await _poll_once(
+                    scheduler, _unfinished(watched), included_statuses, excerpt_lines
+                )
+                last_sync = time.monotonic()
+            if not events:
+                continue
+
+            changed_builds = set()
+            for event in events:
+                if len(event.key) < 2 or not event.key[1].isdigit():
+                    continue
+                if event.key[0] == "buildrequests":
+                    completed.add(int(event.key[1]))
+                elif event.key[0] == "builds":
+                    changed_builds.add(int(event.key[1]))
+            logger.debug(f"Handling {len(events)} events from {base_url}")
+
+            with memoize_requests():
+                await asyncio.gather(
+                    *(
+                        _apply_events(
+                            scheduler,
+                            build,
+                            report,
+                            parent_ids.get(index) in changed_builds,
+                            completed,
+                            included_statuses,
+                            excerpt_lines,
+                        )
+                        for index, (build, report) in enumerate(watched)
+                        if not is_finished(report)
+                    )
+                )
+
+
+async def _watch_master(
+    base_url: str,
+    scheduler: RequestScheduler,
+    watched: Watched,
+    included_statuses: set[BuildStatus],
+    sleep: Callable[[float], Awaitable[None]],
+    excerpt_lines: int = 0,
+) -> None:
+    """Watch the builds of one master through events, or poll if that fails"""
+    try:
+        await _watch_events(
+            base_url, scheduler, watched, included_statuses, excerpt_lines
+        )
+    except BuildbotAPIError as e:
+        logger.debug(f"Event stream of {base_url} failed: {e}")
+        remaining = _unfinished(watched)
+        if not remaining:
+            return
+        print(
+            f"{_timestamp()} {colorize('No Buildbot events', Colors.YELLOW)} from "
+            f"{base_url}, polling instead"
+        )
+        await _poll_until_finished(
+            scheduler, remaining, included_statuses, sleep, excerpt_lines
+        )
+
+
+async def watch_builds(
+    builds: list[BuildWithTriggers],
+    reports: list[BuildStatusReport],
+    scheduler: RequestScheduler,
+    included_statuses: set[BuildStatus],
+    sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    excerpt_lines: int = 0,
+    use_events: bool = False,
+) -> None:
+    """Follow builds until every parent and triggered build has finished.
+
+    With use_events, each Buildbot master's websocket events drive the
+    updates, falling back to polling for masters where it is unavailable.
+    The reports are updated in place, so the caller can derive the final
+    exit code from them.
+    """
+    watched = [
+        (build, report)
+        for build, report in zip(builds, reports, strict=True)
+        if not is_finished(report)
+    ]
+    if not watched:
+        return
+
+    incomplete = sum(len(report.incomplete) for _, report in watched)
+    print(
+        f"\n{colorize('👀 Watching', Colors.CYAN)} {len(watched)} running build(s) "
+        f"with {colorize(str(incomplete), Colors.BOLD)} incomplete triggered builds"
+    )
+
+    if use_events:
+        by_master: dict[str, Watched] = {}
+        for build, report in watched:
+            by_master.setdefault(build.base_url, []).append((build, report))
+        await asyncio.gather(
+            *(
+                _watch_master(
+                    base_url,
+                    scheduler,
+                    master_watched,
+                    included_statuses,
+                    sleep,
+                    excerpt_lines,
+                )
+                for base_url, master_watched in by_master.items()
+            )
+        )
+    else:
+        await _poll_until_finished(
+            scheduler, watched, included_statuses, sleep, excerpt_lines
+        )
+
+    print(f"\n{colorize('🏁 All builds finished', Colors.BOLD)}")
+    for build, report in zip(builds, reports, strict=True):
+        print_build_header(build)
+        print_build_summary(report)
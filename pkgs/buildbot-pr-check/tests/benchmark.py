@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""Benchmark check_pr against the local fake Buildbot/GitHub/Gitea server.
+
+Runs every cassette and synthetic pull requests of several sizes through
+check_pr and reports wall time, request count and peak concurrency, so
+performance changes can be measured without network access:
+
+    python tests/benchmark.py --latency 0.05 --jitter 0.02
+    python tests/benchmark.py --sizes 10,1000 --failed 5 --repeat 5
+    python tests/benchmark.py --jitter 0.04 --hedge
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_server import FakeServer, SyntheticPR
+
+import buildbot_pr_check
+
+CASSETTE_DIR = Path(__file__).parent / "cassettes"
+# PR URL each cassette was recorded for
+CASSETTES = {
+    "github_pr_parent_build_failure": "https://github.com/Mic92/dotfiles/pull/3016",
+    "github_pr_3016_eval_error": "https://github.com/Mic92/dotfiles/pull/3016",
+    "gitea_pr_success": "https://git.clan.lol/clan/clan-core/pulls/4235",
+}
+DEFAULT_SIZES = [10, 100, 1000]
+
+
+@dataclass
+class Scenario:
+    """A pull request served by a fake server"""
+
+    name: str
+    pr_url: str
+    setup: Callable[[FakeServer], None]
+
+
+@dataclass
+class Result:
+    """Measurements of one scenario over all repetitions"""
+
+    name: str
+    exit_code: int
+    wall_times: list[float]
+    requests: int
+    errors: int
+    max_in_flight: int
+
+
+def cassette_scenarios() -> list[Scenario]:
+    """A scenario per recorded cassette"""
+
+    def replay(path: Path) -> Callable[[FakeServer], None]:
+        return lambda server: server.add_cassette(path)
+
+    return [
+        Scenario(name, pr_url, replay(CASSETTE_DIR / f"{name}.yaml"))
+        for name, pr_url in CASSETTES.items()
+    ]
+
+
+def synthetic_scenarios(
+    sizes: list[int], failed: int, pending: int, forge: str
+) -> list[Scenario]:
+    """A scenario per synthetic pull request size"""
+    scenarios = []
+    for size in sizes:
+        pr = SyntheticPR(
+            sub_builds=size,
+            failed=min(failed, size),
+            pending=min(pending, max(0, size - failed)),
+            forge=forge,
+        )
+        scenarios.append(Scenario(f"synthetic-{size}", pr.pr_url, pr.install))
+    return scenarios
+
+
+def run_scenario(
+    scenario: Scenario,
+    repeat: int = 1,
+    latency: float = 0.0,
+    jitter: float = 0.0,
+    error_rate: float = 0.0,
+    use_cache: bool = False,
+    hedge: bool = False,
+) -> Result:
+    """Run check_pr for a scenario `repeat` times against a fresh fake server."""
+    wall_times = []
+    exit_code = 0
+    with FakeServer(latency, jitter, error_rate) as server:
+        scenario.setup(server)
+        for _ in range(repeat):
+            with server.routed(), contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                try:
+                    exit_code = buildbot_pr_check.check_pr(
+                        scenario.pr_url, use_cache=use_cache, hedge=hedge
+                    )
+                except SystemExit as e:
+                    exit_code = int(e.code or 0)
+                wall_times.append(time.perf_counter() - start)
+        return Result(
+            scenario.name,
+            exit_code,
+            wall_times,
+            # Average per run; with --cache later runs send fewer
+            round(server.total_requests / repeat),
+            server.errors,
+            server.max_in_flight,
+        )
+
+
+def print_results(results: list[Result]) -> None:
+    """Print one row per scenario"""
+    print(
+        f"{'Scenario':<34} {'Exit':>4} {'median':>8} {'min':>8} "
+        f"{'Requests':>8} {'Errors':>6} {'Peak':>4}"
+    )
+    for result in results:
+        print(
+            f"{result.name:<34} {result.exit_code:>4} "
+            f"{statistics.median(result.wall_times):>7.3f}s "
+            f"{min(result.wall_times):>7.3f}s "
+            f"{result.requests:>8} {result.errors:>6} {result.max_in_flight:>4}"
+        )
+
+
+def main() -> int:
+    """Run the benchmarks."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--latency", type=float, default=0.02, help="Seconds per response"
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0.0, help="Random +/- seconds per response"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="Fraction of injected errors"
+    )
+    parser.add_argument(
+        "--sizes",
+        default=",".join(map(str, DEFAULT_SIZES)),
+        help="Comma-separated sub-build counts of the synthetic PRs",
+    )
+    parser.add_argument(
+        "--failed", type=int, default=3, help="Failed sub-builds per synthetic PR"
+    )
+    parser.add_argument(
+        "--pending", type=int, default=0, help="Running sub-builds per synthetic PR"
+    )
+    parser.add_argument("--forge", choices=["github", "gitea"], default="github")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per scenario")
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Use the response cache (in a temporary directory) between runs",
+    )
+    parser.add_argument(
+        "--hedge", action="store_true", help="Duplicate requests slower than p95"
+    )
+    parser.add_argument(
+        "--no-cassettes", action="store_true", help="Only run synthetic PRs"
+    )
+    args = parser.parse_args()
+
+    # Never touch the user's real response cache
+    os.environ["XDG_CACHE_HOME"] = tempfile.mkdtemp(prefix="buildbot-pr-check-")
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    scenarios = [] if args.no_cassettes else cassette_scenarios()
+    scenarios += synthetic_scenarios(sizes, args.failed, args.pending, args.forge)
+
+    print(
+        f"latency={args.latency}s jitter={args.jitter}s "
+        f"error_rate={args.error_rate} repeat={args.repeat} hedge={args.hedge}"
+    )
+    results = [
+        run_scenario(
+            scenario,
+            args.repeat,
+            args.latency,
+            args.jitter,
+            args.error_rate,
+            args.cache,
+            args.hedge,
+        )
+        for scenario in scenarios
+    ]
+    print_results(results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,6 +4,8 @@ import os
 import sys
 from pathlib import Path
 
+import pytest
+
 # Skip tests when vcrpy is not installed (e.g. outside nix develop)
 try:
     import vcr  # noqa: F401
@@ -13,6 +15,9 @@ except ImportError:
 # Add parent directory to Python path so we can import the module
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from buildbot_pr_check import github_api, http_client, scheduler
+from buildbot_pr_check.http_client import close_client
+
 
 def pytest_configure(config):
     """Configure pytest."""
@@ -20,3 +25,30 @@ def pytest_configure(config):
     # unless explicitly testing with tokens
     if "GITHUB_TOKEN" in os.environ and not os.environ.get("PYTEST_USE_REAL_TOKEN"):
         del os.environ["GITHUB_TOKEN"]
+
+
+@pytest.fixture(autouse=True)
+def _fresh_http_client(monkeypatch):
+    """Drop pooled connections so they never outlive a test's cassette."""
+    # Rate limit state from one test must not slow down the next
+    monkeypatch.setattr(github_api, "_github_client", None)
+    yield
+    close_client()
+
+
+@pytest.fixture(autouse=True)
+def _serial_scheduler(monkeypatch):
+    """Run scheduled API calls one at a time; cassette replay is not thread-safe."""
+    monkeypatch.setattr(scheduler, "MAX_SCHEDULER_THREADS", 1)
+
+
+@pytest.fixture(autouse=True)
+def _fast_retries(monkeypatch):
+    """Retry failed requests without backing off, to keep tests fast."""
+    monkeypatch.setattr(http_client, "RETRY_BACKOFF", 0)
+
+
+@pytest.fixture(autouse=True)
+def _isolated_cache_dir(monkeypatch, tmp_path):
+    """Keep the response cache out of the user's real cache directory."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
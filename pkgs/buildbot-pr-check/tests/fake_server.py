@@ -0,0 +1,771 @@
+"""Local stand-in for the Buildbot, GitHub and Gitea APIs.
+
+FakeServer is an in-process HTTP server that answers for any host. Its
+responses come from VCR cassettes (add_cassette) and/or a SyntheticPR,
+which generates a parent build with any number of triggered sub-builds.
+Every response can be delayed (latency +/- jitter) and a fraction of them
+replaced by errors, so concurrency behaviour can be measured offline.
+
+Inside FakeServer.routed() the shared HTTP client sends every request to
+the server instead of the real host, keeping the original Host header.
+Event streams connect to it as well: /ws is a websocket stand-in that
+answers Buildbot's startConsuming and ping commands and delivers whatever
+FakeServer.publish() sends to the clients whose subscriptions match.
+"""
+
+import asyncio
+import base64
+import functools
+import hashlib
+import json
+import random
+import socket
+import struct
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Self
+
+import yaml
+
+from buildbot_pr_check import events, http_client
+from buildbot_pr_check.http_client import HTTPClient, Response, _HostPool
+from buildbot_pr_check.profiling import endpoint_template
+
+
+@dataclass
+class FakeResponse:
+    """A canned response"""
+
+    status: int
+    body: bytes
+    headers: dict[str, str]
+
+
+def json_response(data: Any, status: int = 200) -> FakeResponse:
+    """Build a JSON response"""
+    return FakeResponse(
+        status, json.dumps(data).encode(), {"Content-Type": "application/json"}
+    )
+
+
+# A handler gets (host, path, query params) and returns a response or None
+Handler = Callable[[str, str, list[tuple[str, str]]], FakeResponse | None]
+
+# Hop-by-hop headers from recordings that don't apply to a replayed body
+_DROPPED_HEADERS = {"connection", "transfer-encoding", "content-length"}
+_WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+# Query parameters that only narrow a response down: field= and property=
+# select attributes and build request properties, per_page the page size.
+# The cassettes were recorded without them (property=* asked for all), so
+# a recorded reply holds everything the narrowed request reads.
+NARROWING_PARAMS = {"field", "property", "per_page"}
+
+
+@functools.cache
+def recorded_uri(uri: str) -> str:
+    """The URI a request was recorded under, without narrowing parameters"""
+    parsed = urllib.parse.urlsplit(uri)
+    query = [
+        (key, value)
+        for key, value in urllib.parse.parse_qsl(parsed.query)
+        if key not in NARROWING_PARAMS
+    ]
+    return parsed._replace(query=urllib.parse.urlencode(query)).geturl()
+
+
+class FakeServer:
+    """Threaded loopback HTTP server serving canned and generated responses.
+
+    Args:
+        latency: Seconds every response is delayed by
+        jitter: Up to this many seconds are randomly added or removed
+        error_rate: Fraction of requests answered with error_status instead
+        error_status: HTTP status of injected errors
+        seed: Seed for jitter and error injection, so runs are repeatable
+        websocket: Accept event stream connections on /ws
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        seed: int = 0,
+        websocket: bool = True,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.websocket = websocket
+        self.websocket_clients: list[_WebSocketClient] = []
+        self.published = 0
+        self.routes: dict[tuple[str, str], FakeResponse] = {}
+        self.recordings: dict[str, FakeResponse] = {}
+        self.handlers: list[Handler] = []
+        self.requests: Counter[str] = Counter()
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._subscribed = threading.Condition(self._lock)
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(self))
+        self._httpd.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def address(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"{host!s}:{port}"
+
+    @property
+    def total_requests(self) -> int:
+        return sum(self.requests.values())
+
+    def add_route(self, url: str, response: FakeResponse) -> None:
+        """Serve response for exactly this URL (host, path and query)."""
+        parsed = urllib.parse.urlsplit(url)
+        target = parsed.path + (f"?{parsed.query}" if parsed.query else "")
+        self.routes[(parsed.netloc, target)] = response
+
+    def add_handler(self, handler: Handler) -> None:
+        """Answer requests without an exact route with handler."""
+        self.handlers.append(handler)
+
+    def add_cassette(self, path: Path) -> None:
+        """Serve every interaction recorded in a VCR cassette.
+
+        Requests are matched to recordings by recorded_uri. A URL recorded
+        more than once is answered with its first recording. Nothing answers
+        the bulk buildrequestid__in queries, which were never recorded, so
+        checks fall back to looking build requests up one by one.
+        """
+        cassette = yaml.safe_load(path.read_text())
+        # Add the first recording of a URL last, so it is the one served
+        for interaction in reversed(cassette["interactions"]):
+            response = interaction["response"]
+            body = response["body"]["string"]
+            headers = {
+                name: values[0]
+                for name, values in response["headers"].items()
+                if name.lower() not in _DROPPED_HEADERS
+            }
+            self.recordings[recorded_uri(interaction["request"]["uri"])] = FakeResponse(
+                response["status"]["code"],
+                body.encode() if isinstance(body, str) else body,
+                headers,
+            )
+
+    def reset_counters(self) -> None:
+        """Forget the requests counted so far."""
+        with self._lock:
+            self.requests.clear()
+            self.errors = 0
+            self.max_in_flight = 0
+
+    def respond(self, host: str, target: str) -> FakeResponse:
+        """Find the response for a request, applying delay and error injection."""
+        with self._lock:
+            self.requests[endpoint_template(f"http://{host}{target}")] += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            delay = self.latency + self._random.uniform(-self.jitter, self.jitter)
+            fail = self._random.random() < self.error_rate
+        try:
+            if delay > 0:
+                time.sleep(delay)
+            if fail:
+                with self._lock:
+                    self.errors += 1
+                return json_response(
+                    {"error": "injected failure"}, status=self.error_status
+                )
+            response = self.routes.get((host, target))
+            if response is None:
+                response = self.recordings.get(recorded_uri(f"https://{host}{target}"))
+            if response is None:
+                parsed = urllib.parse.urlsplit(target)
+                query = urllib.parse.parse_qsl(parsed.query)
+                for handler in self.handlers:
+                    response = handler(host, parsed.path, query)
+                    if response is not None:
+                        break
+            if response is None:
+                return json_response(
+                    {"error": f"no route for {host}{target}"}, status=404
+                )
+            return response
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def publish(self, key: str, data: dict[str, Any]) -> None:
+        """Send an event to every websocket client subscribed to its key."""
+        with self._lock:
+            clients = list(self.websocket_clients)
+        for client in clients:
+            if client.subscribed_to(key):
+                with self._lock:
+                    self.published += 1
+                client.send_json({"k": key, "m": data})
+
+    def subscriptions(self) -> list[str]:
+        """Paths subscribed to by all connected websocket clients"""
+        with self._lock:
+            return [path for client in self.websocket_clients for path in client.paths]
+
+    def wait_for_subscription(self, path: str, timeout: float = 10.0) -> None:
+        """Block until a websocket client subscribed to path."""
+        with self._subscribed:
+            if not self._subscribed.wait_for(
+                lambda: any(path in client.paths for client in self.websocket_clients),
+                timeout,
+            ):
+                raise TimeoutError(f"Nobody subscribed to {path}")
+
+    def close_websockets(self) -> None:
+        """Drop every websocket connection, like a restarting master."""
+        with self._lock:
+            clients = list(self.websocket_clients)
+        for client in clients:
+            client.close()
+
+    def start(self) -> None:
+        """Serve requests on a background thread."""
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, name="fake-server", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop serving and close the listening socket."""
+        self.close_websockets()
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> Self:
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.stop()
+
+    @contextmanager
+    def routed(self) -> Iterator[HTTPClient]:
+        """Send all requests of the shared HTTP client to this server."""
+        http_client.close_client()
+        client = _LoopbackClient(self.address)
+        with http_client._default_client_lock:
+            http_client._default_client = client
+        events.set_connector(self._connect_event_stream)
+        try:
+            yield client
+        finally:
+            events.set_connector(None)
+            http_client.close_client()
+
+    async def _connect_event_stream(
+        self, base_url: str
+    ) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        host, port = self._httpd.server_address[:2]
+        return await asyncio.open_connection(str(host), int(port))
+
+    def _add_websocket_client(self, client: "_WebSocketClient") -> None:
+        with self._lock:
+            self.websocket_clients.append(client)
+
+    def _remove_websocket_client(self, client: "_WebSocketClient") -> None:
+        with self._lock:
+            if client in self.websocket_clients:
+                self.websocket_clients.remove(client)
+
+    def _subscription_added(self) -> None:
+        with self._subscribed:
+            self._subscribed.notify_all()
+
+
+class _WebSocketClient:
+    """Server side of one websocket connection to the /ws stand-in"""
+
+    def __init__(self, connection: socket.socket, rfile: Any, wfile: Any):
+        self.connection = connection
+        self.rfile = rfile
+        self.wfile = wfile
+        self.paths: list[str] = []
+        self._write_lock = threading.Lock()
+
+    def subscribed_to(self, key: str) -> bool:
+        segments = key.split("/")
+        for path in self.paths:
+            pattern = path.split("/")
+            if len(pattern) == len(segments) and all(
+                p in ("*", s) for p, s in zip(pattern, segments, strict=True)
+            ):
+                return True
+        return False
+
+    def send_json(self, message: dict[str, Any]) -> None:
+        payload = json.dumps(message).encode()
+        # Server frames are final, unmasked text frames
+        if len(payload) < 126:
+            header = struct.pack("!BB", 0x81, len(payload))
+        elif len(payload) < 1 << 16:
+            header = struct.pack("!BBH", 0x81, 126, len(payload))
+        else:
+            header = struct.pack("!BBQ", 0x81, 127, len(payload))
+        try:
+            with self._write_lock:
+                self.wfile.write(header + payload)
+                self.wfile.flush()
+        except OSError:
+            pass
+
+    def read_message(self) -> dict[str, Any] | None:
+        """Read the next client text message, None once the connection ends."""
+        header = self.rfile.read(2)
+        if len(header) < 2:
+            return None
+        opcode, length = header[0] & 0x0F, header[1] & 0x7F
+        if length == 126:
+            (length,) = struct.unpack("!H", self.rfile.read(2))
+        elif length == 127:
+            (length,) = struct.unpack("!Q", self.rfile.read(8))
+        mask = self.rfile.read(4)
+        data = bytes(
+            byte ^ mask[index % 4] for index, byte in enumerate(self.rfile.read(length))
+        )
+        if opcode == 0x8:
+            return None
+        return json.loads(data)
+
+    def close(self) -> None:
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class _LoopbackClient(HTTPClient):
+    """HTTPClient whose per-host pools all connect to one local address"""
+
+    def __init__(self, address: str):
+        super().__init__()
+        self.address = address
+
+    def _pool_for(self, scheme: str, netloc: str) -> _HostPool:
+        # Keep one pool per original host, so per-host limits still apply
+        with self._lock:
+            pool = self._pools.get((scheme, netloc))
+            if pool is None:
+                pool = _HostPool(
+                    "http", self.address, self.max_connections_per_host, self.timeout
+                )
+                self._pools[(scheme, netloc)] = pool
+            return pool
+
+    def _send(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str],
+        body: bytes | None,
+        timeout: float,
+    ) -> Response:
+        host = urllib.parse.urlsplit(url).netloc
+        return super()._send(method, url, {**headers, "Host": host}, body, timeout)
+
+
+def _make_handler(server: FakeServer) -> type[BaseHTTPRequestHandler]:
+    class _RequestHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body are written separately; don't wait for delayed ACKs
+        disable_nagle_algorithm = True
+
+        def _serve_websocket(self) -> None:
+            host = self.headers.get("Host", "")
+            with server._lock:
+                server.requests[endpoint_template(f"http://{host}/ws")] += 1
+            accept = base64.b64encode(
+                hashlib.sha1(
+                    (self.headers["Sec-WebSocket-Key"] + _WEBSOCKET_GUID).encode()
+                ).digest()
+            ).decode()
+            self.send_response(101)
+            self.send_header("Upgrade", "websocket")
+            self.send_header("Connection", "Upgrade")
+            self.send_header("Sec-WebSocket-Accept", accept)
+            self.end_headers()
+            self.wfile.flush()
+
+            client = _WebSocketClient(self.connection, self.rfile, self.wfile)
+            server._add_websocket_client(client)
+            try:
+                while (message := client.read_message()) is not None:
+                    reply: dict[str, Any] = {"_id": message.get("_id"), "code": 200}
+                    if message.get("cmd") == "startConsuming":
+                        client.paths.append(message["path"])
+                        server._subscription_added()
+                        reply["msg"] = "OK"
+                    elif message.get("cmd") == "ping":
+                        reply["msg"] = "pong"
+                    else:
+                        reply.update(code=404, msg="unknown command")
+                    client.send_json(reply)
+            except (OSError, ValueError):
+                pass
+            finally:
+                server._remove_websocket_client(client)
+                self.close_connection = True
+
+        def _serve(self) -> None:
+            if (
+                server.websocket
+                and self.path == "/ws"
+                and self.headers.get("Upgrade", "").lower() == "websocket"
+            ):
+                self._serve_websocket()
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                self.rfile.read(length)
+            response = server.respond(self.headers.get("Host", ""), self.path)
+            self.send_response(response.status)
+            for name, value in response.headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(response.body)))
+            self.end_headers()
+            self.wfile.write(response.body)
+
+        do_GET = _serve
+        do_POST = _serve
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    return _RequestHandler
+
+
+@dataclass
+class SyntheticPR:
+    """A generated pull request whose parent build triggered many sub-builds.
+
+    The first `failed` sub-builds fail, the next `pending` ones are still
+    running and the rest succeed. Of the running ones, the first `started`
+    have a build whose second step is in progress; the others are queued.
+    Every sub-build with a build has two steps with one stdio log of
+    `log_lines` lines each; raising it makes running logs grow. Failed
+    sub-builds fail their second step. With `failing_derivations`, the log of the n-th failed
+    sub-build ends with Nix's error for derivation n modulo their count.
+    """
+
+    sub_builds: int
+    failed: int = 0
+    pending: int = 0
+    started: int = 0
+    log_lines: int = 3
+    forge: str = "github"
+    buildbot_host: str = "buildbot.example.org"
+    forge_host: str = "git.example.org"
+    first_request_id: int = 1000
+    head_sha: str = "0123456789abcdef0123456789abcdef01234567"
+    failing_derivations: list[str] = field(default_factory=list)
+    # Results of running sub-builds that were finished with finish()
+    finished: dict[int, int] = field(default_factory=dict)
+
+    BUILDER_ID = 7
+    BUILD_NUM = 42
+    # Offsets that keep generated build, step and log IDs apart
+    BUILD_ID_OFFSET = 100_000
+    STEP_ID_OFFSET = 1_000_000
+    LOG_ID_OFFSET = 10_000_000
+
+    @property
+    def pr_url(self) -> str:
+        if self.forge == "github":
+            return "https://github.com/example/repo/pull/1"
+        return f"https://{self.forge_host}/example/repo/pulls/1"
+
+    @property
+    def build_url(self) -> str:
+        return f"https://{self.buildbot_host}/#/builders/{self.BUILDER_ID}/builds/{self.BUILD_NUM}"
+
+    @property
+    def request_ids(self) -> list[int]:
+        return list(
+            range(self.first_request_id, self.first_request_id + self.sub_builds)
+        )
+
+    def result(self, request_id: int) -> int | None:
+        """Buildbot result code of a sub-build, None while it is running"""
+        if request_id in self.finished:
+            return self.finished[request_id]
+        index = request_id - self.first_request_id
+        if index < self.failed:
+            return 2
+        if index < self.failed + self.pending:
+            return None
+        return 0
+
+    def has_build(self, request_id: int) -> bool:
+        """Whether a sub-build has started a build"""
+        index = request_id - self.first_request_id
+        return self.result(request_id) is not None or (
+            self.failed <= index < self.failed + self.started
+        )
+
+    def finish(self, server: FakeServer, request_id: int, result: int = 0) -> None:
+        """Finish a running sub-build and publish the events Buildbot would."""
+        self.finished[request_id] = result
+        build = self._build(request_id)
+        server.publish(f"builds/{build['buildid']}/finished", build)
+        server.publish(
+            f"buildrequests/{request_id}/complete", self._build_request(request_id)
+        )
+        if self._parent_complete():
+            parent = self._parent_build()
+            server.publish(f"builds/{parent['buildid']}/finished", parent)
+
+    def install(self, server: FakeServer) -> None:
+        """Add this pull request's routes to a server."""
+        self._add_forge_routes(server)
+        server.add_handler(self._handle_buildbot)
+
+    def _add_forge_routes(self, server: FakeServer) -> None:
+        if self.forge == "github":
+            api = "https://api.github.com/repos/example/repo"
+            server.add_route(
+                f"{api}/pulls/1", json_response({"head": {"sha": self.head_sha}})
+            )
+            server.add_route(
+                f"{api}/commits/{self.head_sha}/check-runs?per_page=100",
+                json_response(
+                    {
+                        "check_runs": [
+                            {
+                                "name": "buildbot/nix-eval",
+                                "details_url": self.build_url,
+                                "app": {"name": "buildbot"},
+                            }
+                        ]
+                    }
+                ),
+            )
+            server.add_route(
+                f"{api}/commits/{self.head_sha}/status",
+                json_response({"statuses": []}),
+            )
+        else:
+            api = f"https://{self.forge_host}/api/v1/repos/example/repo"
+            server.add_route(
+                f"{api}/pulls/1", json_response({"head": {"sha": self.head_sha}})
+            )
+            server.add_route(
+                f"{api}/statuses/{self.head_sha}",
+                json_response(
+                    [{"context": "buildbot/nix-eval", "target_url": self.build_url}]
+                ),
+            )
+
+    def _parent_complete(self) -> bool:
+        first_pending = self.first_request_id + self.failed
+        return all(
+            rid in self.finished
+            for rid in range(first_pending, first_pending + self.pending)
+        )
+
+    def _parent_build(self) -> dict[str, Any]:
+        complete = self._parent_complete()
+        failed = self.failed or any(result >= 2 for result in self.finished.values())
+        results = (2 if failed else 0) if complete else None
+        return {
+            "buildid": self.BUILD_ID_OFFSET,
+            "builderid": self.BUILDER_ID,
+            "number": self.BUILD_NUM,
+            "complete": complete,
+            "results": results,
+        }
+
+    def _parent_steps(self) -> list[dict[str, Any]]:
+        parent = self._parent_build()
+        return [
+            {
+                "stepid": self.STEP_ID_OFFSET,
+                "buildid": parent["buildid"],
+                "name": "build flake",
+                "complete": parent["complete"],
+                "results": parent["results"],
+                "urls": [
+                    {
+                        "name": f"check-{request_id}",
+                        "url": f"https://{self.buildbot_host}/#/buildrequests/{request_id}",
+                    }
+                    for request_id in self.request_ids
+                ],
+            }
+        ]
+
+    def _build_request(self, request_id: int) -> dict[str, Any]:
+        result = self.result(request_id)
+        return {
+            "buildrequestid": request_id,
+            "complete": result is not None,
+            "results": result,
+            "properties": {
+                "virtual_builder_name": [
+                    f"nix-build#checks.x86_64-linux.check-{request_id}",
+                    "buildrequest",
+                ]
+            },
+        }
+
+    def _build(self, request_id: int) -> dict[str, Any]:
+        result = self.result(request_id)
+        return {
+            "buildid": self.BUILD_ID_OFFSET + request_id,
+            "buildrequestid": request_id,
+            "complete": result is not None,
+            "results": result,
+        }
+
+    def _build_steps(self, build_id: int) -> list[dict[str, Any]]:
+        result = self.result(build_id - self.BUILD_ID_OFFSET)
+        return [
+            {
+                "stepid": self.STEP_ID_OFFSET + build_id * 2 + index,
+                "buildid": build_id,
+                "name": name,
+                "complete": index == 0 or result is not None,
+                "results": 0 if index == 0 else result,
+                "state_string": (
+                    "done" if index == 0 or result is not None else "building"
+                ),
+            }
+            for index, name in enumerate(["Evaluate", "Build flake attr"])
+        ]
+
+    def _step_logs(self, step_id: int) -> list[dict[str, Any]]:
+        build_id, index = divmod(step_id - self.STEP_ID_OFFSET, 2)
+        running = index == 1 and self.result(build_id - self.BUILD_ID_OFFSET) is None
+        return [
+            {
+                "logid": self.LOG_ID_OFFSET + step_id,
+                "stepid": step_id,
+                "name": "stdio",
+                "type": "s",
+                "complete": not running,
+                "num_lines": self.log_lines,
+            }
+        ]
+
+    def _failing_derivation(self, log_id: int) -> str | None:
+        """Derivation whose failure ends the log, if it belongs to a failed step"""
+        build_id, index = divmod(log_id - self.LOG_ID_OFFSET - self.STEP_ID_OFFSET, 2)
+        failed_index = build_id - self.BUILD_ID_OFFSET - self.first_request_id
+        if not self.failing_derivations or index != 1:
+            return None
+        if not 0 <= failed_index < self.failed:
+            return None
+        return self.failing_derivations[failed_index % len(self.failing_derivations)]
+
+    def _log_line(self, log_id: int, number: int) -> str:
+        if number == self.log_lines:
+            drv = self._failing_derivation(log_id)
+            if drv is not None:
+                return f"error: builder for '{drv}' failed with exit code 1;"
+        return f"line {number} of log {log_id}"
+
+    def _log_text(self, log_id: int) -> str:
+        return "".join(
+            f"{self._log_line(log_id, n)}\n" for n in range(1, self.log_lines + 1)
+        )
+
+    def _log_contents(self, log_id: int, offset: int, limit: int) -> dict[str, Any]:
+        # Stream logs prefix each line with its stream, "o" for stdout
+        end = min(offset + limit, self.log_lines)
+        content = "".join(
+            f"o{self._log_line(log_id, n + 1)}\n" for n in range(offset, end)
+        )
+        return {
+            "logchunks": [{"logid": log_id, "firstline": offset, "content": content}]
+        }
+
+    def _handle_buildbot(
+        self, host: str, path: str, query: list[tuple[str, str]]
+    ) -> FakeResponse | None:
+        if host != self.buildbot_host or not path.startswith("/api/v2/"):
+            return None
+        parts = path.removeprefix("/api/v2/").split("/")
+        parent = ["builders", str(self.BUILDER_ID), "builds", str(self.BUILD_NUM)]
+
+        if parts == parent:
+            return json_response({"builds": [self._parent_build()]})
+        if parts == [*parent, "steps"]:
+            return json_response({"steps": self._parent_steps()})
+        if parts == [*parent, "properties"]:
+            return json_response({"properties": [{}]})
+
+        known = set(self.request_ids)
+        if parts == ["buildrequests"]:
+            ids = [int(value) for key, value in query if key == "buildrequestid__in"]
+            return json_response(
+                {
+                    "buildrequests": [
+                        self._build_request(rid) for rid in ids if rid in known
+                    ]
+                }
+            )
+        if parts == ["builds"]:
+            ids = [int(value) for key, value in query if key == "buildrequestid__in"]
+            return json_response(
+                {
+                    "builds": [
+                        self._build(rid)
+                        for rid in sorted(ids)
+                        if rid in known and self.has_build(rid)
+                    ]
+                }
+            )
+        if len(parts) >= 2 and parts[0] == "buildrequests" and parts[1].isdigit():
+            request_id = int(parts[1])
+            if request_id not in known:
+                return None
+            if parts[2:] == []:
+                return json_response(
+                    {"buildrequests": [self._build_request(request_id)]}
+                )
+            if parts[2:] == ["builds"]:
+                started = self.has_build(request_id)
+                return json_response(
+                    {"builds": [self._build(request_id)] if started else []}
+                )
+        if len(parts) == 3 and parts[0] == "builds" and parts[2] == "steps":
+            return json_response({"steps": self._build_steps(int(parts[1]))})
+        if len(parts) == 3 and parts[0] == "steps" and parts[2] == "logs":
+            return json_response({"logs": self._step_logs(int(parts[1]))})
+        if len(parts) == 3 and parts[0] == "logs" and parts[2] == "contents":
+            params = dict(query)
+            return json_response(
+                self._log_contents(
+                    int(parts[1]),
+                    int(params.get("offset", 0)),
+                    int(params.get("limit", self.log_lines)),
+                )
+            )
+        if len(parts) == 3 and parts[0] == "logs" and parts[2] == "raw_inline":
+            return FakeResponse(
+                200,
+                self._log_text(int(parts[1])).encode(),
+                {"Content-Type": "text/plain"},
+            )
+        return None
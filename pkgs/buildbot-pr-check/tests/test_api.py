@@ -0,0 +1,199 @@
+"""Tests for the structured library API, against the local fake server."""
+
+from fake_server import FakeServer, SyntheticPR, json_response
+
+import buildbot_pr_check
+from buildbot_pr_check import api, buildbot_api
+from buildbot_pr_check.build_status import BuildStatus
+from buildbot_pr_check.cache import ResponseCache
+from buildbot_pr_check.http_client import memoize_requests, use_response_cache
+
+
+def test_check_builds_returns_typed_results(capsys):
+    pr = SyntheticPR(sub_builds=5, failed=1, pending=1)
+    with FakeServer() as server:
+        pr.install(server)
+        with server.routed():
+            (result,) = buildbot_pr_check.check_builds(
+                [pr.build_url, "https://github.com/example/repo/actions/runs/1"]
+            )
+
+    # Nothing is printed, everything is in the result
+    assert capsys.readouterr().out == ""
+    assert result.url == pr.build_url
+    assert result.failed
+    assert not result.complete
+    assert result.parent_status is None
+    assert [sub_build.request_id for sub_build in result.sub_builds] == pr.request_ids
+    failed, running, *passed = result.sub_builds
+    assert failed.name == "checks.x86_64-linux.check-1000"
+    assert failed.status == BuildStatus.FAILURE
+    assert [log.step_name for log in failed.log_urls] == ["Build flake attr"]
+    assert running.status is None and not running.complete
+    assert all(sub_build.status == BuildStatus.SUCCESS for sub_build in passed)
+    assert all(not sub_build.log_urls for sub_build in passed)
+
+
+def test_get_sub_builds_reports_active_steps():
+    pr = SyntheticPR(sub_builds=4, pending=2, started=1, log_lines=50)
+    with FakeServer() as server:
+        pr.install(server)
+        with server.routed(), memoize_requests():
+            sub_builds = buildbot_pr_check.get_sub_builds(
+                pr.buildbot_host, pr.request_ids, with_active_steps=True
+            )
+
+    running, queued, *passed = sub_builds
+    assert running.build_id == SyntheticPR.BUILD_ID_OFFSET + 1000
+    assert running.active_step is not None
+    assert running.active_step.name == "Build flake attr"
+    assert running.active_step.state == "building"
+    # Only the tail of the running step's log is read
+    assert len(running.active_step.log_tail) == 30
+    assert running.active_step.log_tail[-1].startswith("line 50 of log")
+    assert queued.queued and queued.active_step is None
+    assert all(sub_build.complete for sub_build in passed)
+    # Bulk queries for the requests, the finished and the running builds,
+    # then steps, logs and log tail of the one running build
+    assert server.requests == {
+        "buildbot.example.org/api/v2/buildrequests?buildrequestid__in&field&property": 1,
+        "buildbot.example.org/api/v2/builds?buildrequestid__in&field&order": 2,
+        "buildbot.example.org/api/v2/builds/{id}/steps?field": 1,
+        "buildbot.example.org/api/v2/steps/{id}/logs?field": 1,
+        "buildbot.example.org/api/v2/logs/{id}/contents?field&limit&offset": 1,
+    }
+
+
+def test_get_sub_builds_without_active_steps():
+    pr = SyntheticPR(sub_builds=3, pending=1, started=1)
+    with FakeServer() as server:
+        pr.install(server)
+        with server.routed():
+            sub_builds = buildbot_pr_check.get_sub_builds(
+                pr.buildbot_host, pr.request_ids
+            )
+
+    assert [sub_build.active_step for sub_build in sub_builds] == [None] * 3
+    # Only the build requests and the builds of the finished ones
+    assert server.total_requests == 2
+
+
+def test_sub_builds_without_virtual_builder_are_named_by_request():
+    status = buildbot_api.BuildRequestStatus(7, None, None, "nix-build#checks.a")
+    assert api._sub_build(7, status).name == "checks.a"
+    assert api._sub_build(7, None).name == "request-7"
+
+
+def test_triggered_builds_progress_follows_the_trigger_step():
+    pr = SyntheticPR(sub_builds=3, pending=1, started=1)
+    parent = (pr.buildbot_host, str(pr.BUILDER_ID), str(pr.BUILD_NUM))
+    with FakeServer() as server:
+        pr.install(server)
+        with server.routed():
+            running = buildbot_api.get_triggered_builds_progress(*parent)
+            pr.finish(server, pr.request_ids[0])
+            finished = buildbot_api.get_triggered_builds_progress(*parent)
+
+    assert running == (pr.request_ids, False)
+    assert finished == (pr.request_ids, True)
+
+
+def test_tracker_follows_running_logs_by_offset():
+    pr = SyntheticPR(sub_builds=2, pending=1, started=1, log_lines=50)
+    tracker = buildbot_pr_check.ActiveStepTracker()
+
+    def poll():
+        server.requests.clear()
+        with server.routed(), memoize_requests():
+            (sub_build,) = buildbot_pr_check.get_sub_builds(
+                pr.buildbot_host,
+                [pr.request_ids[0]],
+                with_active_steps=True,
+                tracker=tracker,
+            )
+        return sub_build.active_step
+
+    with FakeServer() as server:
+        pr.install(server)
+        first = poll()
+        pr.log_lines = 55
+        grown = poll()
+        grown_requests = dict(server.requests)
+        quiet = poll()
+        quiet_requests = dict(server.requests)
+
+    assert first.new_lines == first.log_tail
+    assert len(first.log_tail) == 30
+    # Only the five new lines are read, and the IDs aren't looked up again
+    new_numbers = [int(line.split()[1]) for line in grown.new_lines]
+    assert new_numbers == list(range(51, 56))
+    assert grown.log_tail[-1].startswith("line 55 of log")
+    assert len(grown.log_tail) == 30
+    assert grown_requests == {
+        "buildbot.example.org/api/v2/buildrequests?buildrequestid__in&field&property": 1,
+        "buildbot.example.org/api/v2/logs/{id}/contents?field&limit&offset": 1,
+    }
+    # A log that stopped growing makes the tracker check the steps
+    assert quiet.new_lines == [] and quiet.log_tail == grown.log_tail
+    assert quiet.state == "building"
+    assert quiet_requests["buildbot.example.org/api/v2/builds/{id}/steps?field"] == 1
+    assert len(quiet_requests) == 3
+
+
+def test_tracker_finds_the_build_of_a_retried_request(tmp_path):
+    pr = SyntheticPR(sub_builds=1, pending=1)
+    tracker = buildbot_pr_check.ActiveStepTracker()
+    # Build ID -> complete; the request's first build is retried
+    builds: dict[int, bool] = {}
+
+    def retried_builds(host, path, query):
+        if path == "/api/v2/builds":
+            return json_response(
+                {
+                    "builds": [
+                        {
+                            "buildid": build_id,
+                            "buildrequestid": pr.first_request_id,
+                            "complete": complete,
+                            "results": 4 if complete else None,
+                        }
+                        for build_id, complete in sorted(builds.items())
+                    ]
+                }
+            )
+        if path.startswith("/api/v2/builds/") and path.endswith("/steps"):
+            build_id = int(path.split("/")[4])
+            step = {
+                "stepid": build_id,
+                "name": "Evaluate",
+                "complete": builds[build_id],
+            }
+            return json_response({"steps": [step]})
+        return None
+
+    def poll(changed_builds):
+        builds.update(changed_builds)
+        with server.routed(), memoize_requests():
+            (sub_build,) = buildbot_pr_check.get_sub_builds(
+                pr.buildbot_host,
+                pr.request_ids,
+                with_active_steps=True,
+                tracker=tracker,
+            )
+        return sub_build
+
+    cache = ResponseCache(tmp_path / "cache.sqlite3")
+    with FakeServer() as server, cache, use_response_cache(cache):
+        server.add_handler(retried_builds)
+        pr.install(server)
+        first = poll({1: False})
+        finished = poll({1: True})
+        waiting = poll({})
+        retry = poll({2: False})
+
+    assert first.build_id == 1 and first.active_step is not None
+    # The build finished with RETRY while its request keeps running
+    assert finished.active_step is None
+    assert waiting.build_id is None and waiting.queued
+    assert retry.build_id == 2
+    assert retry.active_step is not None and retry.active_step.name == "Evaluate"
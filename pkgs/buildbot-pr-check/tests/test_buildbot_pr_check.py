@@ -3,22 +3,49 @@
 import sys
 from pathlib import Path
 
+import pytest
 import vcr
+from fake_server import recorded_uri
 
 # Add parent directory to path to import the module
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 import buildbot_pr_check
+from buildbot_pr_check import reporting
+from buildbot_pr_check.exceptions import BuildbotAPIError
+
+
+def _same_recorded_uri(r1, r2):
+    """Match requests to recordings made without field selection"""
+    return recorded_uri(r1.uri) == recorded_uri(r2.uri)
+
 
 # Configure VCR
 vcr_config = vcr.VCR(
     cassette_library_dir="tests/cassettes",
     record_mode="once",  # Change to "new_episodes" to re-record
-    match_on=["uri", "method"],
+    match_on=["recorded_uri", "method"],
     filter_headers=["authorization"],  # Don't record auth tokens
 )
+vcr_config.register_matcher("recorded_uri", _same_recorded_uri)
+
+
+@pytest.fixture
+def _per_request_lookups(monkeypatch):
+    """Check build requests one by one, as they were recorded.
+
+    The cassettes hold the per-request replies of the real masters; bulk
+    buildrequestid__in queries were never recorded. They are tested against
+    the fake server in test_fake_server.py instead.
+    """
 
+    def unrecorded(base_url, request_ids):
+        raise BuildbotAPIError("bulk queries are not in the cassettes")
 
+    monkeypatch.setattr(reporting, "get_build_request_statuses", unrecorded)
+
+
+@pytest.mark.usefixtures("_per_request_lookups")
 class TestIntegration:
     """Integration tests for the two pull requests."""
 
@@ -119,3 +146,144 @@ class TestIntegration:
         assert re.search(log_url_pattern, output), (
             "Should have properly formatted log URLs for eval error"
         )
+
+    def test_repeat_check_uses_response_cache(self, capsys):
+        """Completed build responses are served from disk on the second run."""
+        pr_url = "https://git.clan.lol/clan/clan-core/pulls/4235"
+        for _ in range(2):
+            with vcr_config.use_cassette("gitea_pr_success.yaml"):
+                assert buildbot_pr_check.check_pr(pr_url, profile=True) == 0
+            output = capsys.readouterr().out
+            assert "SUCCESS: 59 builds" in output
+
+        import re
+
+        cache_hits = re.search(r"(\d+) from disk cache", output)
+        assert cache_hits is not None
+        assert int(cache_hits.group(1)) > 0
+
+        with vcr_config.use_cassette("gitea_pr_success.yaml"):
+            assert buildbot_pr_check.check_pr(pr_url, use_cache=False) == 0
+        # The saved requests are only reported with --profile
+        assert "from disk cache" not in capsys.readouterr().out
+        with vcr_config.use_cassette("gitea_pr_success.yaml"):
+            assert (
+                buildbot_pr_check.check_pr(pr_url, use_cache=False, profile=True) == 0
+            )
+        assert "0 from disk cache" in capsys.readouterr().out
+
+    @vcr_config.use_cassette("github_pr_parent_build_failure.yaml")
+    def test_stream_prints_failures_before_summary(self, capsys):
+        """Streamed failures come before the summary and are not repeated."""
+        exit_code = buildbot_pr_check.check_pr(
+            "https://github.com/Mic92/dotfiles/pull/3016", stream=True
+        )
+        assert exit_code == 1
+
+        output = capsys.readouterr().out
+        failure = output.index("checks.x86_64-linux.treefmt: FAILURE")
+        assert failure < output.index("Build Summary:")
+        assert output.count("checks.x86_64-linux.treefmt") == 1
+        assert "Failed builds" not in output
+        assert "Parent build failed: FAILURE" in output
+
+    @vcr_config.use_cassette("gitea_pr_success.yaml")
+    def test_profile_reports_endpoints_and_phases(self, capsys):
+        """Test that --profile prints request stats per endpoint and phase."""
+        exit_code = buildbot_pr_check.check_pr(
+            "https://git.clan.lol/clan/clan-core/pulls/4235", profile=True
+        )
+
+        assert exit_code == 0
+        output = capsys.readouterr().out
+        profile = output[output.index("Profile") :]
+        assert "URL discovery" in profile
+        assert "status" in profile
+        assert "git.clan.lol/api/v1/repos/clan/clan-core/pulls/{id} [200×1]" in profile
+        assert "buildbot.clan.lol/api/v2/builders/{id}/builds/{id}/steps" in profile
+
+    @vcr_config.use_cassette("gitea_pr_success.yaml")
+    def test_batch_ndjson_records(self, capsys):
+        """Batch mode prints one JSON record per PR and triggered build."""
+        import json
+
+        exit_code = buildbot_pr_check.check_prs(
+            [
+                "https://git.clan.lol/clan/clan-core/pulls/4235",
+                "https://example.org/not/a-pr",
+            ]
+        )
+        # The invalid URL is reported as an error and fails the batch
+        assert exit_code == 1
+
+        records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        prs = {r["pr_url"]: r for r in records if r["type"] == "pr"}
+        assert prs["https://example.org/not/a-pr"]["result"] == "error"
+
+        gitea = prs["https://git.clan.lol/clan/clan-core/pulls/4235"]
+        assert gitea["result"] == "success"
+        assert gitea["exit_code"] == 0
+        assert gitea["builds"][0]["statuses"] == {"SUCCESS": 59, "SKIPPED": 184}
+
+        builds = [r for r in records if r["type"] == "build"]
+        assert len(builds) == 243
+        assert all(r["complete"] for r in builds)
+        assert {r["status"] for r in builds} == {"SUCCESS", "SKIPPED"}
+
+
+def test_read_pr_urls_skips_blank_and_comment_lines(tmp_path):
+    pr_list = tmp_path / "prs.txt"
+    pr_list.write_text(
+        "# open PRs\n"
+        "https://github.com/Mic92/dotfiles/pull/3016\n"
+        "\n"
+        "  https://git.clan.lol/clan/clan-core/pulls/4235  \n"
+    )
+    assert buildbot_pr_check.read_pr_urls(str(pr_list)) == [
+        "https://github.com/Mic92/dotfiles/pull/3016",
+        "https://git.clan.lol/clan/clan-core/pulls/4235",
+    ]
+
+
+def test_batch_records_tell_failed_lookups_from_running_builds():
+    from buildbot_pr_check.batch import build_records
+    from buildbot_pr_check.buildbot_api import BuildRequestStatus, BuildWithTriggers
+    from buildbot_pr_check.reporting import BuildStatusReport, update_request_status
+
+    build = BuildWithTriggers(
+        url="https://buildbot.example.org/#/builders/1/builds/2",
+        base_url="buildbot.example.org",
+        builder_id="1",
+        build_num="2",
+        build_requests=[1, 2, 3],
+    )
+    report = BuildStatusReport(
+        statuses={}, build_id_map={}, name_map={}, virtual_builder_map={}
+    )
+    success = buildbot_pr_check.BuildStatus.SUCCESS
+    update_request_status(report, 1, BuildRequestStatus(1, success, 10, None, True))
+    update_request_status(report, 2, BuildRequestStatus(2, None, 11))
+    # The status lookup of request 3 failed
+    update_request_status(report, 3, None)
+
+    pr, *builds = build_records("https://github.com/o/r/pull/1", [build], [report])
+    assert pr["result"] == "error"
+    assert pr["builds"][0]["statuses"] == {"SUCCESS": 1, "PENDING": 1, "ERROR": 1}
+    assert [record["status"] for record in builds] == ["SUCCESS", "PENDING", "ERROR"]
+
+
+def test_exceptions_of_triggered_builds_fail_the_check():
+    from buildbot_pr_check.buildbot_api import BuildRequestStatus
+    from buildbot_pr_check.reporting import (
+        BuildStatusReport,
+        has_failures,
+        update_request_status,
+    )
+
+    report = BuildStatusReport(
+        statuses={}, build_id_map={}, name_map={}, virtual_builder_map={}
+    )
+    exception = buildbot_pr_check.BuildStatus.EXCEPTION
+    update_request_status(report, 1, BuildRequestStatus(1, exception, 10, None, True))
+    # The same statuses fail the exit code and stop --fail-fast
+    assert has_failures(report)
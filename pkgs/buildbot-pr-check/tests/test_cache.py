@@ -0,0 +1,74 @@
+"""Tests for the on-disk response cache."""
+
+import json
+from http.client import HTTPMessage
+
+from buildbot_pr_check import http_client
+from buildbot_pr_check.cache import ResponseCache, is_complete
+
+
+def test_is_complete_requires_all_entities_complete():
+    assert is_complete({"builds": [{"complete": True}], "meta": {"total": 1}})
+    assert not is_complete({"builds": [{"complete": True}, {"complete": False}]})
+    assert not is_complete({"builds": [], "meta": {"total": 0}})
+    assert not is_complete({"properties": [{"owner": ["x", "src"]}]})
+
+
+def test_responses_persist_across_instances(tmp_path):
+    path = tmp_path / "responses.sqlite3"
+    with ResponseCache(path) as cache:
+        cache.put("https://b/api/v2/builds/1", {"builds": [{"complete": True}]})
+        assert cache.get("https://b/api/v2/builds/1") is not None
+
+    with ResponseCache(path) as cache:
+        assert cache.get("https://b/api/v2/builds/1") == {
+            "builds": [{"complete": True}]
+        }
+        assert cache.get("https://b/api/v2/builds/2") is None
+        assert cache.hits == 1
+
+
+def test_least_recently_used_responses_are_evicted(tmp_path):
+    path = tmp_path / "responses.sqlite3"
+    payload = {"logs": [{"complete": True, "content": "x" * 4096}]}
+    with ResponseCache(path) as cache:
+        for i in range(3):
+            cache.put(f"https://b/{i}", {**payload, "id": i})
+    with ResponseCache(path) as cache:
+        (entry_size,) = cache._db.execute("SELECT MAX(size) FROM responses").fetchone()
+
+    with ResponseCache(path, max_bytes=entry_size * 3) as cache:
+        assert cache.get("https://b/0") is not None  # now the most recent
+        cache.put("https://b/3", {**payload, "id": 3})
+
+    with ResponseCache(path) as cache:
+        assert cache.get("https://b/1") is None
+        assert cache.get("https://b/0") is not None
+        assert cache.get("https://b/3") is not None
+
+
+def test_fetch_json_stores_only_immutable_responses(tmp_path, monkeypatch):
+    responses = {
+        "https://b/done": {"builds": [{"complete": True}]},
+        "https://b/running": {"builds": [{"complete": False}]},
+    }
+    fetched = []
+
+    class FakeClient:
+        def get(self, url, headers=None):
+            fetched.append(url)
+            body = json.dumps(responses[url]).encode()
+            return http_client.Response(url, 200, "OK", HTTPMessage(), body)
+
+    monkeypatch.setattr(http_client, "get_client", FakeClient)
+    path = tmp_path / "responses.sqlite3"
+    for _ in range(2):
+        with ResponseCache(path) as cache, http_client.use_response_cache(cache):
+            for url in responses:
+                http_client.fetch_json(url, immutable=is_complete)
+
+    assert fetched == [
+        "https://b/done",
+        "https://b/running",
+        "https://b/running",
+    ]
@@ -0,0 +1,354 @@
+"""Tests for the local fake API server, the benchmarks, and checks run against it."""
+
+import asyncio
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from benchmark import Scenario, run_scenario
+from fake_server import FakeServer, SyntheticPR, json_response
+
+import buildbot_pr_check
+from buildbot_pr_check import buildbot_api, http_client, scheduler, watch
+from buildbot_pr_check.events import EventStream
+from buildbot_pr_check.exceptions import EventStreamError
+from buildbot_pr_check.http_client import MAX_CONNECTIONS_PER_HOST
+
+CASSETTES = Path(__file__).parent / "cassettes"
+
+
+@pytest.fixture
+def concurrent_scheduler(monkeypatch):
+    """The fake server is thread-safe, so allow real concurrency again."""
+    monkeypatch.setattr(
+        scheduler, "MAX_SCHEDULER_THREADS", 2 * MAX_CONNECTIONS_PER_HOST
+    )
+
+
+def test_replays_cassette(capsys):
+    with FakeServer() as server:
+        server.add_cassette(CASSETTES / "gitea_pr_success.yaml")
+        with server.routed():
+            exit_code = buildbot_pr_check.check_pr(
+                "https://git.clan.lol/clan/clan-core/pulls/4235"
+            )
+
+    assert exit_code == 0
+    output = capsys.readouterr().out
+    assert "Found 243 triggered builds" in output
+    assert "SUCCESS: 59 builds" in output
+    assert server.requests["git.clan.lol/api/v1/repos/clan/clan-core/pulls/{id}"] == 1
+
+
+def test_synthetic_pr_with_many_sub_builds(capsys, concurrent_scheduler):
+    pr = SyntheticPR(sub_builds=1000, failed=2, pending=5)
+    with FakeServer(latency=0.01, jitter=0.005) as server:
+        pr.install(server)
+        with server.routed():
+            exit_code = buildbot_pr_check.check_pr(pr.pr_url, use_cache=False)
+
+    assert exit_code == 1
+    output = capsys.readouterr().out
+    assert "Found 1000 triggered builds" in output
+    assert "SUCCESS: 993 builds" in output
+    assert "FAILURE: 2 builds" in output
+    assert "checks.x86_64-linux.check-1001" in output
+    # Build requests are queried in bulk chunks, concurrently
+    bulk = "buildbot.example.org/api/v2/buildrequests?buildrequestid__in&field&property"
+    assert server.requests[bulk] == 10
+    assert server.max_in_flight > 1
+    # Every request has a virtual_builder_name, the parent's properties
+    # are not needed for display names
+    properties = "buildbot.example.org/api/v2/builders/{id}/builds/{id}/properties"
+    assert server.requests[properties] == 0
+
+
+def test_bulk_queries_match_single_lookups():
+    # The cassettes were recorded with one lookup per build request, so the
+    # bulk buildrequestid__in queries are only tested against SyntheticPRs
+    pr = SyntheticPR(sub_builds=150, failed=3, pending=4, started=2)
+    with FakeServer() as server:
+        pr.install(server)
+        with server.routed():
+            statuses = buildbot_api.get_build_request_statuses(
+                pr.buildbot_host, pr.request_ids
+            )
+            build_ids = buildbot_api.get_build_ids(pr.buildbot_host, pr.request_ids)
+            single = {
+                request_id: buildbot_api.check_build_request_status(
+                    pr.buildbot_host, request_id
+                )
+                for request_id in pr.request_ids
+            }
+
+    assert statuses == single
+    # Only the builds that are running
+    assert set(build_ids) == set(pr.request_ids[3:5])
+
+
+def test_ignored_bulk_filter_falls_back_to_single_lookups(capsys):
+    pr = SyntheticPR(sub_builds=150, failed=1)
+
+    def unfiltered(host, path, query):
+        # A master that ignores buildrequestid__in lists every build request
+        if path != "/api/v2/buildrequests":
+            return None
+        return json_response(
+            {"buildrequests": [pr._build_request(rid) for rid in pr.request_ids]}
+        )
+
+    with FakeServer() as server:
+        server.add_handler(unfiltered)
+        pr.install(server)
+        with server.routed():
+            exit_code = buildbot_pr_check.check_pr(pr.pr_url, use_cache=False)
+
+    assert exit_code == 1
+    output = capsys.readouterr().out
+    assert "SUCCESS: 149 builds" in output
+    assert "checks.x86_64-linux.check-1000" in output
+    single = "buildbot.example.org/api/v2/buildrequests/{id}?field&property"
+    assert server.requests[single] == 150
+
+
+def test_injected_errors(capsys):
+    pr = SyntheticPR(sub_builds=10)
+    with FakeServer(error_rate=1.0, error_status=502) as server:
+        pr.install(server)
+        with server.routed():
+            exit_code = buildbot_pr_check.check_pr(pr.pr_url, use_cache=False)
+
+    assert exit_code == 1
+    assert "HTTP Error 502" in capsys.readouterr().out
+    assert server.errors == server.total_requests
+
+
+def test_profile_is_reported_without_buildbot_builds(capsys):
+    api = "https://git.example.org/api/v1/repos/example/repo"
+    with FakeServer() as server:
+        server.add_route(f"{api}/pulls/1", json_response({"head": {"sha": "abc"}}))
+        server.add_route(f"{api}/statuses/abc", json_response([]))
+        with server.routed():
+            exit_code = buildbot_pr_check.check_pr(
+                "https://git.example.org/example/repo/pulls/1",
+                use_cache=False,
+                profile=True,
+            )
+
+    assert exit_code == 0
+    output = capsys.readouterr().out
+    assert "No buildbot builds found for this PR" in output
+    assert "Profile" in output
+
+
+def test_transient_errors_are_retried(capsys, monkeypatch):
+    monkeypatch.setattr(http_client, "MAX_ATTEMPTS", 10)
+    pr = SyntheticPR(sub_builds=50)
+    with FakeServer(error_rate=0.3, error_status=502) as server:
+        pr.install(server)
+        with server.routed():
+            exit_code = buildbot_pr_check.check_pr(pr.pr_url, use_cache=False)
+
+    assert exit_code == 0
+    output = capsys.readouterr().out
+    assert "SUCCESS: 50 builds" in output
+    assert "ERROR" not in output
+    assert server.errors > 0
+
+
+def test_fail_fast_stops_at_the_first_failure(capsys):
+    pr = SyntheticPR(sub_builds=1000, failed=1)
+    with FakeServer() as server:
+        pr.install(server)
+        with server.routed():
+            exit_code = buildbot_pr_check.check_pr(
+                pr.pr_url, use_cache=False, fail_fast=True
+            )
+
+    assert exit_code == 1
+    output = capsys.readouterr().out
+    assert "Failing fast:" in output
+    assert "of 1000 triggered builds checked" in output
+    # The remaining chunks are cancelled and no logs are looked up
+    bulk = "buildbot.example.org/api/v2/buildrequests?buildrequestid__in&field&property"
+    assert server.requests[bulk] < 10
+    assert server.requests["buildbot.example.org/api/v2/steps/{id}/logs?field"] == 0
+
+
+def test_fail_fast_checks_everything_when_nothing_failed(capsys):
+    pr = SyntheticPR(sub_builds=20)
+    with FakeServer() as server:
+        pr.install(server)
+        with server.routed():
+            exit_code = buildbot_pr_check.check_pr(
+                pr.pr_url, use_cache=False, fail_fast=True
+            )
+
+    assert exit_code == 0
+    output = capsys.readouterr().out
+    assert "SUCCESS: 20 builds" in output
+    assert "Failing fast" not in output
+
+
+def test_benchmark_reports_wall_time_and_requests():
+    pr = SyntheticPR(sub_builds=10, failed=1, forge="gitea")
+    scenario = Scenario("synthetic-10", pr.pr_url, pr.install)
+    once = run_scenario(scenario)
+    result = run_scenario(scenario, repeat=2)
+
+    assert result.exit_code == 1
+    assert len(result.wall_times) == 2
+    # Requests are reported per run
+    assert result.requests == once.requests > 0
+    assert result.errors == 0
+
+
+def test_only_failed_steps_are_searched_for_logs(capsys):
+    pr = SyntheticPR(sub_builds=20, failed=3)
+    with FakeServer() as server:
+        pr.install(server)
+        with server.routed():
+            exit_code = buildbot_pr_check.check_pr(pr.pr_url, use_cache=False)
+
+    assert exit_code == 1
+    output = capsys.readouterr().out
+    assert output.count("Build flake attr (stdio)") == 3
+    # The passing "Evaluate" step of each failed build is skipped
+    assert "Evaluate (stdio)" not in output
+    # One failed step per failed build, plus the parent's failed step
+    assert server.requests["buildbot.example.org/api/v2/steps/{id}/logs?field"] == 4
+
+
+def test_excerpt_reads_only_the_log_tail(capsys, concurrent_scheduler):
+    pr = SyntheticPR(sub_builds=20, failed=3, log_lines=250_000)
+    with FakeServer() as server:
+        pr.install(server)
+        with server.routed():
+            exit_code = buildbot_pr_check.check_pr(
+                pr.pr_url, use_cache=False, excerpt_lines=1500
+            )
+
+    assert exit_code == 1
+    output = capsys.readouterr().out
+    # 3 failed sub-builds and the parent, 1500 lines each
+    assert output.count("  │ line ") == 4 * 1500
+    assert "│ line 250000 of log" in output
+    assert "│ line 248501 of log" in output
+    assert "│ line 248500 of log" not in output
+    # Two pages per log, the rest of the log is never requested
+    contents = "buildbot.example.org/api/v2/logs/{id}/contents?field&limit&offset"
+    assert server.requests[contents] == 4 * 2
+
+
+def test_group_failures_shows_one_log_per_root_cause(capsys, concurrent_scheduler):
+    libfoo = "/nix/store/" + "a" * 32 + "-libfoo-1.0.drv"
+    libbar = "/nix/store/" + "b" * 32 + "-libbar-1.0.drv"
+    pr = SyntheticPR(
+        sub_builds=50, failed=12, log_lines=20, failing_derivations=[libfoo, libbar]
+    )
+    with FakeServer() as server:
+        pr.install(server)
+        with server.routed():
+            exit_code = buildbot_pr_check.check_pr(
+                pr.pr_url, use_cache=False, excerpt_lines=5, group_failures=True
+            )
+
+    assert exit_code == 1
+    output = capsys.readouterr().out
+    assert "libfoo-1.0.drv failed for 6 builds" in output
+    assert "libbar-1.0.drv failed for 6 builds" in output
+    assert output.count("… and 1 more") == 2
+    # Only the two representatives (and the parent) show their log tails
+    assert output.count("failed with exit code 1;") == 2
+    assert output.count("  │ ") == 3 * 5
+    # Representative excerpts are cut from the scanned tails, so each failed
+    # log is read once, plus the parent's excerpt
+    contents = "buildbot.example.org/api/v2/logs/{id}/contents?field&limit&offset"
+    assert server.requests[contents] == 12 + 1
+
+
+def _finish_pending(server, pr, results, before=None):
+    """Finish the pending sub-builds from another thread, once `before` ran"""
+
+    def run():
+        if before is not None:
+            before()
+        for request_id, result in results.items():
+            pr.finish(server, request_id, result)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_watch_follows_websocket_events(capsys, concurrent_scheduler):
+    pr = SyntheticPR(sub_builds=30, failed=1, pending=3)
+    with FakeServer() as server:
+        pr.install(server)
+        thread = _finish_pending(
+            server,
+            pr,
+            {1001: 0, 1002: 2, 1003: 0},
+            before=lambda: server.wait_for_subscription("builds/100000/steps/*/*"),
+        )
+        with server.routed():
+            exit_code = buildbot_pr_check.check_pr(
+                pr.pr_url, use_cache=False, watch=True
+            )
+        thread.join()
+
+    assert exit_code == 1
+    output = capsys.readouterr().out
+    assert "checks.x86_64-linux.check-1002: FAILURE" in output
+    assert "checks.x86_64-linux.check-1003: SUCCESS" in output
+    assert "Parent build failed" in output
+    assert "All builds finished" in output
+    assert "polling instead" not in output
+    assert server.requests["buildbot.example.org/ws"] == 1
+    # The first check and the catch-up after subscribing query all incomplete
+    # requests; after that only the ones an event said completed are fetched
+    bulk = "buildbot.example.org/api/v2/buildrequests?buildrequestid__in&field&property"
+    assert server.requests[bulk] <= 5
+
+
+def test_watch_polls_when_event_stream_drops(capsys, monkeypatch):
+    monkeypatch.setattr(watch, "WATCH_MIN_INTERVAL", 0.05)
+    pr = SyntheticPR(sub_builds=5, pending=2)
+
+    def drop_connection():
+        server.wait_for_subscription("builds/100000/steps/*/*")
+        server.close_websockets()
+        # Finish the builds once polling took over: after the first check and
+        # the catch-up after subscribing, a third bulk query means a poll
+        bulk = "buildbot.example.org/api/v2/buildrequests?buildrequestid__in&field&property"
+        deadline = time.monotonic() + 10
+        while server.requests[bulk] < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    with FakeServer() as server:
+        pr.install(server)
+        thread = _finish_pending(server, pr, {1000: 0, 1001: 0}, drop_connection)
+        with server.routed():
+            exit_code = buildbot_pr_check.check_pr(
+                pr.pr_url, use_cache=False, watch=True
+            )
+        thread.join()
+
+    assert exit_code == 0
+    output = capsys.readouterr().out
+    assert "No Buildbot events from buildbot.example.org, polling instead" in output
+    assert "checks.x86_64-linux.check-1001: SUCCESS" in output
+    assert "All builds finished" in output
+
+
+def test_event_stream_unavailable():
+    async def connect():
+        await EventStream.connect("buildbot.example.org")
+
+    with (
+        FakeServer(websocket=False) as server,
+        server.routed(),
+        pytest.raises(EventStreamError, match="answered HTTP/1.1 404"),
+    ):
+        asyncio.run(connect())
@@ -0,0 +1,371 @@
+"""Tests for GitHub check discovery."""
+
+import email.message
+import io
+import json
+import urllib.error
+
+import pytest
+
+from buildbot_pr_check import github_api
+from buildbot_pr_check.cache import ResponseCache
+from buildbot_pr_check.exceptions import GitHubAPIError
+from buildbot_pr_check.http_client import Response, use_response_cache
+
+
+def _response(url, data, link=None, status=200, **extra_headers):
+    headers = email.message.Message()
+    if link:
+        headers["Link"] = link
+    for name, value in extra_headers.items():
+        headers[name.replace("_", "-")] = value
+    return Response(
+        url=url,
+        status=status,
+        reason="OK",
+        headers=headers,
+        body=json.dumps(data).encode(),
+    )
+
+
+def _contexts_page(nodes, cursor=None):
+    return {
+        "data": {
+            "repository": {
+                "pullRequest": {
+                    "commits": {
+                        "nodes": [
+                            {
+                                "commit": {
+                                    "statusCheckRollup": {
+                                        "contexts": {
+                                            "pageInfo": {
+                                                "hasNextPage": cursor is not None,
+                                                "endCursor": cursor,
+                                            },
+                                            "nodes": nodes,
+                                        }
+                                    }
+                                }
+                            }
+                        ]
+                    }
+                }
+            }
+        }
+    }
+
+
+class FakeClient:
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+        self.headers = []
+
+    def request(self, method, url, headers=None, body=None, idempotent=None):
+        self.requests.append((method, url, json.loads(body) if body else None))
+        self.headers.append(headers or {})
+        page = self.pages.pop(0)
+        if isinstance(page, Exception):
+            raise page
+        return page
+
+    def get(self, url, headers=None):
+        return self.request("GET", url, headers)
+
+
+def test_graphql_reads_every_page_of_checks(monkeypatch):
+    client = FakeClient(
+        [
+            _response(
+                github_api.GITHUB_GRAPHQL_URL,
+                _contexts_page(
+                    [
+                        {
+                            "__typename": "CheckRun",
+                            "name": "lint",
+                            "detailsUrl": "https://ci.example.org/lint",
+                            "checkSuite": {"app": {"name": "GitHub Actions"}},
+                        },
+                        {
+                            "__typename": "CheckRun",
+                            "name": "buildbot/nix-build",
+                            "detailsUrl": "https://buildbot.example.org/#/builders/1/builds/2",
+                            "checkSuite": {"app": {"name": "buildbot"}},
+                        },
+                    ],
+                    cursor="page-2",
+                ),
+            ),
+            _response(
+                github_api.GITHUB_GRAPHQL_URL,
+                _contexts_page(
+                    [
+                        {
+                            "__typename": "StatusContext",
+                            "context": "buildbot/nix-eval",
+                            "targetUrl": "https://buildbot.example.org/#/builders/3/builds/4",
+                        }
+                    ]
+                ),
+            ),
+        ]
+    )
+    monkeypatch.setattr(github_api, "get_client", lambda: client)
+    monkeypatch.setattr(github_api, "get_github_token", lambda: "secret")
+
+    urls = github_api.get_buildbot_urls_from_github("owner", "repo", "42")
+
+    assert sorted(urls) == [
+        "https://buildbot.example.org/#/builders/1/builds/2",
+        "https://buildbot.example.org/#/builders/3/builds/4",
+    ]
+    assert [request[2]["variables"]["cursor"] for request in client.requests] == [
+        None,
+        "page-2",
+    ]
+
+
+def test_rest_follows_check_run_pages_without_token(monkeypatch):
+    api = "https://api.github.com/repos/owner/repo"
+    client = FakeClient(
+        [
+            _response(f"{api}/pulls/42", {"head": {"sha": "abc"}}),
+            _response(
+                f"{api}/commits/abc/check-runs?per_page=100",
+                {"check_runs": []},
+                link=f'<{api}/commits/abc/check-runs?per_page=100&page=2>; rel="next"',
+            ),
+            _response(
+                f"{api}/commits/abc/check-runs?per_page=100&page=2",
+                {
+                    "check_runs": [
+                        {
+                            "name": "buildbot/nix-build",
+                            "details_url": "https://buildbot.example.org/#/builders/1/builds/2",
+                        }
+                    ]
+                },
+            ),
+            _response(f"{api}/commits/abc/status", {"statuses": []}),
+        ]
+    )
+    monkeypatch.setattr(github_api, "get_client", lambda: client)
+    monkeypatch.setattr(github_api, "get_github_token", lambda: None)
+
+    urls = github_api.get_buildbot_urls_from_github("owner", "repo", "42")
+
+    assert urls == ["https://buildbot.example.org/#/builders/1/builds/2"]
+    assert [request[1] for request in client.requests] == [
+        f"{api}/pulls/42",
+        f"{api}/commits/abc/check-runs?per_page=100",
+        f"{api}/commits/abc/check-runs?per_page=100&page=2",
+        f"{api}/commits/abc/status",
+    ]
+
+
+def test_not_modified_response_is_served_from_cache(monkeypatch, tmp_path):
+    url = "https://api.github.com/repos/owner/repo/pulls/42"
+    client = FakeClient(
+        [
+            _response(url, {"head": {"sha": "abc"}}, ETag='"v1"'),
+            _response(url, {}, status=304, ETag='"v1"'),
+        ]
+    )
+    monkeypatch.setattr(github_api, "get_client", lambda: client)
+    monkeypatch.setattr(github_api, "get_github_token", lambda: None)
+
+    cache = ResponseCache(tmp_path / "cache.sqlite3")
+    with cache, use_response_cache(cache):
+        github = github_api.GitHubClient()
+        assert github.get_json(url) == {"head": {"sha": "abc"}}
+        assert github.get_json(url) == {"head": {"sha": "abc"}}
+
+    assert "If-None-Match" not in client.headers[0]
+    assert client.headers[1]["If-None-Match"] == '"v1"'
+    assert github.not_modified == 1
+
+
+def test_not_modified_pages_keep_their_link_header(monkeypatch, tmp_path):
+    api = "https://api.github.com/repos/owner/repo/commits/abc/check-runs"
+    first, second = f"{api}?per_page=100", f"{api}?per_page=100&page=2"
+    link = f'<{second}>; rel="next"'
+    client = FakeClient(
+        [
+            _response(first, {"check_runs": [1]}, link=link, ETag='"p1"'),
+            _response(second, {"check_runs": [2]}, ETag='"p2"'),
+            # GitHub's 304s repeat neither the body nor the Link header
+            _response(first, {}, status=304, ETag='"p1"'),
+            _response(second, {}, status=304, ETag='"p2"'),
+        ]
+    )
+    monkeypatch.setattr(github_api, "get_client", lambda: client)
+    monkeypatch.setattr(github_api, "get_github_token", lambda: None)
+
+    cache = ResponseCache(tmp_path / "cache.sqlite3")
+    with cache, use_response_cache(cache):
+        github = github_api.GitHubClient()
+        assert list(github.get_pages(first)) == [
+            {"check_runs": [1]},
+            {"check_runs": [2]},
+        ]
+        cache.flush()
+        assert list(github.get_pages(first)) == [
+            {"check_runs": [1]},
+            {"check_runs": [2]},
+        ]
+
+    assert [request[1] for request in client.requests] == [first, second] * 2
+    assert github.not_modified == 2
+
+
+def test_rate_limit_spreads_requests_and_retries(monkeypatch):
+    url = "https://api.github.com/repos/owner/repo/pulls/42"
+    now = 1_000_000.0
+    rate_limited = urllib.error.HTTPError(
+        url, 429, "Too Many Requests", email.message.Message(), io.BytesIO()
+    )
+    rate_limited.headers["Retry-After"] = "3"
+    client = FakeClient(
+        [
+            _response(
+                url,
+                {},
+                X_RateLimit_Limit="5000",
+                X_RateLimit_Remaining="10",
+                X_RateLimit_Reset=str(int(now + 50)),
+            ),
+            rate_limited,
+            _response(url, {"number": 42}),
+        ]
+    )
+    sleeps: list[float] = []
+    monkeypatch.setattr(github_api, "get_client", lambda: client)
+    monkeypatch.setattr(github_api, "get_github_token", lambda: None)
+    monkeypatch.setattr(github_api.time, "time", lambda: now)
+    monkeypatch.setattr(github_api.time, "sleep", sleeps.append)
+
+    github = github_api.GitHubClient()
+    github.get_json(url)
+    assert github.get_json(url) == {"number": 42}
+
+    # 10 requests left for 50s: one every 5s, plus the Retry-After wait
+    assert sleeps == [5.0, 3.0, 5.0]
+    assert github.rate_limits["core"].remaining == 10
+
+    github.rate_limits["core"].remaining = 0
+    github.rate_limits["core"].reset = now + 3600
+    with pytest.raises(GitHubAPIError, match="rate limit exhausted"):
+        github.get_json(url)
+
+
+def _status_page(nodes, state="OPEN"):
+    page = _contexts_page(nodes)
+    page["data"]["repository"]["pullRequest"].update(
+        {
+            "state": state,
+            "mergeable": "MERGEABLE",
+            "url": "https://github.com/owner/repo/pull/42",
+            "autoMergeRequest": {"enabledAt": "2026-01-01T00:00:00Z"},
+        }
+    )
+    return page
+
+
+def test_status_poller_only_queries_graphql_after_changes(monkeypatch):
+    api = "https://api.github.com/repos/owner/repo"
+    check_run = {
+        "__typename": "CheckRun",
+        "name": "buildbot/nix-build",
+        "status": "IN_PROGRESS",
+        "conclusion": None,
+        "detailsUrl": "https://buildbot.example.org/#/builders/1/builds/2",
+    }
+
+    def probe(check_runs):
+        return [
+            _response(f"{api}/pulls/42", {"head": {"sha": "abc"}}),
+            _response(
+                f"{api}/commits/abc/check-runs?per_page=100",
+                {"check_runs": check_runs},
+            ),
+            _response(f"{api}/commits/abc/status", {"statuses": []}),
+        ]
+
+    finished = {**check_run, "status": "COMPLETED", "conclusion": "SUCCESS"}
+    client = FakeClient(
+        [
+            *probe([{"id": 1, "status": "in_progress"}]),
+            _response(github_api.GITHUB_GRAPHQL_URL, _status_page([check_run])),
+            *probe([{"id": 1, "status": "in_progress"}]),
+            *probe([{"id": 1, "status": "completed"}]),
+            _response(github_api.GITHUB_GRAPHQL_URL, _status_page([finished])),
+        ]
+    )
+    monkeypatch.setattr(github_api, "get_client", lambda: client)
+    monkeypatch.setattr(github_api, "get_github_token", lambda: "secret")
+
+    poller = github_api.PRStatusPoller("owner", "repo", "42", github_api.GitHubClient())
+    first = poller.poll()
+    assert first == {
+        "state": "OPEN",
+        "mergeable": "MERGEABLE",
+        "autoMergeRequest": {"enabledAt": "2026-01-01T00:00:00Z"},
+        "statusCheckRollup": [check_run],
+        "url": "https://github.com/owner/repo/pull/42",
+    }
+    # Nothing changed: no GraphQL query
+    assert poller.poll() == first
+    assert poller.unchanged == 1
+    assert poller.poll()["statusCheckRollup"] == [finished]
+    assert [method for method, _, _ in client.requests].count("POST") == 2
+    assert not client.pages
+
+
+def test_status_poller_revalidates_without_an_active_cache(monkeypatch):
+    api = "https://api.github.com/repos/owner/repo"
+    urls = [
+        f"{api}/pulls/42",
+        f"{api}/commits/abc/check-runs?per_page=100",
+        f"{api}/commits/abc/status",
+    ]
+    bodies = [{"head": {"sha": "abc"}}, {"check_runs": []}, {"statuses": []}]
+    client = FakeClient(
+        [
+            *(
+                _response(url, body, ETag=f'"{index}"')
+                for index, (url, body) in enumerate(zip(urls, bodies, strict=True))
+            ),
+            _response(github_api.GITHUB_GRAPHQL_URL, _status_page([])),
+            *(_response(url, {}, status=304) for url in urls),
+        ]
+    )
+    monkeypatch.setattr(github_api, "get_client", lambda: client)
+    monkeypatch.setattr(github_api, "get_github_token", lambda: None)
+
+    poller = github_api.PRStatusPoller("owner", "repo", "42", github_api.GitHubClient())
+    try:
+        first = poller.poll()
+        # The poller keeps the ETags in a cache of its own
+        assert poller.poll() == first
+    finally:
+        poller.close()
+    assert [headers.get("If-None-Match") for headers in client.headers[-3:]] == [
+        '"0"',
+        '"1"',
+        '"2"',
+    ]
+    assert poller.unchanged == 1
+
+
+def test_status_poller_reports_api_errors(monkeypatch):
+    url = "https://api.github.com/repos/owner/repo/pulls/42"
+    client = FakeClient(
+        [urllib.error.HTTPError(url, 404, "Not Found", email.message.Message(), None)]
+    )
+    monkeypatch.setattr(github_api, "get_client", lambda: client)
+    monkeypatch.setattr(github_api, "get_github_token", lambda: None)
+
+    poller = github_api.PRStatusPoller("owner", "repo", "42", github_api.GitHubClient())
+    with pytest.raises(GitHubAPIError, match="Failed to fetch PR data"):
+        poller.poll()
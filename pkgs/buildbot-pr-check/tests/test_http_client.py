@@ -0,0 +1,209 @@
+"""Tests for the pooled HTTP client against a local keep-alive server."""
+
+import asyncio
+import gzip
+import json
+import threading
+import time
+import urllib.error
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import ClassVar
+
+import pytest
+
+from buildbot_pr_check import http_client
+from buildbot_pr_check.http_client import HTTPClient, RequestMemo, memoize_requests
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections: ClassVar[set[int]] = set()
+    hits: ClassVar[Counter[str]] = Counter()
+
+    def do_GET(self):
+        type(self).connections.add(id(self.connection))
+        type(self).hits[self.path] += 1
+        first_hit = type(self).hits[self.path] == 1
+        if self.path == "/missing":
+            body = b'{"error": "not found"}'
+            self.send_response(404)
+        elif self.path == "/flaky" and first_hit:
+            body = b'{"error": "bad gateway"}'
+            self.send_response(502)
+        else:
+            if self.path == "/slow" and first_hit:
+                time.sleep(2)
+            body = json.dumps({"path": self.path}).encode()
+            self.send_response(200)
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = do_GET
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    _Handler.connections = set()
+    _Handler.hits = Counter()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_sequential_requests_reuse_one_connection(server):
+    client = HTTPClient()
+    for i in range(5):
+        assert client.get_json(f"{server}/api/v2/builds/{i}") == {
+            "path": f"/api/v2/builds/{i}"
+        }
+    client.close()
+    assert len(_Handler.connections) == 1
+
+
+def test_gzip_response_is_decoded(server):
+    client = HTTPClient()
+    response = client.get(f"{server}/compressed")
+    assert response.headers.get("Content-Encoding") == "gzip"
+    assert response.json() == {"path": "/compressed"}
+    client.close()
+
+
+def test_http_error_matches_urlopen(server):
+    client = HTTPClient()
+    with pytest.raises(urllib.error.HTTPError) as excinfo:
+        client.get_json(f"{server}/missing")
+    assert excinfo.value.code == 404
+    client.close()
+
+
+def test_connection_error_is_url_error():
+    client = HTTPClient(timeout=1)
+    with pytest.raises(urllib.error.URLError):
+        client.get_json("http://127.0.0.1:9/nothing-listens-here")
+
+
+def test_get_is_retried_after_server_error(server):
+    client = HTTPClient()
+    assert client.get_json(f"{server}/flaky") == {"path": "/flaky"}
+    assert _Handler.hits["/flaky"] == 2
+    client.close()
+
+
+def test_post_is_not_retried(server):
+    client = HTTPClient()
+    with pytest.raises(urllib.error.HTTPError) as excinfo:
+        client.request("POST", f"{server}/flaky", body=b"{}")
+    assert excinfo.value.code == 502
+    assert _Handler.hits["/flaky"] == 1
+    client.close()
+
+
+def test_slow_get_is_hedged(server, monkeypatch):
+    monkeypatch.setattr(http_client, "HEDGE_MIN_SAMPLES", 5)
+    client = HTTPClient()
+    for i in range(5):
+        client.get_json(f"{server}/api/v2/builds/{i}")
+    with http_client.hedge_requests():
+        start = time.perf_counter()
+        assert client.get_json(f"{server}/slow") == {"path": "/slow"}
+        # The duplicate answered long before the first request would have
+        assert time.perf_counter() - start < 1.5
+    assert _Handler.hits["/slow"] == 2
+    client.close()
+
+
+def test_memo_fetches_each_url_once(server):
+    with memoize_requests() as memo:
+        for _ in range(3):
+            assert http_client.fetch_json(f"{server}/api/v2/builds/1") == {
+                "path": "/api/v2/builds/1"
+            }
+    assert (memo.fetched, memo.reused, memo.coalesced) == (1, 2, 0)
+
+
+def test_memos_of_concurrent_tasks_stay_apart(server):
+    url = f"{server}/api/v2/builds/1"
+
+    async def run():
+        b_entered, b_exited = asyncio.Event(), asyncio.Event()
+
+        async def a():
+            await b_entered.wait()
+            with memoize_requests() as memo:
+                await b_exited.wait()
+                http_client.fetch_json(url)
+            return memo
+
+        async def b():
+            with memoize_requests() as memo:
+                b_entered.set()
+                # Let a enter its memo before this one is left
+                await asyncio.sleep(0.01)
+                http_client.fetch_json(url)
+            b_exited.set()
+            return memo
+
+        return await asyncio.gather(a(), b())
+
+    memo_a, memo_b = asyncio.run(run())
+    assert (memo_a.fetched, memo_b.fetched) == (1, 1)
+    # Leaving the memos in the order they were entered left none active
+    http_client.fetch_json(url)
+    assert _Handler.hits["/api/v2/builds/1"] == 3
+
+
+def test_memo_coalesces_concurrent_fetches():
+    memo = RequestMemo()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow_fetch():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"ok": True}
+
+    results = []
+    owner = threading.Thread(
+        target=lambda: results.append(memo.get_json("u", None, slow_fetch))
+    )
+    owner.start()
+    started.wait(5)
+    waiter = threading.Thread(
+        target=lambda: results.append(memo.get_json("u", None, slow_fetch))
+    )
+    waiter.start()
+    # Let the waiter block on the in-flight fetch before completing it
+    while memo.coalesced == 0:
+        time.sleep(0.001)
+    release.set()
+    owner.join()
+    waiter.join()
+    assert results == [{"ok": True}, {"ok": True}]
+    assert len(calls) == 1
+
+
+def test_memo_does_not_remember_failures():
+    memo = RequestMemo()
+
+    def failing_fetch():
+        raise urllib.error.URLError("boom")
+
+    for _ in range(2):
+        with pytest.raises(urllib.error.URLError):
+            memo.get_json("u", None, failing_fetch)
+    assert memo.fetched == 2
+    assert memo.saved == 0
@@ -0,0 +1,68 @@
+"""Tests for --profile instrumentation."""
+
+from buildbot_pr_check import profiling
+from buildbot_pr_check.profiling import (
+    Profiler,
+    busy_time,
+    endpoint_template,
+    percentile,
+)
+
+
+def test_endpoint_template_replaces_ids_and_hashes():
+    assert (
+        endpoint_template(
+            "https://buildbot.example.org/api/v2/builders/25/builds/6669/steps"
+        )
+        == "buildbot.example.org/api/v2/builders/{id}/builds/{id}/steps"
+    )
+    assert (
+        endpoint_template(
+            "https://buildbot.example.org/api/v2/buildrequests"
+            "?buildrequestid__in=1&buildrequestid__in=2&property=virtual_builder_name"
+        )
+        == "buildbot.example.org/api/v2/buildrequests?buildrequestid__in&property"
+    )
+    assert (
+        endpoint_template(
+            "https://api.github.com/repos/o/r/commits/" + "ab12" * 10 + "/status"
+        )
+        == "api.github.com/repos/o/r/commits/{sha}/status"
+    )
+
+
+def test_percentile_and_busy_time():
+    latencies = [float(n) for n in range(1, 101)]
+    assert percentile(latencies, 0.5) == 50.0
+    assert percentile(latencies, 0.95) == 95.0
+    assert percentile([3.0], 0.95) == 3.0
+    # Overlapping intervals count once, gaps don't count
+    assert busy_time([(0.0, 2.0), (1.0, 3.0), (5.0, 6.0)]) == 4.0
+
+
+def test_records_only_inside_profile_requests(capsys):
+    url = "https://buildbot.example.org/api/v2/builds/1/steps"
+    profiling.record_request(url, 1.0, 200, 10)
+
+    with profiling.profile_requests() as profiler:
+        profiling.record_request(url, 0.1, 200, 100)
+        profiling.record_request(url.replace("/1/", "/2/"), 0.3, 404, 20)
+        profiling.record_retry(url)
+        profiling.record_request(url, 0.2, None, 0)
+        with profiling.profile_phase("status"):
+            pass
+
+    assert isinstance(profiler, Profiler)
+    stats = profiler.endpoints["buildbot.example.org/api/v2/builds/{id}/steps"]
+    assert stats.latencies == [0.1, 0.3, 0.2]
+    assert stats.statuses == {"200": 1, "404": 1, "error": 1}
+    assert stats.bytes == 120
+    assert stats.retries == 1
+    assert list(profiler.phases) == ["status"]
+
+    profiler.print_report()
+    output = capsys.readouterr().out
+    assert (
+        "buildbot.example.org/api/v2/builds/{id}/steps [200×1 404×1 error×1]" in output
+    )
+    assert "300ms" in output
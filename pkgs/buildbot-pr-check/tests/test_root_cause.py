@@ -0,0 +1,45 @@
+"""Tests for grouping failed builds by root cause."""
+
+from buildbot_pr_check.root_cause import (
+    derivation_name,
+    find_root_cause,
+    group_failures,
+)
+
+LIBFOO = "/nix/store/" + "a" * 32 + "-libfoo-1.0.drv"
+APP = "/nix/store/" + "b" * 32 + "-app-2.0.drv"
+
+
+def test_find_root_cause_returns_first_failed_builder():
+    lines = [
+        "building '/nix/store/...-app-2.0.drv'...",
+        f"error: builder for '{LIBFOO}' failed with exit code 2;",
+        "       last 10 log lines:",
+        f"error: 1 dependencies of derivation '{APP}' failed to build",
+        f"error: builder for '{APP}' failed with exit code 1;",
+    ]
+    assert find_root_cause(lines) == LIBFOO
+    # Newer Nix reports "Cannot build" with the reason on the next line
+    assert (
+        find_root_cause(
+            [
+                f"error: Cannot build '{APP}'.",
+                "       Reason: 1 dependency failed.",
+                f"error: Cannot build '{LIBFOO}'.",
+                "       Reason: builder failed with exit code 2.",
+            ]
+        )
+        == LIBFOO
+    )
+    assert find_root_cause(["all good"]) is None
+    assert derivation_name(LIBFOO) == "libfoo-1.0.drv"
+
+
+def test_group_failures_largest_groups_first():
+    groups = group_failures([5, 1, 4, 3, 2], {1: APP, 2: LIBFOO, 3: LIBFOO, 5: LIBFOO})
+    assert [(group.root_cause, group.request_ids) for group in groups] == [
+        (LIBFOO, [2, 3, 5]),
+        (APP, [1]),
+        (None, [4]),
+    ]
+    assert groups[0].representative == 2
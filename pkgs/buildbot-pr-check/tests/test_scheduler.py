@@ -0,0 +1,88 @@
+"""Tests for the shared request scheduler."""
+
+import asyncio
+import contextvars
+import threading
+
+from buildbot_pr_check.scheduler import Priority, RequestScheduler
+
+
+def test_waiting_calls_are_admitted_by_priority():
+    order: list[str] = []
+    gate = threading.Event()
+
+    async def run() -> None:
+        async with RequestScheduler(max_per_host=1, max_threads=2) as scheduler:
+            blocker = asyncio.create_task(
+                scheduler.run("example.org", Priority.STATUS, gate.wait)
+            )
+            await asyncio.sleep(0.01)
+            waiting = [
+                asyncio.create_task(
+                    scheduler.run("example.org", priority, order.append, name)
+                )
+                for priority, name in [
+                    (Priority.LOGS, "logs"),
+                    (Priority.NAMES, "names"),
+                    (Priority.STATUS, "status"),
+                ]
+            ]
+            await asyncio.sleep(0.01)
+            gate.set()
+            await asyncio.gather(blocker, *waiting)
+
+    asyncio.run(run())
+    assert order == ["status", "names", "logs"]
+
+
+def test_hosts_have_independent_limits():
+    started = threading.Barrier(2, timeout=5)
+
+    async def run() -> None:
+        async with RequestScheduler(max_per_host=1, max_threads=2) as scheduler:
+            # Deadlocks (and times out) if the second host waits for the first
+            await asyncio.gather(
+                scheduler.run("a.example.org", Priority.STATUS, started.wait),
+                scheduler.run("b.example.org", Priority.STATUS, started.wait),
+            )
+
+    asyncio.run(run())
+
+
+def test_cancelled_call_holds_its_slot_until_its_thread_finishes():
+    gate = threading.Event()
+    order: list[str] = []
+
+    def blocking() -> None:
+        gate.wait(5)
+        order.append("blocking")
+
+    async def run() -> None:
+        async with RequestScheduler(max_per_host=1, max_threads=2) as scheduler:
+            blocker = asyncio.create_task(
+                scheduler.run("example.org", Priority.STATUS, blocking)
+            )
+            await asyncio.sleep(0.01)
+            blocker.cancel()
+            waiting = asyncio.create_task(
+                scheduler.run("example.org", Priority.STATUS, order.append, "next")
+            )
+            await asyncio.sleep(0.05)
+            # The cancelled call still runs on its thread and keeps the slot
+            assert order == []
+            gate.set()
+            await waiting
+
+    asyncio.run(run())
+    assert order == ["blocking", "next"]
+
+
+def test_calls_run_in_the_callers_context():
+    phase = contextvars.ContextVar("phase", default="unset")
+
+    async def run() -> str:
+        async with RequestScheduler(max_per_host=1, max_threads=1) as scheduler:
+            phase.set("caller")
+            return await scheduler.run("example.org", Priority.STATUS, phase.get)
+
+    assert asyncio.run(run()) == "caller"
@@ -0,0 +1,106 @@
+"""Tests for watch mode polling."""
+
+import asyncio
+
+from buildbot_pr_check import reporting, watch
+from buildbot_pr_check.build_status import BuildStatus
+from buildbot_pr_check.buildbot_api import (
+    BuildRequestStatus,
+    BuildWithTriggers,
+    LogUrl,
+)
+from buildbot_pr_check.reporting import BuildStatusReport, update_request_status
+from buildbot_pr_check.scheduler import RequestScheduler
+
+
+def _request(req_id, status=None, build_id=None):
+    return BuildRequestStatus(
+        request_id=req_id,
+        status=status,
+        build_id=build_id,
+        virtual_builder_name=f"nix-build#checks.x86_64-linux.check-{req_id}",
+        complete=status is not None,
+    )
+
+
+def test_watch_polls_incomplete_requests_until_finished(monkeypatch, capsys):
+    build = BuildWithTriggers(
+        url="https://buildbot.example.org/#/builders/1/builds/2",
+        base_url="buildbot.example.org",
+        builder_id="1",
+        build_num="2",
+        build_requests=[10, 11],
+    )
+    report = BuildStatusReport(
+        statuses={}, build_id_map={}, name_map={}, virtual_builder_map={}
+    )
+    update_request_status(report, 10, _request(10, BuildStatus.SUCCESS, 100))
+    update_request_status(report, 11, _request(11))
+
+    # Each poll sees the next state of the build requests and parent
+    polls = [
+        {"requests": {11: _request(11), 12: _request(12)}, "parent": None},
+        {"requests": {11: _request(11), 12: _request(12)}, "parent": None},
+        {
+            "requests": {
+                11: _request(11, BuildStatus.FAILURE, 111),
+                12: _request(12, BuildStatus.SUCCESS, 112),
+            },
+            "parent": BuildStatus.FAILURE,
+        },
+    ]
+    queried: list[list[int]] = []
+
+    def get_build_request_statuses(base_url, request_ids):
+        queried.append(list(request_ids))
+        return {req_id: polls[0]["requests"][req_id] for req_id in request_ids}
+
+    def get_parent_build_status(base_url, builder_id, build_num):
+        return polls[0]["parent"], []
+
+    async def get_build_log_urls(scheduler, base_url, build_id):
+        return [LogUrl("Build flake attr", "stdio", f"https://logs/{build_id}")]
+
+    monkeypatch.setattr(
+        reporting, "get_build_request_statuses", get_build_request_statuses
+    )
+    monkeypatch.setattr(reporting, "get_build_log_urls", get_build_log_urls)
+    monkeypatch.setattr(watch, "get_parent_build_status", get_parent_build_status)
+    monkeypatch.setattr(watch, "get_triggered_builds", lambda *_: [10, 11, 12])
+    monkeypatch.setattr(watch, "get_build_names", lambda *_: {})
+
+    sleeps: list[float] = []
+
+    async def fake_sleep(interval):
+        if sleeps:
+            polls.pop(0)
+        sleeps.append(interval)
+
+    async def run():
+        async with RequestScheduler() as scheduler:
+            await watch.watch_builds(
+                [build],
+                [report],
+                scheduler,
+                {BuildStatus.FAILURE},
+                sleep=fake_sleep,
+            )
+
+    asyncio.run(run())
+
+    # Request 10 was already finished, so it is never queried again
+    assert queried == [[11, 12]] * 3
+    # A poll with new builds resets the interval, an idle poll backs off
+    assert sleeps == [5.0, 5.0, 7.5]
+    assert report.statuses == {
+        BuildStatus.SUCCESS: [10, 12],
+        BuildStatus.FAILURE: [11],
+    }
+    assert report.parent_status == BuildStatus.FAILURE
+
+    output = capsys.readouterr().out
+    assert "Found 1 new triggered builds" in output
+    assert "checks.x86_64-linux.check-11: FAILURE" in output
+    assert "https://logs/111" in output
+    assert "check-10" not in output
+    assert "All builds finished" in output
@@ -19,7 +19,6 @@ let
     coreutils
     gh
     tea
-    buildbot-pr-check
   ];
 in
 python3.pkgs.buildPythonApplication {
@@ -32,8 +31,10 @@ python3.pkgs.buildPythonApplication {
 
   installPhase = ''
     install -D -m 0755 merge-when-green.py $out/bin/merge-when-green
+    # Buildbot builds are checked through buildbot-pr-check's library
     wrapProgram $out/bin/merge-when-green \
-      --prefix PATH : ${lib.makeBinPath runtimeDeps} --suffix PATH : ${lib.makeBinPath [ openssh ]}
+      --prefix PATH : ${lib.makeBinPath runtimeDeps} --suffix PATH : ${lib.makeBinPath [ openssh ]} \
+      --prefix PYTHONPATH : ${python3.pkgs.makePythonPath [ buildbot-pr-check ]}
   '';
 
   meta = {
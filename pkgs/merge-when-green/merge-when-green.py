@@ -4,21 +4,50 @@ merge-when-green - Create PR and merge when CI passes
 """
 
 import argparse
+import asyncio
 import json
 import os
+import random
 import re
-import shutil
 import subprocess
 import sys
 import tempfile
+import threading
 import time
 import urllib.error
 import urllib.request
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import Future, wait
 from enum import Enum
 from pathlib import Path
 from typing import Any
 
+from buildbot_pr_check import api
+from buildbot_pr_check.api import (
+    BuildbotAPIError,
+    BuildStatus,
+    EventStreamError,
+    GitHubAPIError,
+    InvalidPRURLError,
+    PRStatusPoller,
+    ResponseCache,
+    memoize_requests,
+    use_response_cache,
+)
+
+# Seconds a poll waits for Buildbot before showing the last known sub-builds
+SUBBUILD_POLL_DEADLINE = 5
+# Seconds between polls while waiting for a merge: the minimum while checks
+# change, growing by the backoff factor up to the maximum while they don't
+POLL_MIN_INTERVAL = 5.0
+POLL_MAX_INTERVAL = 60.0
+POLL_BACKOFF_FACTOR = 1.5
+# Each interval is spread by this fraction, so sessions don't poll in step
+POLL_JITTER = 0.2
+# Fixed intervals of the polls that start a subprocess (gh, tea), which
+# don't adapt; the GitHub one is also the baseline for the polls saved
+GITHUB_FIXED_INTERVAL = 10.0
+GITEA_FIXED_INTERVAL = 30.0
+
 
 class Colors:
     """ANSI color codes for terminal output."""
@@ -39,6 +68,14 @@ class Platform(Enum):
     GITEA = "gitea"
 
 
+class CheckProgress(Enum):
+    """How far a check has come, as far as its timing is concerned."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    FINISHED = "finished"
+
+
 def print_info(message: str) -> None:
     """Print an informational message."""
     print(message)
@@ -321,6 +358,11 @@ def check_gitea_pr_state(pr_id: str) -> bool | None:
     return None
 
 
+def check_name(check: dict[str, Any]) -> str:
+    """Name of a check run or commit status."""
+    return check.get("name") or check.get("context") or "unknown"
+
+
 def classify_checks(
     checks: list[dict[str, Any]],
 ) -> tuple[int, int, int, list[tuple[str, str, str | None]]]:
@@ -332,7 +374,7 @@ def classify_checks(
     pending = failed = passed = 0
     details: list[tuple[str, str, str | None]] = []
     for check in checks:
-        name = check.get("name") or check.get("context") or "unknown"
+        name = check_name(check)
         url = check.get("detailsUrl") or check.get("targetUrl")
         if check.get("__typename") == "CheckRun":
             status = check.get("status")
@@ -360,6 +402,21 @@ def classify_checks(
     return pending, failed, passed, details
 
 
+def check_progress(check: dict[str, Any]) -> CheckProgress:
+    """Whether a status check is queued, running or finished."""
+    if check.get("__typename") == "CheckRun":
+        status = check.get("status")
+        if status == "COMPLETED":
+            return CheckProgress.FINISHED
+        if status == "IN_PROGRESS":
+            return CheckProgress.RUNNING
+        return CheckProgress.QUEUED
+    # A commit status is only set once the check started
+    if check.get("state") == "PENDING":
+        return CheckProgress.RUNNING
+    return CheckProgress.FINISHED
+
+
 def check_pr_completion(
     pr_data: dict[str, Any], pending: int, failed: int
 ) -> tuple[bool, str] | None:
@@ -412,18 +469,58 @@ def get_pr_status_github(pr_id: str) -> tuple[dict[str, Any] | None, str]:
         return pr_data, ""
 
 
+def create_github_status_poller(pr_id: str) -> PRStatusPoller | None:
+    """Poller for the PR's status over the GitHub API, None if gh can't find it."""
+    # gh resolves branch names to PRs once; polls then go to the API directly
+    result = run(
+        ["gh", "pr", "view", pr_id, "--json", "url"], check=False, capture=True
+    )
+    if result.returncode != 0:
+        return None
+    try:
+        _, owner, repo, pr_num = api.get_pr_info(json.loads(result.stdout)["url"])
+    except (json.JSONDecodeError, KeyError, InvalidPRURLError):
+        return None
+    return PRStatusPoller(owner, repo, pr_num)
+
+
+def _buildbot_failure_urls(pr_data: dict[str, Any]) -> list[str]:
+    """Buildbot URLs of the failed checks of a PR."""
+    _, _, _, details = classify_checks(pr_data.get("statusCheckRollup", []))
+    return [
+        url
+        for _, symbol, url in details
+        if symbol == "❌" and url and "buildbot" in url
+    ]
+
+
+def _print_buildbot_failures(result: api.BuildResult) -> None:
+    """Print the failed parent and sub-builds of a Buildbot build with their logs."""
+    print(f"  ❌ {result.url}")
+    if api.is_failed_status(result.parent_status):
+        print(f"    Parent build: {result.parent_status.name}")
+        for log in result.parent_logs:
+            print_subtle(f"      {log.step_name}/{log.log_name}: {log.url}")
+    for sub_build in result.sub_builds:
+        if not api.is_failed_status(sub_build.status):
+            continue
+        print(f"    ❌ {sub_build.name} ({sub_build.status.name})")
+        for log in sub_build.log_urls:
+            print_subtle(f"      {log.step_name}/{log.log_name}: {log.url}")
+
+
 def run_buildbot_check_if_needed(
     pr_data: dict[str, Any], failed: int, pending: int, buildbot_check_done: bool
 ) -> bool:
-    """Run buildbot-pr-check if needed."""
+    """Show the failed Buildbot builds and their logs, once all checks finished."""
     if failed > 0 and pending == 0 and not buildbot_check_done:
-        pr_url = pr_data.get("url", "")
-        if pr_url and shutil.which("buildbot-pr-check"):
-            print_warning(
-                "\nRunning buildbot-pr-check to get detailed failure information..."
-            )
-            run(["buildbot-pr-check", pr_url], check=False)
-            print()  # Add blank line after buildbot-pr-check output
+        urls = _buildbot_failure_urls(pr_data)
+        if urls:
+            print_warning("\nBuildbot failure details:")
+            for result in api.check_builds(urls):
+                if result.failed:
+                    _print_buildbot_failures(result)
+            print()
         return True
     return buildbot_check_done
 
@@ -441,14 +538,6 @@ def parse_buildbot_url(url: str) -> tuple[str, str, str] | None:
     return base_url, match.group(1), match.group(2)
 
 
-def _fetch_buildbot_json(url: str) -> Any:
-    """Fetch JSON from buildbot API with timeout."""
-    req = urllib.request.Request(url)  # noqa: S310
-    req.add_header("User-Agent", "merge-when-green/0.3")
-    with urllib.request.urlopen(req, timeout=10) as resp:  # noqa: S310
-        return json.loads(resp.read())
-
-
 def _parse_nix_log_tail(raw: str) -> str | None:
     """Extract the last meaningful status line from nix build log output."""
     # Walk backwards through lines for the last interesting event
@@ -474,128 +563,271 @@ def _parse_nix_log_tail(raw: str) -> str | None:
     return None
 
 
-def _get_step_log_tail(base_url: str, step_id: int) -> str | None:
-    """Fetch the last ~4KB of the active step's log."""
-    try:
-        logs_data = _fetch_buildbot_json(
-            f"https://{base_url}/api/v2/steps/{step_id}/logs"
-        )
-        logs = logs_data.get("logs", [])
-        if not logs:
-            return None
-
-        log_id = logs[0].get("logid")
-        num_lines = logs[0].get("num_lines", 0)
-        if not log_id or num_lines == 0:
-            return None
-
-        # Fetch last 30 lines of log content
-        offset = max(0, num_lines - 30)
-        content_data = _fetch_buildbot_json(
-            f"https://{base_url}/api/v2/logs/{log_id}/contents?offset={offset}&limit=30"
-        )
-        chunks = content_data.get("logchunks", [])
-        raw = "".join(c.get("content", "") for c in chunks)
-        return _parse_nix_log_tail(raw)
-    except (
-        urllib.error.URLError,
-        urllib.error.HTTPError,
-        json.JSONDecodeError,
-        KeyError,
-    ):
-        return None
+def _subbuild_line(
+    sub_build: api.SubBuild, log_status: str | None = None
+) -> tuple[str, str, str | None]:
+    """Display (name, symbol, step_info) of a sub-build.
 
+    log_status is what the running step's log says, see _parse_nix_log_tail.
+    """
+    if not sub_build.complete:
+        if sub_build.queued:
+            return sub_build.name, "🔨", "queued"
+        step = sub_build.active_step
+        if step is None:
+            return sub_build.name, "🔨", None
+        # For build steps, the log says which derivation is building
+        return sub_build.name, "🔨", log_status or step.state or step.name
+    if sub_build.status == BuildStatus.SUCCESS:
+        return sub_build.name, "✅", None
+    if sub_build.status in (BuildStatus.WARNINGS, BuildStatus.SKIPPED):
+        return sub_build.name, "⏭️", None
+    return sub_build.name, "❌", None
+
+
+class BuildbotEventWatcher:
+    """Follows the websocket events of one Buildbot master in the background.
+
+    It remembers which tracked build requests and parent builds Buildbot
+    reported changes for, so sub-builds whose results are cached are only
+    queried again once something happened to them. Until it has subscribed,
+    and for good once the connection fails, it is not active and everything
+    is queried as before.
+    """
 
-def _get_active_step(base_url: str, req_id: int) -> str | None:
-    """Get the currently running step and what it's doing."""
-    try:
-        builds_data = _fetch_buildbot_json(
-            f"https://{base_url}/api/v2/buildrequests/{req_id}/builds"
-        )
-        builds = builds_data.get("builds", [])
-        if not builds:
-            return "queued"
-
-        build_id = builds[0].get("buildid")
-        if not build_id:
-            return None
+    # Claims and completions of the whole master, filtered on tracked requests
+    REQUEST_SUBSCRIPTIONS = ("buildrequests/*/claimed", "buildrequests/*/complete")
+    # Events of one tracked parent build and its steps
+    PARENT_SUBSCRIPTIONS = ("builds/{build_id}/*", "builds/{build_id}/steps/*/*")
+
+    def __init__(self, base_url: str) -> None:
+        self.base_url = base_url
+        self.active = False
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._stream: api.EventStream | None = None
+        self._changed_requests: set[int] = set()
+        self._changed_builds: set[int] = set()
+        # Build requests whose events are recorded
+        self._tracked: set[int] = set()
+        # Parent build IDs whose events are subscribed to
+        self._subscribed: set[int] = set()
+        self._results: dict[int, tuple[str, str, str | None]] = {}
+        # (builder ID, build number) -> (parent build ID, triggered request IDs)
+        self._parents: dict[tuple[str, str], tuple[int, list[int]]] = {}
+
+    def start(self) -> None:
+        """Connect and follow events on a daemon thread."""
+        threading.Thread(
+            target=asyncio.run,
+            args=(self._follow(),),
+            name=f"events-{self.base_url}",
+            daemon=True,
+        ).start()
+
+    async def _follow(self) -> None:
+        try:
+            stream = await api.EventStream.connect(self.base_url)
+            async with stream:
+                for path in self.REQUEST_SUBSCRIPTIONS:
+                    await stream.subscribe(path)
+                with self._lock:
+                    self._loop = asyncio.get_running_loop()
+                    self._stream = stream
+                    self.active = True
+                    parents = [build_id for build_id, _ in self._parents.values()]
+                for build_id in parents:
+                    await self._subscribe_parent(build_id)
+                while True:
+                    event = await stream.next_event()
+                    self.handle_event(event.key, event.data)
+        except EventStreamError:
+            pass
+        finally:
+            with self._lock:
+                self.active = False
+                self._stream = None
+
+    async def _subscribe_parent(self, build_id: int) -> None:
+        with self._lock:
+            stream = self._stream
+            if stream is None or build_id in self._subscribed:
+                return
+        try:
+            for path in self.PARENT_SUBSCRIPTIONS:
+                await stream.subscribe(path.format(build_id=build_id))
+        except EventStreamError:
+            # The parent keeps being queried every poll
+            return
+        with self._lock:
+            self._subscribed.add(build_id)
+
+    def handle_event(self, key: tuple[str, ...], data: dict[str, Any]) -> None:
+        """Record what a Buildbot event changed for the tracked builds."""
+        if len(key) < 2 or not key[1].isdigit():
+            return
+        with self._lock:
+            if key[0] == "buildrequests" and int(key[1]) in self._tracked:
+                self._changed_requests.add(int(key[1]))
+            elif key[0] == "builds" and int(key[1]) in self._subscribed:
+                self._changed_builds.add(int(key[1]))
+
+    def cached_request_ids(self, builder_id: str, build_num: str) -> list[int] | None:
+        """Triggered request IDs of a parent build, if it did not change since."""
+        with self._lock:
+            parent = self._parents.get((builder_id, build_num))
+            if not self.active or parent is None:
+                return None
+            build_id, request_ids = parent
+            if build_id not in self._subscribed:
+                return None
+            if build_id in self._changed_builds:
+                self._changed_builds.discard(build_id)
+                return None
+            return request_ids
+
+    def store_request_ids(
+        self, builder_id: str, build_num: str, build_id: int, request_ids: list[int]
+    ) -> None:
+        with self._lock:
+            self._parents[(builder_id, build_num)] = (build_id, request_ids)
+            self._tracked.update(request_ids)
+            loop = self._loop
+        if loop is not None and self.active:
+            # Follow the parent from the event thread, cached once subscribed
+            asyncio.run_coroutine_threadsafe(self._subscribe_parent(build_id), loop)
+
+    def cached_result(self, request_id: int) -> tuple[str, str, str | None] | None:
+        """Result of a sub-build, if Buildbot reported no change since."""
+        with self._lock:
+            result = self._results.get(request_id)
+            if not self.active or result is None:
+                return None
+            if request_id in self._changed_requests:
+                self._changed_requests.discard(request_id)
+                return None
+            return result
+
+    def store_result(
+        self, request_id: int, result: tuple[str, str, str | None]
+    ) -> None:
+        with self._lock:
+            self._results[request_id] = result
+            self._tracked.add(request_id)
+
+
+class SubBuildState:
+    """Sub-builds seen during one merge-when-green session.
+
+    Finished sub-builds never change again, so their lines are kept and only
+    incomplete build requests are queried on later polls. Once the trigger
+    steps of a parent build have finished, its list of triggered requests is
+    final and its steps aren't read again either. The logs of running
+    builds are followed by offset, and only their new lines are parsed.
+    """
 
-        steps_data = _fetch_buildbot_json(
-            f"https://{base_url}/api/v2/builds/{build_id}/steps"
-        )
-        # Find the currently running step (last incomplete one)
-        for step in steps_data.get("steps", []):
-            if not step.get("complete", False):
-                step_name = step.get("name", "")
-                state = step.get("state_string", "")
-                label = state if state else step_name
-
-                # For build steps, dig into the log for derivation detail
-                step_id = step.get("stepid")
-                if step_id and "build" in step_name.lower():
-                    drv = _get_step_log_tail(base_url, step_id)
-                    if drv:
-                        return drv
-
-                return label
-        return None
-    except (
-        urllib.error.URLError,
-        urllib.error.HTTPError,
-        json.JSONDecodeError,
-        KeyError,
-    ):
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.active_steps = api.ActiveStepTracker()
+        # (host, request ID) -> (step name, last status parsed from its log)
+        self._log_status: dict[tuple[str, int], tuple[str, str]] = {}
+        # (host, builder ID, build number) -> triggered request IDs
+        self._request_ids: dict[tuple[str, str, str], list[int]] = {}
+        # (host, request ID) -> (name, symbol, step_info) of a finished sub-build
+        self._finished: dict[tuple[str, int], tuple[str, str, str | None]] = {}
+
+    def request_ids(
+        self, base_url: str, builder_id: str, build_num: str
+    ) -> list[int] | None:
+        """Triggered request IDs of a parent build, if triggering is done."""
+        with self._lock:
+            return self._request_ids.get((base_url, builder_id, build_num))
+
+    def store_request_ids(
+        self, base_url: str, builder_id: str, build_num: str, request_ids: list[int]
+    ) -> None:
+        with self._lock:
+            self._request_ids[(base_url, builder_id, build_num)] = request_ids
+
+    def finished_result(
+        self, base_url: str, request_id: int
+    ) -> tuple[str, str, str | None] | None:
+        """Result of a sub-build, if it had finished."""
+        with self._lock:
+            return self._finished.get((base_url, request_id))
+
+    def store_finished(
+        self, base_url: str, request_id: int, result: tuple[str, str, str | None]
+    ) -> None:
+        with self._lock:
+            self._finished[(base_url, request_id)] = result
+
+    def log_status(
+        self, base_url: str, request_id: int, step: api.ActiveStep
+    ) -> str | None:
+        """Status from a running step's log, parsing only its new lines."""
+        key = (base_url, request_id)
+        status = _parse_nix_log_tail("\n".join(step.new_lines))
+        with self._lock:
+            if status is not None:
+                self._log_status[key] = (step.name, status)
+                return status
+            previous = self._log_status.get(key)
+        if previous is not None and previous[0] == step.name:
+            return previous[1]
         return None
 
 
-def _check_one_build_request(
-    base_url: str, req_id: int
-) -> tuple[str, str, str | None] | None:
-    """Check status of a single build request. Returns (name, symbol, step_info)."""
+def _get_triggered_request_ids(
+    base_url: str,
+    builder_id: str,
+    build_num: str,
+    watcher: BuildbotEventWatcher | None,
+    state: SubBuildState | None = None,
+) -> list[int] | None:
+    """Get the build request IDs a parent build triggered, None on API errors."""
+    if state is not None:
+        known = state.request_ids(base_url, builder_id, build_num)
+        if known is not None:
+            return known
+    if watcher is not None:
+        cached = watcher.cached_request_ids(builder_id, build_num)
+        if cached is not None:
+            return cached
+    events_active = watcher is not None and watcher.active
+
     try:
-        data = _fetch_buildbot_json(
-            f"https://{base_url}/api/v2/buildrequests/{req_id}?property=*"
+        request_ids, triggered = api.get_triggered_builds_progress(
+            base_url, builder_id, build_num
         )
-        request = data["buildrequests"][0]
-        result_code = request.get("results")
-        properties = request.get("properties", {})
-
-        # Get name from virtual_builder_name property
-        name = None
-        if "virtual_builder_name" in properties:
-            vname = properties["virtual_builder_name"][0]
-            name = vname.split("#", 1)[1] if "#" in vname else vname
-        if not name:
-            name = f"request-{req_id}"
-
-        # Map result code to symbol
-        step_info = None
-        if result_code is None:
-            symbol = "🔨"
-            step_info = _get_active_step(base_url, req_id)
-        elif result_code == 0:
-            symbol = "✅"
-        elif result_code in (1, 3):  # warnings, skipped
-            symbol = "⏭️"
-        else:
-            symbol = "❌"
-
-        return name, symbol, step_info
-    except (
-        urllib.error.URLError,
-        urllib.error.HTTPError,
-        json.JSONDecodeError,
-        KeyError,
-        IndexError,
-    ):
+        if state is not None and triggered:
+            state.store_request_ids(base_url, builder_id, build_num, request_ids)
+        elif watcher is not None and events_active:
+            # Events name the parent by build ID
+            build_id = api.get_build_id(base_url, builder_id, build_num)
+            watcher.store_request_ids(builder_id, build_num, build_id, request_ids)
+    except BuildbotAPIError:
         return None
+    return request_ids
 
 
-def query_buildbot_subbuilds(
+_watchers_lock = threading.Lock()
+
+
+async def query_subbuilds(
+    scheduler: api.RequestScheduler,
     details_url: str,
+    watchers: dict[str, BuildbotEventWatcher] | None = None,
+    state: SubBuildState | None = None,
 ) -> list[tuple[str, str, str | None]]:
     """Query Buildbot API for sub-build statuses.
 
+    Every Buildbot request goes through the scheduler, so the checks of a
+    poll that share it share its per-host connection limit. With a session
+    state, finished sub-builds are not queried again. With event watchers
+    (by Buildbot host), sub-builds that finished or are still queued are
+    only queried again after an event for them.
+
     Returns list of (name, symbol, step_info) for each triggered sub-build.
     """
     parsed = parse_buildbot_url(details_url)
@@ -603,45 +835,164 @@ def query_buildbot_subbuilds(
         return []
     base_url, builder_id, build_num = parsed
 
-    # Get triggered build request IDs from build steps
-    try:
-        steps_data = _fetch_buildbot_json(
-            f"https://{base_url}/api/v2/builders/{builder_id}/builds/{build_num}/steps"
-        )
-    except (urllib.error.URLError, urllib.error.HTTPError, json.JSONDecodeError):
-        return []
-
-    request_ids = []
-    for step in steps_data.get("steps", []):
-        if "build" in step.get("name", "").lower():
-            for url_info in step.get("urls", []):
-                match = re.search(r"buildrequests/(\d+)", url_info.get("url", ""))
-                if match:
-                    request_ids.append(int(match.group(1)))
+    watcher = None
+    if watchers is not None:
+        # Checks of the same host may be queried concurrently
+        with _watchers_lock:
+            watcher = watchers.get(base_url)
+            if watcher is None:
+                watcher = watchers[base_url] = BuildbotEventWatcher(base_url)
+                watcher.start()
 
+    # Get triggered build request IDs from build steps
+    request_ids = await scheduler.run(
+        base_url,
+        api.Priority.STATUS,
+        _get_triggered_request_ids,
+        base_url,
+        builder_id,
+        build_num,
+        watcher,
+        state,
+    )
     if not request_ids:
         return []
 
-    # Query all build requests in parallel
-    results: list[tuple[str, str, str | None]] = []
-    workers = min(20, len(request_ids))
-    with ThreadPoolExecutor(max_workers=workers) as pool:
-        futures = {
-            pool.submit(_check_one_build_request, base_url, rid): rid
-            for rid in sorted(request_ids)
-        }
-        for future in as_completed(futures):
-            result = future.result()
-            if result:
-                results.append(result)
+    results: dict[int, tuple[str, str, str | None]] = {}
+    changed = []
+    for rid in request_ids:
+        cached = state.finished_result(base_url, rid) if state is not None else None
+        if cached is None and watcher is not None:
+            cached = watcher.cached_result(rid)
+        if cached is not None:
+            results[rid] = cached
+        else:
+            changed.append(rid)
+
+    # Only results fetched after subscribing can be trusted until the next event
+    events_active = watcher is not None and watcher.active
+    if changed:
+        # All changed build requests in bulk, with the steps of running ones
+        for sub_build in await api.query_sub_builds(
+            scheduler,
+            base_url,
+            changed,
+            with_active_steps=True,
+            tracker=state.active_steps if state is not None else None,
+        ):
+            step = sub_build.active_step
+            log_status = None
+            if step is not None and state is not None:
+                log_status = state.log_status(base_url, sub_build.request_id, step)
+            elif step is not None:
+                log_status = _parse_nix_log_tail("\n".join(step.log_tail))
+            result = _subbuild_line(sub_build, log_status)
+            results[sub_build.request_id] = result
+            if state is not None and sub_build.complete:
+                state.store_finished(base_url, sub_build.request_id, result)
+            # Running builds are queried every time, their logs keep moving;
+            # finished and queued ones only change with an event
+            if (
+                watcher is not None
+                and events_active
+                and (sub_build.complete or sub_build.queued)
+            ):
+                watcher.store_result(sub_build.request_id, result)
 
     # Sort by name for stable output
-    results.sort(key=lambda r: r[0])
-    return results
+    return sorted(results.values(), key=lambda r: r[0])
+
 
+def query_buildbot_subbuilds(
+    details_url: str,
+    watchers: dict[str, BuildbotEventWatcher] | None = None,
+    state: SubBuildState | None = None,
+) -> list[tuple[str, str, str | None]]:
+    """Query the sub-builds of one Buildbot check with a scheduler of its own."""
 
-def _format_check_line(name: str, symbol: str) -> str:
+    async def query() -> list[tuple[str, str, str | None]]:
+        async with api.RequestScheduler() as scheduler:
+            return await query_subbuilds(scheduler, details_url, watchers, state)
+
+    return asyncio.run(query())
+
+
+class SubBuildFetcher:
+    """Queries the sub-builds of all Buildbot checks of a poll concurrently.
+
+    The queries run on an event loop of its own, through one
+    RequestScheduler for the whole session, so the per-host connection
+    limit holds across checks and polls. Each poll waits at most `deadline`
+    seconds. A query that takes longer keeps running and a later poll picks
+    up its result; until then, and when a query fails, the sub-builds from
+    the last finished query are shown as stale.
+    """
+
+    def __init__(
+        self,
+        watchers: dict[str, BuildbotEventWatcher] | None = None,
+        state: SubBuildState | None = None,
+        deadline: float = SUBBUILD_POLL_DEADLINE,
+    ) -> None:
+        self.watchers = watchers
+        self.state = state
+        self.deadline = deadline
+        # Failed queries since the last poll printed them
+        self.errors: list[str] = []
+        self._scheduler = api.RequestScheduler()
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(
+            target=self._loop.run_forever, name="subbuilds", daemon=True
+        ).start()
+        self._pending: dict[str, Future[list[tuple[str, str, str | None]]]] = {}
+        self._results: dict[str, list[tuple[str, str, str | None]]] = {}
+
+    def fetch(
+        self, details_urls: list[str]
+    ) -> dict[str, tuple[list[tuple[str, str, str | None]], bool]]:
+        """Get (sub-builds, stale) per details URL."""
+        urls = list(dict.fromkeys(details_urls))
+        for url in urls:
+            if url not in self._pending:
+                self._pending[url] = asyncio.run_coroutine_threadsafe(
+                    query_subbuilds(self._scheduler, url, self.watchers, self.state),
+                    self._loop,
+                )
+        wait([self._pending[url] for url in urls], timeout=self.deadline)
+
+        subbuilds = {}
+        for url in urls:
+            future = self._pending[url]
+            if not future.done():
+                subbuilds[url] = (self._results.get(url, []), True)
+                continue
+            del self._pending[url]
+            try:
+                self._results[url] = future.result()
+            except Exception as e:
+                self.errors.append(f"Querying the sub-builds of {url} failed: {e}")
+                subbuilds[url] = (self._results.get(url, []), True)
+            else:
+                subbuilds[url] = (self._results[url], False)
+        return subbuilds
+
+    async def _cancel_queries(self) -> None:
+        queries = asyncio.all_tasks() - {asyncio.current_task()}
+        for query in queries:
+            query.cancel()
+        await asyncio.gather(*queries, return_exceptions=True)
+
+    def close(self) -> None:
+        """Cancel the running queries and stop the event loop."""
+        asyncio.run_coroutine_threadsafe(self._cancel_queries(), self._loop).result()
+        self._scheduler.close()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+def _format_check_line(name: str, symbol: str, stale: bool = False) -> str:
     """Format a single check line."""
+    if stale:
+        return f"  {symbol} {name} {Colors.GRAY}(stale){Colors.RESET}"
     return f"  {symbol} {name}"
 
 
@@ -654,19 +1005,39 @@ def _format_subbuild_line(sub_name: str, sub_symbol: str, step_info: str | None)
 
 def _print_check_details(
     details: list[tuple[str, str, str | None]],
+    fetcher: SubBuildFetcher | None = None,
 ) -> int:
     """Print per-check details with buildbot sub-builds expanded.
 
-    Returns the number of extra sub-build lines printed.
+    Without a fetcher, the Buildbot checks are queried one after another.
+    Returns the number of extra lines printed, for sub-builds and failed
+    queries.
     """
+    buildbot_urls = [
+        details_url
+        for _, _, details_url in details
+        if details_url and "buildbot" in details_url
+    ]
+    errors: list[str] = []
+    if fetcher is not None:
+        subbuilds = fetcher.fetch(buildbot_urls)
+        errors, fetcher.errors = fetcher.errors, []
+    else:
+        subbuilds = {
+            url: (query_buildbot_subbuilds(url), False)
+            for url in dict.fromkeys(buildbot_urls)
+        }
+
     extra_lines = 0
     for name, symbol, details_url in details:
-        print(_format_check_line(name, symbol))
-        if details_url and "buildbot" in details_url:
-            subbuilds = query_buildbot_subbuilds(details_url)
-            for sub_name, sub_symbol, step_info in subbuilds:
-                print(_format_subbuild_line(sub_name, sub_symbol, step_info))
-                extra_lines += 1
+        lines, stale = subbuilds.get(details_url or "", ([], False))
+        print(_format_check_line(name, symbol, stale))
+        for sub_name, sub_symbol, step_info in lines:
+            print(_format_subbuild_line(sub_name, sub_symbol, step_info))
+            extra_lines += 1
+    for error in errors:
+        print_warning(error)
+        extra_lines += 1
     return extra_lines
 
 
@@ -695,53 +1066,247 @@ def _checks_changed(
     return False
 
 
+def _check_durations_path() -> Path:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or str(Path.home() / ".cache")
+    return Path(cache_home) / "merge-when-green" / "check-durations.json"
+
+
+def _load_all_check_durations() -> dict[str, Any]:
+    try:
+        durations = json.loads(_check_durations_path().read_text())
+    except (OSError, json.JSONDecodeError):
+        return {}
+    return durations if isinstance(durations, dict) else {}
+
+
+def load_check_durations(repo: str) -> dict[str, float]:
+    """Load how long the checks of a repo took in earlier sessions, by name."""
+    durations = _load_all_check_durations().get(repo)
+    if not isinstance(durations, dict):
+        return {}
+    return {
+        name: float(seconds)
+        for name, seconds in durations.items()
+        if isinstance(seconds, int | float)
+    }
+
+
+def save_check_durations(repo: str, durations: dict[str, float]) -> None:
+    """Store the check durations of a repo for later sessions, ignoring errors."""
+    path = _check_durations_path()
+    all_durations = _load_all_check_durations()
+    all_durations[repo] = durations
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(all_durations, indent=2, sort_keys=True))
+    except OSError:
+        pass
+
+
+def _pr_repo(pr_data: dict[str, Any]) -> str | None:
+    """The owner/repo of a pull request, None if its URL is unknown."""
+    try:
+        _, owner, repo, _ = api.get_pr_info(pr_data.get("url") or "")
+    except InvalidPRURLError:
+        return None
+    return f"{owner}/{repo}"
+
+
+class PollScheduler:
+    """Decides how long wait_for_merge sleeps between polls.
+
+    Polls every POLL_MIN_INTERVAL seconds while checks change and backs off
+    exponentially, with jitter, while they don't. Check durations from
+    earlier sessions give an ETA for the pending checks; when the ETA falls
+    within the next interval, the next poll happens right at the ETA.
+    """
+
+    def __init__(
+        self,
+        fixed_interval: float,
+        durations: dict[str, float] | None = None,
+    ) -> None:
+        self.fixed_interval = fixed_interval
+        # Seconds each check took, by name
+        self.durations = durations if durations is not None else {}
+        # The repo the durations belong to, once known
+        self.repo: str | None = None
+        self.interval = POLL_MIN_INTERVAL
+        self.polls = 0
+        self.eta: float | None = None
+        self._started = time.monotonic()
+        # Pending check name -> when it was first seen pending
+        self._pending_since: dict[str, float] = {}
+        # Pending checks whose start was seen, so their duration is known
+        self._timed: set[str] = set()
+
+    def observe(self, checks: dict[str, CheckProgress], changed: bool) -> None:
+        """Record a poll of the checks, by name."""
+        now = time.monotonic()
+        first_poll = self.polls == 0
+        self.polls += 1
+        for name, progress in checks.items():
+            if progress != CheckProgress.FINISHED:
+                if name not in self._pending_since:
+                    self._pending_since[name] = now
+                    # Checks already running when the session started have
+                    # been running for an unknown time
+                    if progress == CheckProgress.QUEUED or not first_poll:
+                        self._timed.add(name)
+            elif name in self._pending_since:
+                duration = now - self._pending_since.pop(name)
+                if name not in self._timed:
+                    continue
+                self._timed.discard(name)
+                previous = self.durations.get(name)
+                # Average with earlier runs, favouring the latest
+                self.durations[name] = (
+                    duration if previous is None else (previous + duration) / 2
+                )
+
+        pending = [
+            name
+            for name, progress in checks.items()
+            if progress != CheckProgress.FINISHED
+        ]
+        if pending and all(name in self.durations for name in pending):
+            self.eta = max(
+                self._pending_since[name] + self.durations[name] for name in pending
+            )
+        else:
+            self.eta = None
+
+        if changed:
+            self.interval = POLL_MIN_INTERVAL
+        else:
+            self.interval = min(self.interval * POLL_BACKOFF_FACTOR, POLL_MAX_INTERVAL)
+
+    def next_delay(self) -> float:
+        """Seconds to sleep before the next poll."""
+        delay = self.interval * random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER)
+        if self.eta is not None:
+            until_eta = self.eta - time.monotonic()
+            if 0 < until_eta < delay:
+                # Poll right when the checks should finish, then quickly
+                self.interval = POLL_MIN_INTERVAL
+                delay = max(until_eta, POLL_MIN_INTERVAL)
+        return delay
+
+    @property
+    def saved(self) -> int:
+        """Polls saved compared with polling every fixed_interval seconds.
+
+        Negative when polling quickly while checks changed took more polls.
+        """
+        elapsed = time.monotonic() - self._started
+        return int(elapsed // self.fixed_interval) + 1 - self.polls
+
+    def report(self) -> None:
+        """Print how many polls the adaptive intervals saved."""
+        saved = self.saved
+        print_subtle(
+            f"Polled {self.polls} times, {abs(saved)} "
+            f"{'fewer' if saved >= 0 else 'more'} than every "
+            f"{self.fixed_interval:g}s"
+        )
+
+
 def wait_for_merge(platform: Platform, pr_id: str, verbose: bool = False) -> bool:
     """Wait for PR to be merged."""
     print_header(f"Waiting for PR '{pr_id}' to merge...")
 
     if platform == Platform.GITEA:
-        # Gitea: simple polling
+        # Gitea: simple polling, each poll starts tea
         while True:
             result = check_gitea_pr_state(pr_id)
             if result is not None:
                 return result
             print(f"[{time.strftime('%H:%M:%S')}] Waiting...")
-            time.sleep(30)
-
-    # GitHub: detailed check monitoring
+            time.sleep(GITEA_FIXED_INTERVAL)
+
+    # GitHub: detailed check monitoring. Finished Buildbot builds are served
+    # from buildbot-pr-check's response cache.
+    cache = ResponseCache.open_default()
+    # Buildbot event watchers by host and the finished sub-builds, so
+    # unchanged sub-builds aren't queried again
+    fetcher = SubBuildFetcher({}, SubBuildState())
+    scheduler = PollScheduler(GITHUB_FIXED_INTERVAL)
+    try:
+        with use_response_cache(cache):
+            return _wait_for_github_merge(pr_id, verbose, fetcher, scheduler)
+    finally:
+        fetcher.close()
+        if cache is not None:
+            cache.close()
+        if scheduler.repo is not None:
+            save_check_durations(scheduler.repo, scheduler.durations)
+        scheduler.report()
+
+
+def _wait_for_github_merge(
+    pr_id: str, verbose: bool, fetcher: SubBuildFetcher, scheduler: PollScheduler
+) -> bool:
+    """Poll the checks of a GitHub PR until it is merged or cannot be."""
     buildbot_check_done = False
     prev_lines = 0
     prev_details: list[tuple[str, str, str | None]] = []
+    # Polls the GitHub API in-process; gh is the fallback
+    poller = create_github_status_poller(pr_id)
     while True:
-        pr_data, error = get_pr_status_github(pr_id)
+        pr_data = None
+        if poller is not None:
+            try:
+                pr_data, error = poller.poll(), ""
+            except GitHubAPIError as e:
+                print_warning(f"Polling the GitHub API failed, using gh: {e}")
+                poller = None
+        if pr_data is None:
+            pr_data, error = get_pr_status_github(pr_id)
         if pr_data is None:
             print_error(error)
             return False
 
         checks = pr_data.get("statusCheckRollup", [])
         pending, failed, passed, details = classify_checks(checks)
+        changed = _checks_changed(details, prev_details)
+        if scheduler.repo is None:
+            # Check names are only unique within a repo
+            scheduler.repo = _pr_repo(pr_data)
+            if scheduler.repo is not None:
+                scheduler.durations = load_check_durations(scheduler.repo)
+        # Poll quickly while checks change, back off while they don't
+        scheduler.observe(
+            {
+                check_name(check): check_progress(check)
+                for check in checks
+                if check.get("__typename") in ("CheckRun", "StatusContext")
+            },
+            changed,
+        )
+
+        # Checks often share a Buildbot build, query it once per poll. The
+        # checks are queried concurrently, for at most SUBBUILD_POLL_DEADLINE.
+        with memoize_requests():
+            if verbose:
+                # Append-only: print every update on new lines
+                if changed or not prev_details:
+                    _print_summary(passed, failed, pending)
+                    _print_check_details(details, fetcher)
+            else:
+                # Compact: overwrite previous output in-place
+                if prev_lines > 0:
+                    sys.stdout.write(f"\033[{prev_lines}A\033[J")
 
-        if verbose:
-            # Append-only: print every update on new lines
-            changed = _checks_changed(details, prev_details)
-            if changed or not prev_details:
                 _print_summary(passed, failed, pending)
-                _print_check_details(details)
-                prev_details = list(details)
-        else:
-            # Compact: overwrite previous output in-place
-            if prev_lines > 0:
-                sys.stdout.write(f"\033[{prev_lines}A\033[J")
-
-            _print_summary(passed, failed, pending)
-            extra_lines = _print_check_details(details)
-            sys.stdout.flush()
-            prev_lines = 1 + len(details) + extra_lines
-
-        # Run buildbot-pr-check if we have failing checks
-        buildbot_check_done = run_buildbot_check_if_needed(
-            pr_data, failed, pending, buildbot_check_done
-        )
+                extra_lines = _print_check_details(details, fetcher)
+                sys.stdout.flush()
+                prev_lines = 1 + len(details) + extra_lines
+
+            # Show the failed Buildbot builds once all checks finished
+            buildbot_check_done = run_buildbot_check_if_needed(
+                pr_data, failed, pending, buildbot_check_done
+            )
+        prev_details = list(details)
 
         # Check for completion
         completion = check_pr_completion(pr_data, pending, failed)
@@ -751,8 +1316,11 @@ def wait_for_merge(platform: Platform, pr_id: str, verbose: bool = False) -> boo
                 print_error(f"\n{message}")
             return success
 
-        # Still waiting
-        time.sleep(10)
+        # Still waiting; each gh poll starts a subprocess, so it isn't sped up
+        if poller is not None:
+            time.sleep(scheduler.next_delay())
+        else:
+            time.sleep(GITHUB_FIXED_INTERVAL)
 
 
 def get_pr_message_from_editor(default_branch: str) -> tuple[str, str]:
@@ -1,9 +1,19 @@
 #!/usr/bin/env python3
 """Tests for merge-when-green, focused on the buildbot expansion and check classification."""
 
+import asyncio
 import importlib.util
+import subprocess
+import sys
+import threading
 from pathlib import Path
-from unittest.mock import patch
+from unittest.mock import ANY, patch
+
+# buildbot-pr-check's library, like the wrapper's PYTHONPATH
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "buildbot-pr-check"))
+
+import buildbot_pr_check
+from buildbot_pr_check import BuildbotAPIError
 
 # Load the module from its hyphenated filename
 _spec = importlib.util.spec_from_file_location(
@@ -18,12 +28,18 @@ classify_checks = _mod.classify_checks
 check_pr_completion = _mod.check_pr_completion
 parse_buildbot_url = _mod.parse_buildbot_url
 _parse_nix_log_tail = _mod._parse_nix_log_tail
-_fetch_buildbot_json = _mod._fetch_buildbot_json
-_get_step_log_tail = _mod._get_step_log_tail
-_get_active_step = _mod._get_active_step
-_check_one_build_request = _mod._check_one_build_request
+_subbuild_line = _mod._subbuild_line
 query_buildbot_subbuilds = _mod.query_buildbot_subbuilds
+BuildbotEventWatcher = _mod.BuildbotEventWatcher
+SubBuildState = _mod.SubBuildState
+SubBuildFetcher = _mod.SubBuildFetcher
+_print_check_details = _mod._print_check_details
 run_buildbot_check_if_needed = _mod.run_buildbot_check_if_needed
+create_github_status_poller = _mod.create_github_status_poller
+PollScheduler = _mod.PollScheduler
+QUEUED = _mod.CheckProgress.QUEUED
+RUNNING = _mod.CheckProgress.RUNNING
+FINISHED = _mod.CheckProgress.FINISHED
 
 
 # ---------------------------------------------------------------------------
@@ -217,6 +233,16 @@ class TestClassifyChecks:
         assert (pending, failed, passed) == (0, 0, 0)
         assert details == []
 
+    def test_check_progress(self):
+        def progress(**check):
+            return _mod.check_progress(check)
+
+        assert progress(__typename="CheckRun", status="QUEUED") == QUEUED
+        assert progress(__typename="CheckRun", status="IN_PROGRESS") == RUNNING
+        assert progress(__typename="CheckRun", status="COMPLETED") == FINISHED
+        assert progress(__typename="StatusContext", state="PENDING") == RUNNING
+        assert progress(__typename="StatusContext", state="FAILURE") == FINISHED
+
 
 # ---------------------------------------------------------------------------
 # check_pr_completion
@@ -392,474 +418,478 @@ class TestParseNixLogTail:
 
 
 # ---------------------------------------------------------------------------
-# query_buildbot_subbuilds (mocked API)
+# query_buildbot_subbuilds (mocked buildbot-pr-check API)
 # ---------------------------------------------------------------------------
 
+SubBuild = buildbot_pr_check.SubBuild
+ActiveStep = buildbot_pr_check.ActiveStep
+BuildResult = buildbot_pr_check.BuildResult
+BuildStatus = buildbot_pr_check.BuildStatus
+URL = "https://bb.example.com/#/builders/1/builds/1"
 
-def _make_steps_response(steps: list[dict]) -> dict:
-    return {"steps": steps}
 
+def _sub_build(rid, status=BuildStatus.SUCCESS, name=None, **kwargs):
+    return SubBuild(
+        request_id=rid,
+        name=name or f"checks.check-{rid}",
+        status=status,
+        complete=kwargs.pop("complete", status is not None),
+        **kwargs,
+    )
 
-def _make_buildrequests_response(requests: list[dict]) -> dict:
-    return {"buildrequests": requests}
 
+def _fake_sub_builds(sub_builds):
+    """query_sub_builds returning the given sub-builds that were asked for"""
+    by_id = {sub_build.request_id: sub_build for sub_build in sub_builds}
 
-def _make_builds_response(builds: list[dict]) -> dict:
-    return {"builds": builds}
+    async def query_sub_builds(
+        scheduler, base_url, request_ids, with_active_steps=False, tracker=None
+    ):
+        return sorted(
+            (by_id[rid] for rid in request_ids), key=lambda sub_build: sub_build.name
+        )
+
+    return query_sub_builds
 
 
 class TestQueryBuildbotSubbuilds:
     def test_unparseable_url(self):
         assert query_buildbot_subbuilds("https://example.com/nope") == []
 
-    @patch.object(_mod, "_fetch_buildbot_json")
-    def test_no_triggered_steps(self, mock_fetch):
+    @patch.object(_mod.api, "get_triggered_builds_progress", return_value=([], False))
+    def test_no_triggered_steps(self, mock_triggered):
         """If the parent build has no trigger steps, return empty."""
-        mock_fetch.return_value = _make_steps_response(
-            [{"name": "checkout", "urls": []}]
-        )
-        result = query_buildbot_subbuilds(
-            "https://bb.example.com/#/builders/1/builds/1"
-        )
-        assert result == []
-
-    @patch.object(_mod, "_fetch_buildbot_json")
-    def test_two_subbuilds_both_passed(self, mock_fetch):
-        def api_dispatch(url):
-            if "/builders/1/builds/1/steps" in url:
-                return _make_steps_response(
-                    [
-                        {
-                            "name": "trigger-build",
-                            "urls": [
-                                {"url": "https://bb.example.com/buildrequests/10"},
-                                {"url": "https://bb.example.com/buildrequests/11"},
-                            ],
-                        }
-                    ]
-                )
-            if "buildrequests/10" in url and "property" in url:
-                return _make_buildrequests_response(
-                    [
-                        {
-                            "results": 0,
-                            "properties": {
-                                "virtual_builder_name": [
-                                    "project#checks.x86_64-linux.aspen1"
-                                ]
-                            },
-                        }
-                    ]
-                )
-            if "buildrequests/11" in url and "property" in url:
-                return _make_buildrequests_response(
-                    [
-                        {
-                            "results": 0,
-                            "properties": {
-                                "virtual_builder_name": [
-                                    "project#checks.x86_64-linux.aspen2"
-                                ]
-                            },
-                        }
-                    ]
-                )
-            return {}
-
-        mock_fetch.side_effect = api_dispatch
-        result = query_buildbot_subbuilds(
-            "https://bb.example.com/#/builders/1/builds/1"
-        )
-        assert len(result) == 2
-        names = [r[0] for r in result]
-        assert "checks.x86_64-linux.aspen1" in names
-        assert "checks.x86_64-linux.aspen2" in names
-        assert all(r[1] == "✅" for r in result)
-        assert all(r[2] is None for r in result)
-
-    @patch.object(_mod, "_fetch_buildbot_json")
-    def test_in_progress_build_shows_step_info(self, mock_fetch):
-        def api_dispatch(url):
-            if "/builders/1/builds/1/steps" in url:
-                return _make_steps_response(
-                    [
-                        {
-                            "name": "trigger-build",
-                            "urls": [
-                                {"url": "https://bb.example.com/buildrequests/20"}
-                            ],
-                        }
-                    ]
-                )
-            if "buildrequests/20" in url and "property" in url:
-                return _make_buildrequests_response(
-                    [
-                        {
-                            "results": None,  # in-progress
-                            "properties": {
-                                "virtual_builder_name": [
-                                    "proj#checks.x86_64-linux.pine"
-                                ]
-                            },
-                        }
-                    ]
-                )
-            if "buildrequests/20/builds" in url:
-                return _make_builds_response([{"buildid": 99}])
-            if "builds/99/steps" in url:
-                return _make_steps_response(
-                    [
-                        {"name": "checkout", "complete": True, "state_string": "done"},
-                        {
-                            "name": "nix-build",
-                            "complete": False,
-                            "state_string": "running",
-                            "stepid": 555,
-                        },
-                    ]
-                )
-            if "steps/555/logs" in url:
-                return {"logs": [{"logid": 777, "num_lines": 50}]}
-            if "logs/777/contents" in url:
-                return {
-                    "logchunks": [
-                        {
-                            "content": "building '/nix/store/abc123-nixos-system-pine.drv'...\n"
-                        }
-                    ]
-                }
-            return {}
-
-        mock_fetch.side_effect = api_dispatch
-        result = query_buildbot_subbuilds(
-            "https://bb.example.com/#/builders/1/builds/1"
-        )
-        assert len(result) == 1
-        name, symbol, step_info = result[0]
-        assert name == "checks.x86_64-linux.pine"
-        assert symbol == "🔨"
-        assert step_info == "building nixos-system-pine"
-
-    @patch.object(_mod, "_fetch_buildbot_json")
-    def test_failed_subbuild(self, mock_fetch):
-        def api_dispatch(url):
-            if "/builders/1/builds/1/steps" in url:
-                return _make_steps_response(
-                    [
-                        {
-                            "name": "trigger-build",
-                            "urls": [
-                                {"url": "https://bb.example.com/buildrequests/30"}
-                            ],
-                        }
-                    ]
-                )
-            if "buildrequests/30" in url and "property" in url:
-                return _make_buildrequests_response(
-                    [
-                        {
-                            "results": 2,  # failure
-                            "properties": {
-                                "virtual_builder_name": [
-                                    "proj#checks.x86_64-linux.bonsai"
-                                ]
-                            },
-                        }
-                    ]
-                )
-            return {}
-
-        mock_fetch.side_effect = api_dispatch
-        result = query_buildbot_subbuilds(
-            "https://bb.example.com/#/builders/1/builds/1"
-        )
-        assert len(result) == 1
-        assert result[0] == ("checks.x86_64-linux.bonsai", "❌", None)
-
-    @patch.object(_mod, "_fetch_buildbot_json")
-    def test_warning_and_skipped_results(self, mock_fetch):
-        def api_dispatch(url):
-            if "/builders/1/builds/1/steps" in url:
-                return _make_steps_response(
-                    [
-                        {
-                            "name": "trigger-build",
-                            "urls": [
-                                {"url": "https://bb.example.com/buildrequests/40"},
-                                {"url": "https://bb.example.com/buildrequests/41"},
-                            ],
-                        }
-                    ]
-                )
-            if "buildrequests/40" in url and "property" in url:
-                return _make_buildrequests_response(
-                    [
-                        {
-                            "results": 1,  # warnings
-                            "properties": {
-                                "virtual_builder_name": ["proj#checks.warn"]
-                            },
-                        }
-                    ]
-                )
-            if "buildrequests/41" in url and "property" in url:
-                return _make_buildrequests_response(
-                    [
-                        {
-                            "results": 3,  # skipped
-                            "properties": {
-                                "virtual_builder_name": ["proj#checks.skip"]
-                            },
-                        }
-                    ]
-                )
-            return {}
-
-        mock_fetch.side_effect = api_dispatch
-        result = query_buildbot_subbuilds(
-            "https://bb.example.com/#/builders/1/builds/1"
-        )
-        assert len(result) == 2
-        symbols = {r[0]: r[1] for r in result}
-        assert symbols["checks.warn"] == "⏭️"
-        assert symbols["checks.skip"] == "⏭️"
-
-    @patch.object(_mod, "_fetch_buildbot_json")
-    def test_results_sorted_by_name(self, mock_fetch):
-        def api_dispatch(url):
-            if "/builders/1/builds/1/steps" in url:
-                return _make_steps_response(
-                    [
-                        {
-                            "name": "trigger-build",
-                            "urls": [
-                                {"url": "https://bb.example.com/buildrequests/50"},
-                                {"url": "https://bb.example.com/buildrequests/51"},
-                                {"url": "https://bb.example.com/buildrequests/52"},
-                            ],
-                        }
-                    ]
-                )
-            if "buildrequests/50" in url and "property" in url:
-                return _make_buildrequests_response(
-                    [
-                        {
-                            "results": 0,
-                            "properties": {"virtual_builder_name": ["proj#zebra"]},
-                        }
-                    ]
-                )
-            if "buildrequests/51" in url and "property" in url:
-                return _make_buildrequests_response(
-                    [
-                        {
-                            "results": 0,
-                            "properties": {"virtual_builder_name": ["proj#alpha"]},
-                        }
-                    ]
-                )
-            if "buildrequests/52" in url and "property" in url:
-                return _make_buildrequests_response(
-                    [
-                        {
-                            "results": 0,
-                            "properties": {"virtual_builder_name": ["proj#middle"]},
-                        }
-                    ]
-                )
-            return {}
-
-        mock_fetch.side_effect = api_dispatch
-        result = query_buildbot_subbuilds(
-            "https://bb.example.com/#/builders/1/builds/1"
-        )
-        names = [r[0] for r in result]
-        assert names == ["alpha", "middle", "zebra"]
-
-    @patch.object(_mod, "_fetch_buildbot_json")
-    def test_api_error_returns_empty(self, mock_fetch):
-        """Network errors when fetching steps should not crash."""
-        import urllib.error
+        assert query_buildbot_subbuilds(URL) == []
+        mock_triggered.assert_called_once_with("bb.example.com", "1", "1")
+
+    @patch.object(
+        _mod.api,
+        "get_triggered_builds_progress",
+        return_value=([10, 11], False),
+    )
+    def test_two_subbuilds_both_passed(self, mock_triggered):
+        sub_builds = [
+            _sub_build(10, name="checks.x86_64-linux.aspen1"),
+            _sub_build(11, name="checks.x86_64-linux.aspen2"),
+        ]
+        with patch.object(_mod.api, "query_sub_builds", _fake_sub_builds(sub_builds)):
+            result = query_buildbot_subbuilds(URL)
+        assert result == [
+            ("checks.x86_64-linux.aspen1", "✅", None),
+            ("checks.x86_64-linux.aspen2", "✅", None),
+        ]
 
-        mock_fetch.side_effect = urllib.error.URLError("timeout")
-        result = query_buildbot_subbuilds(
-            "https://bb.example.com/#/builders/1/builds/1"
+    @patch.object(_mod.api, "get_triggered_builds_progress", return_value=([20], False))
+    def test_in_progress_build_shows_step_info(self, mock_triggered):
+        running = _sub_build(
+            20,
+            status=None,
+            name="checks.x86_64-linux.pine",
+            build_id=99,
+            active_step=ActiveStep(
+                name="nix-build",
+                state="running",
+                log_tail=["building '/nix/store/abc123-nixos-system-pine.drv'..."],
+            ),
         )
-        assert result == []
+        with patch.object(_mod.api, "query_sub_builds", _fake_sub_builds([running])):
+            result = query_buildbot_subbuilds(URL)
+        assert result == [
+            ("checks.x86_64-linux.pine", "🔨", "building nixos-system-pine")
+        ]
 
-    @patch.object(_mod, "_fetch_buildbot_json")
-    def test_queued_build_request(self, mock_fetch):
-        """Build request with no builds yet shows 'queued'."""
+    @patch.object(_mod.api, "get_triggered_builds_progress", return_value=([1], False))
+    def test_active_steps_are_requested(self, mock_triggered):
+        with patch.object(
+            _mod.api, "query_sub_builds", return_value=[]
+        ) as get_sub_builds:
+            query_buildbot_subbuilds(URL)
+        get_sub_builds.assert_called_once_with(
+            ANY, "bb.example.com", [1], with_active_steps=True, tracker=None
+        )
 
-        def api_dispatch(url):
-            if "/builders/1/builds/1/steps" in url:
-                return _make_steps_response(
-                    [
-                        {
-                            "name": "trigger-build",
-                            "urls": [
-                                {"url": "https://bb.example.com/buildrequests/60"}
-                            ],
-                        }
-                    ]
-                )
-            if "buildrequests/60" in url and "property" in url:
-                return _make_buildrequests_response(
-                    [
-                        {
-                            "results": None,
-                            "properties": {
-                                "virtual_builder_name": ["proj#checks.queued-thing"]
-                            },
-                        }
-                    ]
-                )
-            if "buildrequests/60/builds" in url:
-                return _make_builds_response([])  # no builds yet
-            return {}
-
-        mock_fetch.side_effect = api_dispatch
-        result = query_buildbot_subbuilds(
-            "https://bb.example.com/#/builders/1/builds/1"
-        )
-        assert len(result) == 1
-        assert result[0] == ("checks.queued-thing", "🔨", "queued")
+    @patch.object(
+        _mod.api,
+        "get_triggered_builds_progress",
+        return_value=([30, 40, 41], False),
+    )
+    def test_failed_warning_and_skipped_results(self, mock_triggered):
+        sub_builds = [
+            _sub_build(30, BuildStatus.FAILURE, "checks.bonsai"),
+            _sub_build(40, BuildStatus.WARNINGS, "checks.warn"),
+            _sub_build(41, BuildStatus.SKIPPED, "checks.skip"),
+        ]
+        with patch.object(_mod.api, "query_sub_builds", _fake_sub_builds(sub_builds)):
+            result = query_buildbot_subbuilds(URL)
+        assert {name: symbol for name, symbol, _ in result} == {
+            "checks.bonsai": "❌",
+            "checks.warn": "⏭️",
+            "checks.skip": "⏭️",
+        }
+
+    @patch.object(
+        _mod.api,
+        "get_triggered_builds_progress",
+        return_value=([50, 51, 52], False),
+    )
+    def test_results_sorted_by_name(self, mock_triggered):
+        sub_builds = [
+            _sub_build(50, name="zebra"),
+            _sub_build(51, name="alpha"),
+            _sub_build(52, name="middle"),
+        ]
+        with patch.object(_mod.api, "query_sub_builds", _fake_sub_builds(sub_builds)):
+            result = query_buildbot_subbuilds(URL)
+        assert [r[0] for r in result] == ["alpha", "middle", "zebra"]
+
+    @patch.object(
+        _mod.api,
+        "get_triggered_builds_progress",
+        side_effect=BuildbotAPIError("timeout"),
+    )
+    def test_api_error_returns_empty(self, mock_triggered):
+        """Network errors when fetching steps should not crash."""
+        assert query_buildbot_subbuilds(URL) == []
+
+    @patch.object(_mod.api, "get_triggered_builds_progress", return_value=([60], False))
+    def test_queued_build_request(self, mock_triggered):
+        """Build request with no builds yet shows 'queued'."""
+        queued = _sub_build(60, status=None, name="checks.queued-thing")
+        with patch.object(_mod.api, "query_sub_builds", _fake_sub_builds([queued])):
+            result = query_buildbot_subbuilds(URL)
+        assert result == [("checks.queued-thing", "🔨", "queued")]
 
 
 # ---------------------------------------------------------------------------
-# _check_one_build_request
+# _subbuild_line
 # ---------------------------------------------------------------------------
 
 
-class TestCheckOneBuildRequest:
-    @patch.object(_mod, "_fetch_buildbot_json")
-    def test_name_from_virtual_builder_name(self, mock_fetch):
-        mock_fetch.return_value = _make_buildrequests_response(
-            [
-                {
-                    "results": 0,
-                    "properties": {
-                        "virtual_builder_name": ["onix-core#checks.x86_64-linux.aspen1"]
-                    },
-                }
-            ]
-        )
-        name, symbol, step = _check_one_build_request("bb.example.com", 1)
-        assert name == "checks.x86_64-linux.aspen1"
-        assert symbol == "✅"
-        assert step is None
-
-    @patch.object(_mod, "_fetch_buildbot_json")
-    def test_name_fallback_to_request_id(self, mock_fetch):
-        mock_fetch.return_value = _make_buildrequests_response(
-            [{"results": 0, "properties": {}}]
-        )
-        name, _, _ = _check_one_build_request("bb.example.com", 42)
-        assert name == "request-42"
-
-    @patch.object(_mod, "_fetch_buildbot_json")
-    def test_virtual_builder_name_without_hash(self, mock_fetch):
-        mock_fetch.return_value = _make_buildrequests_response(
-            [
-                {
-                    "results": 0,
-                    "properties": {"virtual_builder_name": ["simple-name"]},
-                }
-            ]
+class TestSubbuildLine:
+    def test_passed(self):
+        assert _subbuild_line(_sub_build(1, name="checks.a")) == (
+            "checks.a",
+            "✅",
+            None,
         )
-        name, _, _ = _check_one_build_request("bb.example.com", 1)
-        assert name == "simple-name"
 
-    @patch.object(_mod, "_fetch_buildbot_json")
-    def test_api_failure_returns_none(self, mock_fetch):
-        import urllib.error
+    def test_cancelled_counts_as_failed(self):
+        sub_build = _sub_build(1, BuildStatus.CANCELLED, "checks.a")
+        assert _subbuild_line(sub_build)[1] == "❌"
+
+    def test_running_step_without_log_shows_state(self):
+        sub_build = _sub_build(
+            1,
+            status=None,
+            build_id=10,
+            active_step=ActiveStep(name="build", state="running"),
+        )
+        assert _subbuild_line(sub_build)[2] == "running"
+
+    def test_running_step_without_state_shows_name(self):
+        sub_build = _sub_build(
+            1,
+            status=None,
+            build_id=10,
+            active_step=ActiveStep(name="checkout", state=""),
+        )
+        assert _subbuild_line(sub_build)[2] == "checkout"
 
-        mock_fetch.side_effect = urllib.error.URLError("refused")
-        assert _check_one_build_request("bb.example.com", 1) is None
+    def test_started_build_without_active_step(self):
+        sub_build = _sub_build(1, status=None, build_id=10)
+        assert _subbuild_line(sub_build)[1:] == ("🔨", None)
 
 
 # ---------------------------------------------------------------------------
-# _get_active_step
+# SubBuildState
 # ---------------------------------------------------------------------------
 
 
-class TestGetActiveStep:
-    @patch.object(_mod, "_fetch_buildbot_json")
-    def test_no_builds_returns_queued(self, mock_fetch):
-        mock_fetch.return_value = _make_builds_response([])
-        assert _get_active_step("bb.example.com", 1) == "queued"
-
-    @patch.object(_mod, "_fetch_buildbot_json")
-    def test_running_step_returns_state_string(self, mock_fetch):
-        def api_dispatch(url):
-            if "/buildrequests/" in url:
-                return _make_builds_response([{"buildid": 10}])
-            if "/builds/10/steps" in url:
-                return _make_steps_response(
-                    [
-                        {"name": "checkout", "complete": True},
-                        {
-                            "name": "build",
-                            "complete": False,
-                            "state_string": "running",
-                            "stepid": 99,
-                        },
-                    ]
-                )
-            if "/steps/99/logs" in url:
-                return {"logs": []}
-            return {}
-
-        mock_fetch.side_effect = api_dispatch
-        result = _get_active_step("bb.example.com", 1)
-        # No log data, so falls back to the state_string
-        assert result == "running"
-
-    @patch.object(_mod, "_fetch_buildbot_json")
-    def test_all_steps_complete_returns_none(self, mock_fetch):
-        def api_dispatch(url):
-            if "/buildrequests/" in url:
-                return _make_builds_response([{"buildid": 10}])
-            return _make_steps_response([{"name": "done", "complete": True}])
-
-        mock_fetch.side_effect = api_dispatch
-        assert _get_active_step("bb.example.com", 1) is None
+class TestSubBuildState:
+    @patch.object(
+        _mod.api,
+        "get_triggered_builds_progress",
+        return_value=([10, 11, 12], False),
+    )
+    def test_only_incomplete_requests_are_queried_again(self, mock_triggered):
+        state = SubBuildState()
+        sub_builds = [
+            _sub_build(10),
+            _sub_build(11, status=None, build_id=5),
+            _sub_build(12, BuildStatus.FAILURE),
+        ]
+        with patch.object(_mod.api, "query_sub_builds", _fake_sub_builds(sub_builds)):
+            first = query_buildbot_subbuilds(URL, state=state)
+
+        sub_builds[1] = _sub_build(11)
+        with patch.object(
+            _mod.api,
+            "query_sub_builds",
+            side_effect=_fake_sub_builds(sub_builds),
+        ) as get_sub_builds:
+            second = query_buildbot_subbuilds(URL, state=state)
+        get_sub_builds.assert_called_once_with(
+            ANY,
+            "bb.example.com",
+            [11],
+            with_active_steps=True,
+            tracker=state.active_steps,
+        )
+        assert [symbol for _, symbol, _ in first] == ["✅", "🔨", "❌"]
+        assert [symbol for _, symbol, _ in second] == ["✅", "✅", "❌"]
+
+        # Everything finished, nothing is queried anymore
+        with patch.object(_mod.api, "query_sub_builds") as get_sub_builds:
+            assert query_buildbot_subbuilds(URL, state=state) == second
+        get_sub_builds.assert_not_called()
+        # The trigger step is still running, so the parent is re-read each time
+        assert mock_triggered.call_count == 3
+
+    def test_parent_steps_are_not_read_after_triggering(self):
+        state = SubBuildState()
+        with (
+            patch.object(
+                _mod.api,
+                "get_triggered_builds_progress",
+                return_value=([10], True),
+            ) as mock_triggered,
+            patch.object(
+                _mod.api,
+                "query_sub_builds",
+                _fake_sub_builds([_sub_build(10, status=None)]),
+            ),
+        ):
+            query_buildbot_subbuilds(URL, state=state)
+            query_buildbot_subbuilds(URL, state=state)
+        mock_triggered.assert_called_once_with("bb.example.com", "1", "1")
+
+    def test_failed_parent_lookup_is_not_stored(self):
+        state = SubBuildState()
+        with patch.object(
+            _mod.api,
+            "get_triggered_builds_progress",
+            side_effect=BuildbotAPIError("timeout"),
+        ):
+            assert query_buildbot_subbuilds(URL, state=state) == []
+        assert state.request_ids("bb.example.com", "1", "1") is None
+
+    def test_log_status_parses_only_new_lines(self):
+        state = SubBuildState()
+        step = ActiveStep(
+            name="Build flake attr",
+            state="building",
+            log_tail=["building '/nix/store/abc-hello.drv'...", "compiling"],
+            new_lines=["building '/nix/store/abc-hello.drv'...", "compiling"],
+        )
+        assert state.log_status("bb", 1, step) == "building hello"
+
+        # Nothing new to parse, the last status still holds
+        step.new_lines = ["compiling more"]
+        assert state.log_status("bb", 1, step) == "building hello"
+        step.new_lines = ["copying path '/nix/store/abc-world' to 'ssh://x'"]
+        assert state.log_status("bb", 1, step) == "copying world"
+
+        # A status of an earlier step doesn't carry over
+        later = ActiveStep(name="Upload", state="uploading")
+        assert state.log_status("bb", 1, later) is None
 
 
 # ---------------------------------------------------------------------------
-# _get_step_log_tail
+# SubBuildFetcher
 # ---------------------------------------------------------------------------
 
+URL2 = "https://bb.example.com/#/builders/2/builds/1"
+BUILDBOT_URL = "https://buildbot.example.com/#/builders/1/builds/1"
+
+
+class TestSubBuildFetcher:
+    def test_checks_are_queried_concurrently_through_one_scheduler(self):
+        barrier = asyncio.Barrier(2)
+        schedulers = []
+
+        async def query(scheduler, details_url, watchers, state):
+            schedulers.append(scheduler)
+            # The queries of the first poll only return once both are running
+            if len(schedulers) <= 2:
+                await asyncio.wait_for(barrier.wait(), 5)
+            return [(details_url, "✅", None)]
+
+        fetcher = SubBuildFetcher()
+        try:
+            with patch.object(_mod, "query_subbuilds", query):
+                result = fetcher.fetch([URL, URL2, URL])
+                fetcher.fetch([URL])
+        finally:
+            fetcher.close()
+        assert result == {
+            URL: ([(URL, "✅", None)], False),
+            URL2: ([(URL2, "✅", None)], False),
+        }
+        # The per-host limit holds across checks and polls
+        assert len(schedulers) == 3
+        assert len(set(schedulers)) == 1
+
+    def test_slow_query_shows_last_result_as_stale(self, capsys):
+        release = threading.Event()
+        calls = []
+
+        async def query(scheduler, details_url, watchers, state):
+            calls.append(details_url)
+            if len(calls) > 1:
+                await asyncio.to_thread(release.wait, 5)
+            return [(f"checks.a{len(calls)}", "🔨", None)]
+
+        details = [("buildbot/nix-build", "🔨", BUILDBOT_URL)]
+        fetcher = SubBuildFetcher(deadline=0.05)
+        try:
+            with patch.object(_mod, "query_subbuilds", query):
+                _print_check_details(details, fetcher)
+                # The second query misses the deadline
+                assert _print_check_details(details, fetcher) == 1
+                stale = capsys.readouterr().out.splitlines()[2:]
+                # Its result is picked up by the next poll, without a new query
+                release.set()
+                fetcher.deadline = 5
+                assert fetcher.fetch([BUILDBOT_URL]) == {
+                    BUILDBOT_URL: ([("checks.a2", "🔨", None)], False)
+                }
+        finally:
+            fetcher.close()
+        assert calls == [BUILDBOT_URL, BUILDBOT_URL]
+        assert "(stale)" in stale[0]
+        assert stale[1] == "    🔨 checks.a1"
+
+    def test_failed_query_keeps_last_result_as_stale(self, capsys):
+        calls = []
+        error = BuildbotAPIError("connection reset")
+
+        async def query(scheduler, details_url, watchers, state):
+            calls.append(details_url)
+            if len(calls) > 1:
+                raise error
+            return [("checks.a", "🔨", None)]
+
+        details = [("buildbot/nix-build", "🔨", BUILDBOT_URL)]
+        fetcher = SubBuildFetcher()
+        try:
+            with patch.object(_mod, "query_subbuilds", query):
+                _print_check_details(details, fetcher)
+                capsys.readouterr()
+                # The sub-build line and the warning
+                assert _print_check_details(details, fetcher) == 2
+        finally:
+            fetcher.close()
+        check, sub_build, warning = capsys.readouterr().out.splitlines()
+        assert "(stale)" in check
+        assert sub_build == "    🔨 checks.a"
+        assert "connection reset" in warning
+
+    def test_without_fetcher_checks_are_queried_in_turn(self, capsys):
+        details = [
+            ("buildbot/nix-build", "✅", BUILDBOT_URL),
+            ("buildbot/nix-eval", "✅", BUILDBOT_URL),
+            ("lint", "✅", None),
+        ]
+        with patch.object(
+            _mod, "query_buildbot_subbuilds", return_value=[("checks.a", "✅", None)]
+        ) as query:
+            assert _print_check_details(details) == 2
+        query.assert_called_once_with(BUILDBOT_URL)
+        assert "(stale)" not in capsys.readouterr().out
 
-class TestGetStepLogTail:
-    @patch.object(_mod, "_fetch_buildbot_json")
-    def test_returns_parsed_nix_line(self, mock_fetch):
-        def api_dispatch(url):
-            if "/logs" in url and "contents" not in url:
-                return {"logs": [{"logid": 1, "num_lines": 100}]}
-            return {
-                "logchunks": [{"content": "building '/nix/store/abc-hello.drv'...\n"}]
-            }
-
-        mock_fetch.side_effect = api_dispatch
-        assert _get_step_log_tail("bb.example.com", 1) == "building hello"
 
-    @patch.object(_mod, "_fetch_buildbot_json")
-    def test_no_logs_returns_none(self, mock_fetch):
-        mock_fetch.return_value = {"logs": []}
-        assert _get_step_log_tail("bb.example.com", 1) is None
+# ---------------------------------------------------------------------------
+# BuildbotEventWatcher
+# ---------------------------------------------------------------------------
 
-    @patch.object(_mod, "_fetch_buildbot_json")
-    def test_zero_lines_returns_none(self, mock_fetch):
-        mock_fetch.return_value = {"logs": [{"logid": 1, "num_lines": 0}]}
-        assert _get_step_log_tail("bb.example.com", 1) is None
 
-    @patch.object(_mod, "_fetch_buildbot_json")
-    def test_api_error_returns_none(self, mock_fetch):
-        import urllib.error
+class _FakeEventStream:
+    def __init__(self):
+        self.paths = []
+
+    async def subscribe(self, path):
+        self.paths.append(path)
+
+
+class TestBuildbotEventWatcher:
+    def _active_watcher(self, stream=None):
+        watcher = BuildbotEventWatcher("bb.example.com")
+        watcher.active = True
+        watcher._stream = stream
+        return watcher
+
+    def test_cached_result_until_event(self):
+        watcher = self._active_watcher()
+        watcher.store_result(10, ("checks.a", "✅", None))
+        assert watcher.cached_result(10) == ("checks.a", "✅", None)
+
+        watcher.handle_event(("buildrequests", "10", "complete"), {})
+        assert watcher.cached_result(10) is None
+        # The change is consumed by the caller that re-queries the request
+        assert watcher.cached_result(10) == ("checks.a", "✅", None)
+
+    def test_claims_of_tracked_requests_only(self):
+        watcher = self._active_watcher()
+        watcher.store_result(10, ("checks.a", "🔨", "queued"))
+        watcher.handle_event(("buildrequests", "99", "claimed"), {})
+        watcher.handle_event(("builds", "77", "new"), {"buildrequestid": 10})
+        assert watcher.cached_result(10) == ("checks.a", "🔨", "queued")
+
+        watcher.handle_event(("buildrequests", "10", "claimed"), {})
+        assert watcher.cached_result(10) is None
+
+    def test_inactive_watcher_caches_nothing(self):
+        watcher = BuildbotEventWatcher("bb.example.com")
+        watcher.store_result(10, ("checks.a", "✅", None))
+        assert watcher.cached_result(10) is None
+
+    @patch.object(_mod.api, "get_build_id", return_value=500)
+    @patch.object(
+        _mod.api,
+        "get_triggered_builds_progress",
+        return_value=([10, 11, 12], False),
+    )
+    def test_query_skips_unchanged_subbuilds(self, mock_triggered, mock_build_id):
+        stream = _FakeEventStream()
+        watcher = self._active_watcher(stream)
+        watchers = {"bb.example.com": watcher}
+        sub_builds = [
+            _sub_build(10),
+            _sub_build(11, status=None, build_id=None),
+            _sub_build(12, BuildStatus.FAILURE),
+        ]
+        with patch.object(_mod.api, "query_sub_builds", _fake_sub_builds(sub_builds)):
+            first = query_buildbot_subbuilds(URL, watchers)
+        assert [symbol for _, symbol, _ in first] == ["✅", "🔨", "❌"]
+        # Only the parent build is followed, not the whole master
+        asyncio.run(watcher._subscribe_parent(500))
+        assert stream.paths == ["builds/500/*", "builds/500/steps/*/*"]
+
+        with patch.object(_mod.api, "query_sub_builds") as get_sub_builds:
+            assert query_buildbot_subbuilds(URL, watchers) == first
+        # Nothing is queried again until Buildbot reports a change
+        get_sub_builds.assert_not_called()
+        assert mock_triggered.call_count == 1
+
+        sub_builds[1] = _sub_build(11)
+        watchers["bb.example.com"].handle_event(("buildrequests", "11", "complete"), {})
+        with patch.object(
+            _mod.api,
+            "query_sub_builds",
+            side_effect=_fake_sub_builds(sub_builds),
+        ) as get_sub_builds:
+            second = query_buildbot_subbuilds(URL, watchers)
+        assert [symbol for _, symbol, _ in second] == ["✅", "✅", "❌"]
+        # Only the changed request is queried
+        get_sub_builds.assert_called_once_with(
+            ANY, "bb.example.com", [11], with_active_steps=True, tracker=None
+        )
 
-        mock_fetch.side_effect = urllib.error.URLError("timeout")
-        assert _get_step_log_tail("bb.example.com", 1) is None
+        # A parent build event re-reads the triggered requests
+        watchers["bb.example.com"].handle_event(("builds", "500", "finished"), {})
+        with patch.object(_mod.api, "query_sub_builds", _fake_sub_builds(sub_builds)):
+            query_buildbot_subbuilds(URL, watchers)
+        assert mock_triggered.call_count == 2
 
 
 # ---------------------------------------------------------------------------
@@ -867,10 +897,25 @@ class TestGetStepLogTail:
 # ---------------------------------------------------------------------------
 
 
+def _failed_pr(details_url="https://buildbot.example.com/#/builders/1/builds/2"):
+    return {
+        "url": "https://github.com/org/repo/pull/1",
+        "statusCheckRollup": [
+            {
+                "__typename": "CheckRun",
+                "name": "buildbot/nix-build",
+                "status": "COMPLETED",
+                "conclusion": "FAILURE",
+                "detailsUrl": details_url,
+            }
+        ],
+    }
+
+
 class TestRunBuildbotCheckIfNeeded:
     def test_skips_if_already_done(self):
         result = run_buildbot_check_if_needed(
-            {"url": "https://github.com/org/repo/pull/1"},
+            _failed_pr(),
             failed=1,
             pending=0,
             buildbot_check_done=True,
@@ -879,7 +924,7 @@ class TestRunBuildbotCheckIfNeeded:
 
     def test_skips_if_pending_remains(self):
         result = run_buildbot_check_if_needed(
-            {"url": "https://github.com/org/repo/pull/1"},
+            _failed_pr(),
             failed=1,
             pending=1,
             buildbot_check_done=False,
@@ -888,22 +933,193 @@ class TestRunBuildbotCheckIfNeeded:
 
     def test_skips_if_no_failures(self):
         result = run_buildbot_check_if_needed(
-            {"url": "https://github.com/org/repo/pull/1"},
+            _failed_pr(),
             failed=0,
             pending=0,
             buildbot_check_done=False,
         )
         assert result is False
 
-    @patch("shutil.which", return_value=None)
-    def test_no_buildbot_pr_check_binary(self, mock_which):
-        """If buildbot-pr-check is not in PATH, still returns True (marks done)."""
+    @patch.object(_mod.api, "check_builds")
+    def test_no_buildbot_checks(self, mock_check_builds):
+        """Failures outside Buildbot still mark the check as done."""
         result = run_buildbot_check_if_needed(
-            {"url": "https://github.com/org/repo/pull/1"},
+            _failed_pr("https://ci.example.com/run/1"),
             failed=1,
             pending=0,
             buildbot_check_done=False,
         )
-        # The function runs the check block (failed > 0, pending == 0, not done)
-        # but shutil.which returns None so it doesn't actually run the command
         assert result is True
+        mock_check_builds.assert_not_called()
+
+    def test_prints_failed_builds_with_logs(self, capsys):
+        log = buildbot_pr_check.buildbot_api.LogUrl(
+            step_name="Build flake attr",
+            log_name="stdio",
+            url="https://buildbot.example.com/api/v2/logs/7/raw_inline",
+        )
+        result = BuildResult(
+            url="https://buildbot.example.com/#/builders/1/builds/2",
+            parent_status=BuildStatus.FAILURE,
+            sub_builds=[
+                _sub_build(1, BuildStatus.FAILURE, "checks.broken", log_urls=[log]),
+                _sub_build(2, name="checks.fine"),
+            ],
+            failed=True,
+        )
+        with patch.object(
+            _mod.api, "check_builds", return_value=[result]
+        ) as mock_check_builds:
+            done = run_buildbot_check_if_needed(
+                _failed_pr(), failed=1, pending=0, buildbot_check_done=False
+            )
+        assert done is True
+        mock_check_builds.assert_called_once_with(
+            ["https://buildbot.example.com/#/builders/1/builds/2"]
+        )
+        output = capsys.readouterr().out
+        assert "❌ checks.broken (FAILURE)" in output
+        assert (
+            "Build flake attr/stdio: https://buildbot.example.com/api/v2/logs/7"
+            in output
+        )
+        assert "checks.fine" not in output
+
+
+# ---------------------------------------------------------------------------
+# create_github_status_poller
+# ---------------------------------------------------------------------------
+
+
+class TestCreateGithubStatusPoller:
+    @patch.object(_mod, "run")
+    def test_resolves_branch_once_through_gh(self, mock_run):
+        mock_run.return_value = subprocess.CompletedProcess(
+            [], 0, stdout='{"url": "https://github.com/org/repo/pull/7"}\n'
+        )
+        poller = create_github_status_poller("my-branch")
+        assert (poller.owner, poller.repo, poller.pr_num) == ("org", "repo", "7")
+        mock_run.assert_called_once_with(
+            ["gh", "pr", "view", "my-branch", "--json", "url"],
+            check=False,
+            capture=True,
+        )
+
+    @patch.object(_mod, "run")
+    def test_unknown_pr_falls_back_to_gh(self, mock_run):
+        mock_run.return_value = subprocess.CompletedProcess([], 1, stdout="")
+        assert create_github_status_poller("my-branch") is None
+
+    @patch.object(_mod, "run")
+    def test_non_github_url(self, mock_run):
+        mock_run.return_value = subprocess.CompletedProcess(
+            [], 0, stdout='{"url": "https://example.com/pr/7"}'
+        )
+        assert create_github_status_poller("my-branch") is None
+
+
+# ---------------------------------------------------------------------------
+# PollScheduler
+# ---------------------------------------------------------------------------
+
+
+class TestPollScheduler:
+    def _scheduler(self, clock, durations=None):
+        with patch.object(_mod.time, "monotonic", lambda: clock[0]):
+            return PollScheduler(10, durations)
+
+    def _poll(self, scheduler, clock, checks, changed):
+        with (
+            patch.object(_mod.time, "monotonic", lambda: clock[0]),
+            patch.object(_mod.random, "uniform", lambda low, high: 1.0),
+        ):
+            scheduler.observe(checks, changed)
+            return scheduler.next_delay()
+
+    def test_backs_off_while_nothing_changes(self):
+        clock = [0.0]
+        scheduler = self._scheduler(clock)
+        delays = [self._poll(scheduler, clock, {}, changed=False) for _ in range(8)]
+        assert delays[:3] == [7.5, 11.25, 16.875]
+        assert delays[-1] == _mod.POLL_MAX_INTERVAL
+        assert self._poll(scheduler, clock, {}, changed=True) == 5.0
+
+    def test_jitter_spreads_intervals(self):
+        scheduler = PollScheduler(10)
+        delays = {scheduler.next_delay() for _ in range(20)}
+        assert len(delays) > 1
+        assert all(4.0 <= delay <= 6.0 for delay in delays)
+
+    def test_polls_at_the_eta_from_earlier_durations(self):
+        clock = [0.0]
+        scheduler = self._scheduler(clock, {"nix-build": 100.0})
+        self._poll(scheduler, clock, {"nix-build": QUEUED, "lint": FINISHED}, True)
+        assert scheduler.eta == 100.0
+
+        clock[0] = 50.0
+        for _ in range(2):
+            self._poll(scheduler, clock, {"nix-build": RUNNING}, changed=False)
+        clock[0] = 90.0
+        # The backed off interval (16.875s) would overshoot the ETA
+        assert self._poll(scheduler, clock, {"nix-build": RUNNING}, False) == 10.0
+        assert scheduler.interval == _mod.POLL_MIN_INTERVAL
+
+    def test_unknown_check_has_no_eta(self):
+        clock = [0.0]
+        scheduler = self._scheduler(clock, {"nix-build": 100.0})
+        self._poll(scheduler, clock, {"nix-build": QUEUED, "new": QUEUED}, True)
+        assert scheduler.eta is None
+
+    def test_learns_check_durations(self):
+        clock = [0.0]
+        scheduler = self._scheduler(clock, {"lint": 100.0})
+        self._poll(scheduler, clock, {"nix-build": QUEUED, "lint": QUEUED}, True)
+        clock[0] = 40.0
+        self._poll(scheduler, clock, {"nix-build": FINISHED, "lint": FINISHED}, True)
+        assert scheduler.durations == {"nix-build": 40.0, "lint": 70.0}
+
+    def test_checks_running_at_the_start_are_not_timed(self):
+        clock = [0.0]
+        scheduler = self._scheduler(clock)
+        self._poll(scheduler, clock, {"nix-build": RUNNING}, True)
+        clock[0] = 10.0
+        # Started since the last poll
+        self._poll(scheduler, clock, {"nix-build": RUNNING, "lint": RUNNING}, True)
+        clock[0] = 40.0
+        self._poll(scheduler, clock, {"nix-build": FINISHED, "lint": FINISHED}, True)
+        assert scheduler.durations == {"lint": 30.0}
+
+    def test_reports_saved_polls(self, capsys):
+        clock = [0.0]
+        scheduler = self._scheduler(clock)
+        for now in (0.0, 5.0, 60.0):
+            clock[0] = now
+            self._poll(scheduler, clock, {}, changed=False)
+        clock[0] = 120.0
+        with patch.object(_mod.time, "monotonic", lambda: clock[0]):
+            assert scheduler.saved == 10
+            scheduler.report()
+        assert "Polled 3 times, 10 fewer than every 10s" in capsys.readouterr().out
+
+    def test_reports_extra_polls(self, capsys):
+        clock = [0.0]
+        scheduler = self._scheduler(clock)
+        for now in (0.0, 5.0, 10.0, 15.0):
+            clock[0] = now
+            self._poll(scheduler, clock, {}, changed=True)
+        with patch.object(_mod.time, "monotonic", lambda: clock[0]):
+            assert scheduler.saved == -2
+            scheduler.report()
+        assert "Polled 4 times, 2 more than every 10s" in capsys.readouterr().out
+
+    def test_durations_are_kept_across_sessions(self, monkeypatch, tmp_path):
+        monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+        assert _mod.load_check_durations("org/repo") == {}
+        _mod.save_check_durations("org/repo", {"nix-build": 42.0})
+        _mod.save_check_durations("org/other", {"nix-build": 7.0})
+        # Checks of the same name in other repos take their own time
+        assert _mod.load_check_durations("org/repo") == {"nix-build": 42.0}
+        assert _mod.load_check_durations("org/other") == {"nix-build": 7.0}
+
+        (tmp_path / "merge-when-green" / "check-durations.json").write_text("[")
+        assert _mod.load_check_durations("org/repo") == {}